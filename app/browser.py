@@ -0,0 +1,236 @@
+# browser.py
+import atexit
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import span
+
+# Selenium is imported on first use so it does not slow down every cold start
+if TYPE_CHECKING:
+    from selenium import webdriver
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_MAX_PAGES_PER_DRIVER = int(os.getenv("BROWSER_MAX_PAGES_PER_DRIVER", "25"))
+BROWSER_PREWARM = int(os.getenv("BROWSER_PREWARM", "0"))
+BROWSER_WAIT_SECONDS = float(os.getenv("BROWSER_WAIT_SECONDS", "10"))
+# How long a domain that needed the browser skips the plain requests attempt
+BROWSER_FIRST_TTL_SECONDS = float(os.getenv("BROWSER_FIRST_TTL_SECONDS", str(6 * 3600)))
+
+# Resources the browser never needs to render rate tables
+BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3',
+]
+
+def create_driver() -> "webdriver.Chrome":
+    """
+    Starts a headless Chrome that does not load images, fonts or media and returns
+    control once the DOM is ready instead of waiting for every subresource.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    chrome_options = Options()
+    chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+    chrome_options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    chrome_options.page_load_strategy = 'eager'
+
+    driver = webdriver.Chrome(service=Service(), options=chrome_options)
+    try:
+        driver.set_page_load_timeout(BROWSER_WAIT_SECONDS * 3)
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+    except Exception:
+        driver.quit()
+        raise
+    return driver
+
+class BrowserPool:
+    """
+    A pool of reusable headless browsers.
+
+    At most `size` drivers exist at once. Each driver is recycled after serving
+    `max_pages_per_driver` pages, and a driver is always quit if it raises anything
+    other than a wait timeout, so drivers are never leaked.
+    """
+
+    def __init__(
+        self,
+        size: int = BROWSER_POOL_SIZE,
+        max_pages_per_driver: int = BROWSER_MAX_PAGES_PER_DRIVER,
+        driver_factory: Callable[[], "webdriver.Chrome"] = create_driver
+    ):
+        self.size = size
+        self.max_pages_per_driver = max_pages_per_driver
+        self.driver_factory = driver_factory
+        self._idle: "queue.LifoQueue[Tuple[webdriver.Chrome, int]]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._drivers: List["webdriver.Chrome"] = []
+        self._closed = False
+        self.drivers_started = 0
+        self.pages_served = 0
+
+    def _start_driver(self) -> "webdriver.Chrome":
+        driver = self.driver_factory()
+        with self._lock:
+            self._drivers.append(driver)
+            self.drivers_started += 1
+        return driver
+
+    def _quit_driver(self, driver: "webdriver.Chrome") -> None:
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Failed to quit browser: {e}")
+
+    def prewarm(self, count: Optional[int] = None) -> None:
+        """
+        Starts up to `count` idle drivers (default: the pool size) ahead of first use.
+        """
+        for _ in range(min(count or self.size, self.size)):
+            if not self._slots.acquire(blocking=False):
+                return
+            try:
+                self._idle.put((self._start_driver(), 0))
+            except Exception as e:
+                print(f"Failed to prewarm browser: {e}")
+            finally:
+                self._slots.release()
+
+    @contextmanager
+    def driver(self) -> Iterator["webdriver.Chrome"]:
+        """
+        Checks a driver out of the pool, starting one if none are idle.
+        """
+        from selenium.common.exceptions import TimeoutException
+
+        if self._closed:
+            raise RuntimeError("Browser pool is shut down")
+
+        self._slots.acquire()
+        driver = None
+        pages = 0
+        keep = False
+        try:
+            try:
+                driver, pages = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self._start_driver()
+            yield driver
+            keep = True
+        except TimeoutException:
+            # The page never produced what we waited for; the driver itself is fine
+            keep = True
+            raise
+        finally:
+            if driver is not None:
+                pages += 1
+                with self._lock:
+                    self.pages_served += 1
+                if keep and not self._closed and pages < self.max_pages_per_driver:
+                    try:
+                        driver.delete_all_cookies()
+                        self._idle.put((driver, pages))
+                    except Exception:
+                        self._quit_driver(driver)
+                else:
+                    self._quit_driver(driver)
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        """
+        Quits every driver, idle or checked out.
+        """
+        self._closed = True
+        with self._lock:
+            drivers = list(self._drivers)
+        for driver in drivers:
+            self._quit_driver(driver)
+
+_browser_pool: Optional[BrowserPool] = None
+_browser_pool_lock = threading.Lock()
+
+def get_browser_pool() -> BrowserPool:
+    """
+    Returns the process-wide browser pool, reused across warm Lambda invocations.
+    """
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool()
+            atexit.register(_browser_pool.shutdown)
+        return _browser_pool
+
+def prewarm_browser_pool_in_background(count: int = BROWSER_PREWARM) -> None:
+    """
+    Starts `count` browsers on a background thread so the first JS-rendered page does
+    not pay Chrome's startup time.
+    """
+    if count > 0:
+        threading.Thread(target=get_browser_pool().prewarm, args=(count,), daemon=True).start()
+
+def render_page(url: str, wait_seconds: float = BROWSER_WAIT_SECONDS) -> str:
+    """
+    Loads a page in a pooled headless browser and waits for a <table> to appear.
+
+    Args:
+        url (str): The URL to load.
+        wait_seconds (float): How long to wait for a table to appear.
+
+    Returns:
+        str: The rendered page HTML.
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    with span("browser") as browser_span, get_browser_pool().driver() as driver:
+        driver.get(url)
+        WebDriverWait(driver, wait_seconds).until(
+            EC.presence_of_element_located((By.TAG_NAME, 'table'))
+        )
+        html = driver.page_source
+        browser_span.set(bytes=len(html))
+        return html
+
+# Domains whose pages only loaded in the browser, mapped to when that was learned
+_browser_first_domains: Dict[str, float] = {}
+_browser_first_lock = threading.Lock()
+
+def prefers_browser(domain: str) -> bool:
+    """
+    Returns True if pages on this domain recently needed the browser, so the plain
+    requests attempt can be skipped.
+    """
+    with _browser_first_lock:
+        learned_at = _browser_first_domains.get(domain)
+        if learned_at is None:
+            return False
+        if time.monotonic() - learned_at > BROWSER_FIRST_TTL_SECONDS:
+            # Try requests again in case the site changed
+            del _browser_first_domains[domain]
+            return False
+        return True
+
+def remember_browser_needed(domain: str) -> None:
+    """
+    Records that a page on this domain failed with requests but loaded in the browser.
+    """
+    with _browser_first_lock:
+        _browser_first_domains[domain] = time.monotonic()
+
+# Define module exports
+__all__ = ['BrowserPool', 'get_browser_pool', 'prewarm_browser_pool_in_background', 'render_page', 'prefers_browser', 'remember_browser_needed']
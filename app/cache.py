@@ -0,0 +1,423 @@
+# cache.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import quote, unquote
+
+from .models import BankResponse
+
+def normalize_chunk(chunk: str) -> str:
+    """
+    Normalizes chunk text so that cosmetic whitespace changes do not change its cache key.
+
+    Args:
+        chunk (str): The chunk of CSV data.
+
+    Returns:
+        str: The chunk with runs of whitespace collapsed and blank lines removed.
+    """
+    lines = (re.sub(r'\s+', ' ', line).strip() for line in chunk.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+def make_cache_key(chunk: str, model: str, prompt_version: str) -> str:
+    """
+    Builds a content-addressed cache key for an extraction.
+
+    Args:
+        chunk (str): The chunk of CSV data.
+        model (str): The LLM model name.
+        prompt_version (str): The version of the extraction prompt.
+
+    Returns:
+        str: A SHA-256 hex digest of the normalized chunk, model and prompt version.
+    """
+    digest = hashlib.sha256()
+    for part in (model, prompt_version, normalize_chunk(chunk)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class CacheBackend(ABC):
+    """
+    Interface for extraction cache storage. Values are serialized BankResponse JSON.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the value stored under key, or None if it is missing or expired.
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        """
+        Stores value under key, replacing any previous value.
+        """
+
+class LRUCacheBackend(CacheBackend):
+    """
+    In-process LRU cache. Survives across warm Lambda invocations.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Local disk cache stored in a SQLite database, evicting least recently used entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS extraction_cache_accessed_at ON extraction_cache (accessed_at)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM extraction_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM extraction_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE extraction_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now)
+            )
+            self._conn.execute("DELETE FROM extraction_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM extraction_cache WHERE key IN ("
+                " SELECT key FROM extraction_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+class KeyValueStore(ABC):
+    """
+    Minimal DynamoDB/S3-style item store: items are dicts with a string 'key' attribute.
+    """
+
+    @abstractmethod
+    def get_item(self, key: str) -> Optional[Dict]:
+        """
+        Returns the item with the given key, or None if there is none.
+        """
+
+    @abstractmethod
+    def put_item(self, item: Dict) -> None:
+        """
+        Stores an item, replacing the item with the same key.
+        """
+
+    @abstractmethod
+    def delete_item(self, key: str) -> None:
+        """
+        Deletes the item with the given key, if there is one.
+        """
+
+    @abstractmethod
+    def add_to_set(self, key: str, member: str) -> None:
+        """
+        Adds a member to the string set stored under key, atomically, so members added
+        at the same time by different processes are all kept.
+        """
+
+    @abstractmethod
+    def set_members(self, key: str) -> List[str]:
+        """
+        Returns the members of the string set stored under key, sorted.
+        """
+
+class LocalKeyValueStore(KeyValueStore):
+    """
+    In-memory stand-in for DynamoDB or S3, for local development.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, Dict]" = OrderedDict()
+        self._sets: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get_item(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            item = self._items.get(key)
+            return dict(item) if item is not None else None
+
+    def put_item(self, item: Dict) -> None:
+        with self._lock:
+            self._items[item['key']] = dict(item)
+            self._items.move_to_end(item['key'])
+            while self.max_entries and len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def delete_item(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def add_to_set(self, key: str, member: str) -> None:
+        with self._lock:
+            self._sets.setdefault(key, set()).add(member)
+
+    def set_members(self, key: str) -> List[str]:
+        with self._lock:
+            return sorted(self._sets.get(key, ()))
+
+class DynamoDBKeyValueStore(KeyValueStore):
+    """
+    Item store backed by a DynamoDB table with a string partition key named 'key'.
+
+    Enable DynamoDB TTL on the 'expires_at' attribute to have expired entries removed.
+    """
+
+    def __init__(self, table_name: str, region_name: Optional[str] = None):
+        import boto3
+        self._table = boto3.resource('dynamodb', region_name=region_name).Table(table_name)
+
+    def get_item(self, key: str) -> Optional[Dict]:
+        item = self._table.get_item(Key={'key': key}).get('Item')
+        if item is not None and item.get('expires_at') is not None:
+            item['expires_at'] = float(item['expires_at'])
+        return item
+
+    def put_item(self, item: Dict) -> None:
+        item = dict(item)
+        if item.get('expires_at') is not None:
+            item['expires_at'] = int(item['expires_at'])
+        self._table.put_item(Item=item)
+
+    def delete_item(self, key: str) -> None:
+        self._table.delete_item(Key={'key': key})
+
+    def add_to_set(self, key: str, member: str) -> None:
+        # ADD on a string set is applied atomically by DynamoDB
+        self._table.update_item(
+            Key={'key': key},
+            UpdateExpression='ADD #members :member',
+            ExpressionAttributeNames={'#members': 'members'},
+            ExpressionAttributeValues={':member': {member}}
+        )
+
+    def set_members(self, key: str) -> List[str]:
+        item = self._table.get_item(Key={'key': key}, ConsistentRead=True).get('Item')
+        return sorted(item.get('members', ())) if item is not None else []
+
+class S3KeyValueStore(KeyValueStore):
+    """
+    Item store backed by JSON objects in an S3 bucket.
+
+    Use a bucket lifecycle rule on the prefix to expire old entries.
+    """
+
+    def __init__(self, bucket: str, prefix: str = 'extraction-cache/', region_name: Optional[str] = None):
+        import boto3
+        self._client = boto3.client('s3', region_name=region_name)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def get_item(self, key: str) -> Optional[Dict]:
+        try:
+            response = self._client.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except self._client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read())
+
+    def put_item(self, item: Dict) -> None:
+        self._client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + item['key'],
+            Body=json.dumps(item).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+    def delete_item(self, key: str) -> None:
+        self._client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def _set_prefix(self, key: str) -> str:
+        return f"{self.prefix}{key}/members/"
+
+    def add_to_set(self, key: str, member: str) -> None:
+        # S3 cannot update an object in place, so each member is an empty object of its own
+        self._client.put_object(Bucket=self.bucket, Key=self._set_prefix(key) + quote(member, safe=''), Body=b'')
+
+    def set_members(self, key: str) -> List[str]:
+        prefix = self._set_prefix(key)
+        members = []
+        for page in self._client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix):
+            members.extend(unquote(obj['Key'][len(prefix):]) for obj in page.get('Contents', ()))
+        return sorted(members)
+
+class KeyValueCacheBackend(CacheBackend):
+    """
+    Cache backend on top of a KeyValueStore, enforcing TTL on read.
+    """
+
+    def __init__(self, store: KeyValueStore, ttl_seconds: Optional[float] = None):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        item = self.store.get_item(key)
+        if item is None:
+            return None
+        expires_at = item.get('expires_at')
+        if expires_at is not None and expires_at <= time.time():
+            self.store.delete_item(key)
+            return None
+        return item['value']
+
+    def set(self, key: str, value: str) -> None:
+        item = {'key': key, 'value': value}
+        if self.ttl_seconds:
+            item['expires_at'] = time.time() + self.ttl_seconds
+        self.store.put_item(item)
+
+class ExtractionCache:
+    """
+    Caches parsed BankResponse objects keyed on chunk content, model and prompt version.
+    """
+
+    def __init__(self, backend: CacheBackend, model: str, prompt_version: str):
+        self.backend = backend
+        self.model = model
+        self.prompt_version = prompt_version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, chunk: str) -> str:
+        return make_cache_key(chunk, self.model, self.prompt_version)
+
+    def get(self, chunk: str) -> Optional[BankResponse]:
+        try:
+            value = self.backend.get(self.key(chunk))
+            response = BankResponse.model_validate_json(value) if value is not None else None
+        except Exception as e:
+            print(f"Failed to read extraction cache: {e}")
+            response = None
+
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def set(self, chunk: str, response: BankResponse) -> None:
+        try:
+            self.backend.set(self.key(chunk), response.model_dump_json())
+        except Exception as e:
+            print(f"Failed to write extraction cache: {e}")
+
+def create_cache_backend(name: str) -> Optional[CacheBackend]:
+    """
+    Creates a cache backend from its name and the EXTRACTION_CACHE_* environment variables.
+
+    Args:
+        name (str): One of 'memory', 'sqlite', 'dynamodb', 's3', 'local-kv' or 'none'.
+
+    Returns:
+        Optional[CacheBackend]: The backend, or None if caching is disabled.
+    """
+    ttl_seconds = float(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    max_entries = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "1000"))
+
+    if name == "none":
+        return None
+    if name == "memory":
+        return LRUCacheBackend(max_entries=max_entries, ttl_seconds=ttl_seconds)
+    if name == "sqlite":
+        path = os.getenv("EXTRACTION_CACHE_PATH", "/tmp/bank-rate-collector/extraction_cache.sqlite3")
+        return SQLiteCacheBackend(path, max_entries=max_entries, ttl_seconds=ttl_seconds)
+    if name == "dynamodb":
+        return KeyValueCacheBackend(DynamoDBKeyValueStore(os.environ["EXTRACTION_CACHE_TABLE"]), ttl_seconds)
+    if name == "s3":
+        return KeyValueCacheBackend(S3KeyValueStore(os.environ["EXTRACTION_CACHE_BUCKET"]), ttl_seconds)
+    if name == "local-kv":
+        return KeyValueCacheBackend(LocalKeyValueStore(max_entries=max_entries), ttl_seconds)
+    raise ValueError(f"Unknown extraction cache backend: {name}")
+
+_extraction_cache_backend: Optional[CacheBackend] = None
+# (model, prompt version) -> the cache for it; all of them share the one backend
+_extraction_caches: Dict[Tuple[str, str], ExtractionCache] = {}
+_extraction_cache_lock = threading.Lock()
+
+def get_extraction_cache(model: str, prompt_version: str) -> Optional[ExtractionCache]:
+    """
+    Returns the process-wide extraction cache for a model and prompt version, creating
+    it on first use. The caches share one backend; their keys include the model and
+    prompt version, so entries of one are never returned by another.
+
+    Args:
+        model (str): The LLM model name.
+        prompt_version (str): The version of the extraction prompt.
+
+    Returns:
+        Optional[ExtractionCache]: The cache, or None if EXTRACTION_CACHE_BACKEND is 'none'.
+    """
+    global _extraction_cache_backend
+    with _extraction_cache_lock:
+        cache = _extraction_caches.get((model, prompt_version))
+        if cache is None:
+            if _extraction_cache_backend is None:
+                _extraction_cache_backend = create_cache_backend(os.getenv("EXTRACTION_CACHE_BACKEND", "memory"))
+                if _extraction_cache_backend is None:
+                    return None
+            cache = _extraction_caches[(model, prompt_version)] = ExtractionCache(_extraction_cache_backend, model, prompt_version)
+        return cache
+
+# Define module exports
+__all__ = ['ExtractionCache', 'get_extraction_cache']
@@ -0,0 +1,320 @@
+# coalesce.py
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse, urlunparse
+
+from .metrics import span
+
+# Results are reused for this long after their call finishes, to absorb repeats that
+# arrive just after it
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "10"))
+# How long a caller waits for another caller's call before making its own
+COALESCE_WAIT_SECONDS = float(os.getenv("COALESCE_WAIT_SECONDS", "60"))
+# A call holding a lock for longer than this is presumed dead and its lock is taken over
+COALESCE_LOCK_TTL_SECONDS = float(os.getenv("COALESCE_LOCK_TTL_SECONDS", "120"))
+# How often callers waiting on a shared store check whether the call finished
+COALESCE_POLL_SECONDS = float(os.getenv("COALESCE_POLL_SECONDS", "0.05"))
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_url(url: str) -> str:
+    """
+    Returns url with its scheme and host lowercased, without a default port or a fragment,
+    so spellings of the same page coalesce.
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    if parsed.port is not None and parsed.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parsed.port}"
+    return urlunparse((scheme, host, parsed.path or '/', parsed.params, parsed.query, ''))
+
+class FlightStore(ABC):
+    """
+    Interface for the locks and results of single-flight calls. Values are serialized
+    results, so a store shared by several processes can coalesce calls across them.
+    """
+
+    @abstractmethod
+    def acquire(self, key: str, ttl_seconds: float) -> Optional[str]:
+        """
+        Takes the key's lock if no call holds it or its holder's lock expired.
+
+        Returns:
+            Optional[str]: A token to release the lock with, or None if another call holds it.
+        """
+
+    @abstractmethod
+    def release(self, key: str, token: str, value: Optional[str], window_seconds: float) -> None:
+        """
+        Releases the lock, handing value to the callers waiting for it and keeping it for
+        window_seconds. A value of None sends the waiters to make the call themselves.
+        """
+
+    @abstractmethod
+    def result(self, key: str) -> Optional[str]:
+        """
+        Returns the value of the key's last call if it finished within its window.
+        """
+
+    @abstractmethod
+    def wait(self, key: str, timeout: float) -> Optional[str]:
+        """
+        Waits up to timeout seconds for the call holding the key's lock to finish.
+
+        Returns:
+            Optional[str]: Its value, or None if it failed, lost its lock or did not finish in time.
+        """
+
+class _Flight:
+    def __init__(self, token: str, locked_until: float):
+        self.token = token
+        self.locked_until = locked_until
+        self.done = threading.Event()
+        self.value: Optional[str] = None
+        self.expires_at = 0.0
+
+class MemoryFlightStore(FlightStore):
+    """
+    Coalesces the calls of one process, such as the requests of one uvicorn worker or
+    of a warm Lambda instance. Waiters are woken as soon as the call finishes.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, ttl_seconds: float) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and not flight.done.is_set():
+                if flight.locked_until > now:
+                    return None
+                # Its holder is presumed dead; wake its waiters to retry
+                flight.done.set()
+            token = uuid.uuid4().hex
+            self._flights[key] = _Flight(token, now + ttl_seconds)
+            return token
+
+    def release(self, key: str, token: str, value: Optional[str], window_seconds: float) -> None:
+        now = time.time()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or flight.token != token:
+                return
+            flight.value = value
+            flight.expires_at = now + window_seconds
+            flight.done.set()
+            # Waiters hold on to their flight, so finished flights past their window can go
+            for expired in [name for name, other in self._flights.items() if other.done.is_set() and other.expires_at <= now]:
+                del self._flights[expired]
+
+    def result(self, key: str) -> Optional[str]:
+        with self._lock:
+            flight = self._flights.get(key)
+        if flight is None or not flight.done.is_set() or flight.expires_at <= time.time():
+            return None
+        return flight.value
+
+    def wait(self, key: str, timeout: float) -> Optional[str]:
+        with self._lock:
+            flight = self._flights.get(key)
+        if flight is None:
+            return None
+        # Stop waiting when the holder's lock expires, so the call can be taken over
+        if not flight.done.wait(max(0.0, min(timeout, flight.locked_until - time.time()))):
+            return None
+        return flight.value
+
+class SQLiteFlightStore(FlightStore):
+    """
+    Coalesces the calls of all processes sharing a SQLite database, such as the uvicorn
+    workers of one host. Waiters poll the database every COALESCE_POLL_SECONDS.
+    """
+
+    def __init__(self, path: str, poll_seconds: float = COALESCE_POLL_SECONDS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.poll_seconds = poll_seconds
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS flights ("
+                " key TEXT PRIMARY KEY, token TEXT NOT NULL, generation INTEGER NOT NULL,"
+                " locked_until REAL NOT NULL, value TEXT, expires_at REAL NOT NULL)"
+            )
+
+    def acquire(self, key: str, ttl_seconds: float) -> Optional[str]:
+        now = time.time()
+        token = uuid.uuid4().hex
+        # One statement, so two processes cannot both take the lock
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO flights (key, token, generation, locked_until, value, expires_at)"
+                " VALUES (?, ?, 1, ?, NULL, 0)"
+                " ON CONFLICT (key) DO UPDATE SET token = excluded.token, generation = generation + 1,"
+                " locked_until = excluded.locked_until, value = NULL, expires_at = 0"
+                " WHERE flights.locked_until <= ?",
+                (key, token, now + ttl_seconds, now)
+            )
+        return token if cursor.rowcount == 1 else None
+
+    def release(self, key: str, token: str, value: Optional[str], window_seconds: float) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE flights SET locked_until = 0, value = ?, expires_at = ? WHERE key = ? AND token = ?",
+                (value, now + window_seconds, key, token)
+            )
+            # Keep finished flights a while past their window for waiters still polling them
+            self._conn.execute(
+                "DELETE FROM flights WHERE locked_until = 0 AND expires_at < ?", (now - COALESCE_LOCK_TTL_SECONDS,)
+            )
+
+    def result(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM flights WHERE key = ? AND locked_until = 0 AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def _flight(self, key: str) -> Optional[Tuple[int, float, Optional[str]]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT generation, locked_until, value FROM flights WHERE key = ?", (key,)
+            ).fetchone()
+
+    def wait(self, key: str, timeout: float) -> Optional[str]:
+        deadline = time.monotonic() + timeout
+        flight = self._flight(key)
+        if flight is None:
+            return None
+        generation = flight[0]
+        while time.monotonic() < deadline:
+            time.sleep(min(self.poll_seconds, max(0.0, deadline - time.monotonic())))
+            flight = self._flight(key)
+            if flight is None or flight[0] != generation:
+                return None
+            _, locked_until, value = flight
+            if locked_until == 0:
+                return value
+            if locked_until <= time.time():
+                return None
+        return None
+
+class Coalescer:
+    """
+    Single-flight calls: while a call for a key is running, other calls for the same key
+    wait for it and share its value instead of running again, and for a short window
+    after it finishes its value is returned straight away.
+    """
+
+    def __init__(
+        self,
+        store: FlightStore,
+        window_seconds: float = COALESCE_WINDOW_SECONDS,
+        wait_seconds: float = COALESCE_WAIT_SECONDS,
+        lock_ttl_seconds: float = COALESCE_LOCK_TTL_SECONDS
+    ):
+        self.store = store
+        self.window_seconds = window_seconds
+        self.wait_seconds = wait_seconds
+        self.lock_ttl_seconds = lock_ttl_seconds
+
+    def run(self, key: str, call: Callable[[], Tuple[str, bool]]) -> Tuple[str, str]:
+        """
+        Runs call for key, or shares the value of a call for key that is running or just finished.
+
+        Args:
+            key (str): What identifies identical calls.
+            call (Callable[[], Tuple[str, bool]]): Returns the serialized value, and whether
+                it may be reused in the window; values that may not are only shared with the
+                callers already waiting.
+
+        Returns:
+            Tuple[str, str]: The value, and 'called' if this caller ran call, 'coalesced'
+            if it shared a running call's value, or 'window' if it reused a finished call's.
+        """
+        deadline = time.monotonic() + self.wait_seconds
+        token = None
+        with span("coalesce") as coalesce_span:
+            while True:
+                value = self.store.result(key)
+                if value is not None:
+                    coalesce_span.set(window_hits=1)
+                    return value, 'window'
+                token = self.store.acquire(key, self.lock_ttl_seconds)
+                if token is not None:
+                    coalesce_span.set(flights=1)
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Waited too long; make the call without sharing it
+                    coalesce_span.set(wait_timeouts=1)
+                    break
+                value = self.store.wait(key, remaining)
+                if value is not None:
+                    coalesce_span.set(coalesced=1)
+                    return value, 'coalesced'
+                # The running call failed or lost its lock; take it over
+
+        try:
+            value, reusable = call()
+        except BaseException:
+            if token is not None:
+                self.store.release(key, token, None, 0)
+            raise
+        if token is not None:
+            self.store.release(key, token, value, self.window_seconds if reusable else 0)
+        return value, 'called'
+
+def create_flight_store(name: str) -> Optional[FlightStore]:
+    """
+    Creates a flight store from its name and the COALESCE_* environment variables.
+
+    Args:
+        name (str): One of 'memory', 'sqlite' or 'none'.
+
+    Returns:
+        Optional[FlightStore]: The store, or None if coalescing is disabled.
+    """
+    if name == "none":
+        return None
+    if name == "memory":
+        return MemoryFlightStore()
+    if name == "sqlite":
+        return SQLiteFlightStore(os.getenv("COALESCE_PATH", "/tmp/bank-rate-collector/coalesce.sqlite3"))
+    raise ValueError(f"Unknown coalescing backend: {name}")
+
+_coalescer: Optional[Coalescer] = None
+_coalescer_lock = threading.Lock()
+
+def get_coalescer() -> Optional[Coalescer]:
+    """
+    Returns the process-wide coalescer, creating it on first use.
+
+    Returns:
+        Optional[Coalescer]: The coalescer, or None if COALESCE_BACKEND is 'none'.
+    """
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is None:
+            store = create_flight_store(os.getenv("COALESCE_BACKEND", "memory"))
+            if store is None:
+                return None
+            _coalescer = Coalescer(store)
+        return _coalescer
+
+# Define module exports
+__all__ = [
+    'Coalescer', 'FlightStore', 'MemoryFlightStore', 'SQLiteFlightStore', 'create_flight_store',
+    'get_coalescer', 'normalize_url',
+]
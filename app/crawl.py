@@ -0,0 +1,549 @@
+# crawl.py
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+from .domains import root_domain, same_site
+from .extract import MAX_CHUNK_TOKENS
+from .fetch_state import FetchStateStore, get_fetch_state_store
+from .merge import BankResponseMerger
+from .metrics import span
+from .models import BankResponse, CrawlPage, CrawlResponse, ExtractionStats
+from .parsers import decode_html
+from .pipeline import extract_fetched_page, load_page_state
+from .scheduler import FetchScheduler, get_fetch_scheduler
+from .scrape import SCRAPE_HEADERS, fetch_scheduled
+
+# The page budget of a crawl, which is also the most a /crawl request may ask for, since
+# a crawl has to finish within the request timeout while it fetches from one host at that
+# host's rate limit
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "10"))
+# The default link depth of a crawl, and the most a request may ask for
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+CRAWL_DEPTH_LIMIT = 4
+# How many pages a crawl fetches at once. The fetch scheduler still applies its per-host
+# rate and concurrency limits.
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "4"))
+# Pages without rate tables crawled more recently than this are not fetched again;
+# the links stored for them are followed instead
+CRAWL_REFRESH_SECONDS = float(os.getenv("CRAWL_REFRESH_SECONDS", str(7 * 86400)))
+# Links scoring below this are not followed
+CRAWL_MIN_LINK_SCORE = float(os.getenv("CRAWL_MIN_LINK_SCORE", "0"))
+# Most links that do not load with requests are broken, so a crawl only renders them
+# in the browser if this is set. Domains known to need the browser still use it.
+CRAWL_BROWSER_FALLBACK = bool(int(os.getenv("CRAWL_BROWSER_FALLBACK", "0")))
+
+# Words in a link's text, or its URL at half the weight, that point to a rate page,
+# to a product page that may list rates, to a section of product pages, or away from rates
+RATE_LINK_WORDS = re.compile(r'\b(rates?|apy|apr|dividends?|fee schedule|fees)\b')
+PRODUCT_LINK_WORDS = re.compile(
+    r'\b(cds?|certificates?|savings|money market|ira|checking|deposits?|loans?|mortgages?|auto|heloc|'
+    r'home equity|credit cards?|share)\b'
+)
+SECTION_LINK_WORDS = re.compile(r'\b(personal|business|banking|accounts?|products|borrow(?:ing)?|deposit)\b')
+OFF_TOPIC_LINK_WORDS = re.compile(
+    r'\b(log ?in|sign ?in|enroll|careers?|jobs|privacy|terms|accessibility|contact|locations?|branch(?:es)?|'
+    r'atms?|news|blog|press|events|calculators?|apply|espanol|sitemap)\b'
+)
+SKIPPED_EXTENSIONS = re.compile(
+    r'\.(pdf|jpe?g|png|gif|svg|webp|ico|css|js|json|xml|zip|docx?|xlsx?|pptx?|mp[34]|mov|woff2?|ttf)$',
+    re.IGNORECASE
+)
+SKIPPED_SCHEMES = ('#', 'mailto:', 'tel:', 'javascript:', 'data:')
+
+class LinkParser(HTMLParser):
+    """
+    Collects the href and text of each <a> element, including the alt text of images
+    and the title and aria-label attributes of the link.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links: List[Tuple[str, str]] = []
+        self._href: Optional[str] = None
+        self._text: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self._close_link()
+            attrs = dict(attrs)
+            self._href = attrs.get('href')
+            self._text = [attrs.get('title') or '', attrs.get('aria-label') or '']
+        elif tag == 'img' and self._href is not None:
+            self._text.append(dict(attrs).get('alt') or '')
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._close_link()
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+    def _close_link(self) -> None:
+        if self._href:
+            self.links.append((self._href, ' '.join(' '.join(self._text).split())))
+        self._href = None
+        self._text = []
+
+    def close(self):
+        super().close()
+        self._close_link()
+
+def normalize_link(base_url: str, href: str) -> Optional[str]:
+    """
+    Resolves a link against the page it is on, without its fragment or utm_ parameters.
+
+    Returns:
+        Optional[str]: The absolute URL, or None for links that are not web pages.
+    """
+    href = href.strip()
+    if not href or href.lower().startswith(SKIPPED_SCHEMES):
+        return None
+    parsed = urlparse(urljoin(base_url, href))
+    if parsed.scheme not in ('http', 'https') or not parsed.netloc or SKIPPED_EXTENSIONS.search(parsed.path):
+        return None
+    query = urlencode([
+        (name, value) for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if not name.lower().startswith('utm_')
+    ])
+    return urlunparse((parsed.scheme, parsed.netloc.lower(), parsed.path or '/', '', query, ''))
+
+def start_url(url_or_domain: str) -> str:
+    """
+    Returns the URL to start a crawl from, given a URL or a bare domain.
+
+    Raises:
+        ValueError: If it is not an http or https URL.
+    """
+    value = url_or_domain.strip()
+    if '://' not in value:
+        value = f"https://{value}"
+    url = normalize_link(value, value)
+    if url is None:
+        raise ValueError(f"Invalid start URL: {url_or_domain}")
+    return url
+
+def score_link(url: str, text: str) -> float:
+    """
+    Scores how likely a link is to lead to rate tables, from its text and URL.
+    """
+    parsed = urlparse(url)
+    url_words = re.sub(r'[^a-z0-9]+', ' ', f"{parsed.path} {parsed.query}".lower())
+    score = 0.0
+    for words, weight in ((text.lower(), 1.0), (url_words, 0.5)):
+        score += weight * (
+            3 * len(set(RATE_LINK_WORDS.findall(words)))
+            + len(set(PRODUCT_LINK_WORDS.findall(words)))
+            + 0.5 * len(set(SECTION_LINK_WORDS.findall(words)))
+            - 3 * len(set(OFF_TOPIC_LINK_WORDS.findall(words)))
+        )
+    return score
+
+def extract_links(
+    url: str,
+    html: Union[str, bytes],
+    site: str,
+    min_score: float = CRAWL_MIN_LINK_SCORE
+) -> List[Tuple[str, float]]:
+    """
+    Returns the links of a page to other pages of the same site, with their scores.
+
+    Args:
+        url (str): The URL the page was fetched from.
+        html (Union[str, bytes]): The page HTML.
+        site (str): The site's root domain; links to subdomains of it are kept.
+        min_score (float): The minimum score for a link to be kept.
+
+    Returns:
+        List[Tuple[str, float]]: Each link once with its best score, highest first.
+    """
+    with span("links") as links_span:
+        parser = LinkParser()
+        parser.feed(decode_html(html))
+        parser.close()
+        scores: Dict[str, float] = {}
+        for href, text in parser.links:
+            link = normalize_link(url, href)
+            if link is None or link == url or not same_site(urlparse(link).netloc, site):
+                continue
+            score = score_link(link, text)
+            if score >= min_score and score > scores.get(link, float('-inf')):
+                scores[link] = score
+        links_span.set(links=len(scores))
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+class RobotsRules:
+    """
+    The robots.txt rules of the hosts of a crawl, fetched once per host through the
+    fetch scheduler. A host whose robots.txt cannot be fetched allows everything.
+    Safe to use from the crawl's worker threads.
+    """
+
+    def __init__(self, scheduler: FetchScheduler):
+        self.scheduler = scheduler
+        self._parsers: Dict[str, Optional[RobotFileParser]] = {}
+        self._lock = threading.Lock()
+        # host -> lock held while its robots.txt is fetched, so it is fetched once
+        self._host_locks: Dict[str, threading.Lock] = {}
+
+    def _load(self, url: str) -> Optional[RobotFileParser]:
+        parsed = urlparse(url)
+        robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+        try:
+            with self.scheduler.slot(robots_url):
+                response = self.scheduler.session(robots_url).get(
+                    robots_url, headers=SCRAPE_HEADERS, timeout=self.scheduler.timeout
+                )
+        except requests.RequestException as e:
+            print(f"Failed to retrieve {robots_url}: {e}")
+            return None
+        if response.status_code != 200:
+            return None
+        parser = RobotFileParser(robots_url)
+        parser.parse(response.text.splitlines())
+        return parser
+
+    def load(self, url: str) -> Optional[RobotFileParser]:
+        """
+        Returns the rules of url's host, fetching its robots.txt on first use.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            host_lock = self._host_locks.setdefault(host, threading.Lock())
+        with host_lock:
+            if host not in self._parsers:
+                self._parsers[host] = self._load(url)
+            return self._parsers[host]
+
+    def allowed(self, url: str) -> bool:
+        """
+        Returns whether url may be crawled, fetching its host's robots.txt on first use.
+        """
+        parser = self.load(url)
+        return parser is None or parser.can_fetch('*', url)
+
+    def known_allowed(self, url: str) -> Optional[bool]:
+        """
+        Returns whether url may be crawled, or None if its host's robots.txt was not fetched yet.
+        """
+        host = urlparse(url).netloc
+        if host not in self._parsers:
+            return None
+        parser = self._parsers[host]
+        return parser is None or parser.can_fetch('*', url)
+
+class CrawlPageState(NamedTuple):
+    """
+    What a crawl learned about a page of a site, or a link it left for the next crawl.
+    """
+    url: str
+    depth: int
+    score: float
+    # rates, no_rate_tables or failed once crawled; pending for a link not crawled yet
+    status: str
+    links: List[Tuple[str, float]]
+    crawled_at: Optional[float]
+    # The page's validators, so a page without rates can be revalidated with a conditional
+    # request; pages with rates keep theirs in the fetch state store
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+class CrawlStateStore:
+    """
+    The pages each site's crawls visited, their links, and the links left to crawl,
+    stored in a SQLite database.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS crawl_pages ("
+                " site TEXT NOT NULL, url TEXT NOT NULL, depth INTEGER NOT NULL, score REAL NOT NULL,"
+                " status TEXT NOT NULL, links TEXT NOT NULL, crawled_at REAL, etag TEXT, last_modified TEXT,"
+                " PRIMARY KEY (site, url))"
+            )
+            # Databases created before the validators were stored
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(crawl_pages)")}
+            for column in ('etag', 'last_modified'):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE crawl_pages ADD COLUMN {column} TEXT")
+
+    def pages(self, site: str) -> Dict[str, CrawlPageState]:
+        """
+        Returns the stored pages and pending links of a site, by URL.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, depth, score, status, links, crawled_at, etag, last_modified"
+                " FROM crawl_pages WHERE site = ?",
+                (site,)
+            ).fetchall()
+        return {
+            url: CrawlPageState(
+                url, depth, score, status, [tuple(link) for link in json.loads(links)], crawled_at, etag, last_modified
+            )
+            for url, depth, score, status, links, crawled_at, etag, last_modified in rows
+        }
+
+    def put(self, site: str, page: CrawlPageState) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO crawl_pages"
+                " (site, url, depth, score, status, links, crawled_at, etag, last_modified)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (site, page.url, page.depth, page.score, page.status, json.dumps(page.links), page.crawled_at,
+                 page.etag, page.last_modified)
+            )
+
+    def add_pending(self, site: str, links: List[Tuple[str, int, float]]) -> None:
+        """
+        Stores (url, depth, score) links to crawl next time. Pages already stored are left as they are.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO crawl_pages (site, url, depth, score, status, links, crawled_at)"
+                " VALUES (?, ?, ?, ?, 'pending', '[]', NULL)",
+                [(site, url, depth, score) for url, depth, score in links]
+            )
+
+_crawl_state_store: Optional[CrawlStateStore] = None
+_crawl_state_store_lock = threading.Lock()
+
+def get_crawl_state_store() -> Optional[CrawlStateStore]:
+    """
+    Returns the process-wide crawl state store, creating it on first use.
+
+    Returns:
+        Optional[CrawlStateStore]: The store, or None if CRAWL_STATE_BACKEND is 'none'.
+    """
+    global _crawl_state_store
+    with _crawl_state_store_lock:
+        if _crawl_state_store is None:
+            backend = os.getenv("CRAWL_STATE_BACKEND", "sqlite")
+            if backend == "none":
+                return None
+            if backend != "sqlite":
+                raise ValueError(f"Unknown crawl state backend: {backend}")
+            path = os.getenv("CRAWL_STATE_PATH", "/tmp/bank-rate-collector/crawl_state.sqlite3")
+            _crawl_state_store = CrawlStateStore(path)
+        return _crawl_state_store
+
+class CrawledPage(NamedTuple):
+    bank_response: Optional[BankResponse]
+    error: Optional[str]
+    stats: ExtractionStats
+    status: str
+    links: List[Tuple[str, float]]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+def crawl_page(
+    url: str,
+    site: str,
+    known: Optional[CrawlPageState],
+    scheduler: FetchScheduler,
+    fetch_store: Optional[FetchStateStore],
+    robots: RobotsRules,
+    max_chunk_tokens: int
+) -> CrawledPage:
+    """
+    Fetches a page, collects its links and extracts its rates. Pages without tables that
+    pass the relevance filter are never sent to the LLM, and unchanged pages return their
+    stored result. Pages crawled before are fetched with their stored validators, so an
+    unchanged page costs a 304.
+    """
+    try:
+        if not robots.allowed(url):
+            return CrawledPage(None, "Disallowed by robots.txt", ExtractionStats(), 'failed', [])
+        state = load_page_state(fetch_store, url)
+        etag = last_modified = None
+        # Without the links stored by an earlier crawl a 304 would leave the page's links unknown
+        if known is None or known.crawled_at is None:
+            state = None
+        elif state is not None:
+            etag, last_modified = state.etag, state.last_modified
+        elif known.status == 'no_rate_tables':
+            etag, last_modified = known.etag, known.last_modified
+        page = fetch_scheduled(
+            url, etag=etag, last_modified=last_modified, scheduler=scheduler, browser_fallback=CRAWL_BROWSER_FALLBACK
+        )
+        if page.not_modified and state is None:
+            stats = ExtractionStats(unchanged_page=True, not_modified=True)
+            return CrawledPage(None, None, stats, known.status, known.links, known.etag, known.last_modified)
+        if page.not_modified:
+            links = known.links
+        elif page.html is not None:
+            links = extract_links(url, page.html, site)
+        else:
+            return CrawledPage(None, f"Failed to retrieve {url}", ExtractionStats(), 'failed', [])
+        _, bank_response, error, stats = extract_fetched_page(url, page, state, fetch_store, max_chunk_tokens)
+    except Exception as e:
+        return CrawledPage(None, str(e), ExtractionStats(), 'failed', [])
+
+    if bank_response:
+        status = 'rates'
+    elif not stats.chunks:
+        status = 'no_rate_tables'
+    else:
+        status = 'failed'
+    return CrawledPage(bank_response, error, stats, status, links, page.etag, page.last_modified)
+
+def crawl_site(
+    url: str,
+    max_pages: int = CRAWL_MAX_PAGES,
+    max_depth: int = CRAWL_MAX_DEPTH,
+    concurrency: int = CRAWL_CONCURRENCY,
+    scheduler: Optional[FetchScheduler] = None,
+    max_chunk_tokens: int = MAX_CHUNK_TOKENS
+) -> CrawlResponse:
+    """
+    Crawls a bank's site for its rate pages and merges their rates.
+
+    Starting from url, same-site links are followed best first: links whose text or URL
+    mention rates and products are fetched before the rest, and links to logins, careers,
+    locations and the like are dropped. Pages are fetched concurrently through the fetch
+    scheduler and robots.txt is respected; the start host's robots.txt is fetched before
+    the crawl and other hosts' by the worker that first needs them. Each page is extracted
+    like /extract, so pages without qualifying tables cost no LLM calls and unchanged pages
+    return their stored result.
+
+    The crawl state store keeps each page's links and whether it had rates. The next
+    crawl of the site fetches its known rate pages first, follows the stored links of
+    recently crawled pages without rates instead of fetching them, revalidates the pages
+    it does fetch with their stored validators, and continues with the links the last
+    crawl had no budget for.
+
+    Args:
+        url (str): The URL or domain to start from, usually the bank's home page.
+        max_pages (int): The maximum number of pages to fetch.
+        max_depth (int): The maximum number of links to follow from the start URL.
+        concurrency (int): The maximum number of pages fetched and extracted at once.
+        scheduler (Optional[FetchScheduler]): The fetch scheduler; defaults to the process-wide one.
+        max_chunk_tokens (int): The token budget for the table data in each chunk.
+
+    Returns:
+        CrawlResponse: The merged rates and the outcome of each page.
+
+    Raises:
+        ValueError: If url is not an http or https URL or a domain.
+    """
+    start = start_url(url)
+    site = root_domain(urlparse(start).netloc)
+    scheduler = scheduler or get_fetch_scheduler()
+    crawl_store = get_crawl_state_store()
+    fetch_store = get_fetch_state_store()
+    known = crawl_store.pages(site) if crawl_store is not None else {}
+    robots = RobotsRules(scheduler)
+    robots.load(start)
+    now = time.time()
+
+    # (rank, -score, depth, sequence, url); the start page and known rate pages rank first
+    frontier: List[Tuple[int, float, int, int, str]] = []
+    sequence = itertools.count()
+
+    def push(link: str, depth: int, score: float, rank: int = 1) -> None:
+        heapq.heappush(frontier, (rank, -score, depth, next(sequence), link))
+
+    def expand(links: List[Tuple[str, float]], depth: int) -> None:
+        if depth < max_depth:
+            for link, score in links:
+                if link not in visited:
+                    push(link, depth + 1, score)
+
+    push(start, 0, 0.0, rank=0)
+    for page in known.values():
+        if page.status == 'rates':
+            push(page.url, page.depth, page.score, rank=0)
+        elif page.status in ('pending', 'failed') and page.depth <= max_depth:
+            push(page.url, page.depth, page.score)
+
+    visited = set()
+    pages: List[CrawlPage] = []
+    # (depth, -score, url, bank_response) of each rate page, merged in that order
+    rate_pages: List[Tuple[int, float, str, BankResponse]] = []
+    fetched = 0
+    with span("crawl", domain=site) as crawl_span, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='crawl') as pool:
+        running: Dict[Future, Tuple[str, int, float]] = {}
+        while frontier or running:
+            while frontier and len(running) < concurrency and fetched < max_pages:
+                _, negative_score, depth, _, link = heapq.heappop(frontier)
+                if link in visited:
+                    continue
+                visited.add(link)
+                score = -negative_score
+                page_state = known.get(link)
+                if (page_state is not None and page_state.status == 'no_rate_tables'
+                        and now - (page_state.crawled_at or 0) < CRAWL_REFRESH_SECONDS):
+                    pages.append(CrawlPage(url=link, depth=depth, score=score, status='known'))
+                    expand(page_state.links, depth)
+                    continue
+                # Hosts whose robots.txt is not loaded yet are checked by the worker
+                if robots.known_allowed(link) is False:
+                    pages.append(CrawlPage(url=link, depth=depth, score=score, status='failed', error="Disallowed by robots.txt"))
+                    continue
+                # Each page's spans join the crawl's trace
+                future = pool.submit(
+                    contextvars.copy_context().run,
+                    crawl_page, link, site, page_state, scheduler, fetch_store, robots, max_chunk_tokens
+                )
+                running[future] = (link, depth, score)
+                fetched += 1
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                link, depth, score = running.pop(future)
+                result = future.result()
+                pages.append(CrawlPage(
+                    url=link, depth=depth, score=score, status=result.status, error=result.error, stats=result.stats
+                ))
+                if result.bank_response:
+                    rate_pages.append((depth, -score, link, result.bank_response))
+                if crawl_store is not None:
+                    crawl_store.put(site, CrawlPageState(
+                        link, depth, score, result.status, result.links, time.time(), result.etag, result.last_modified
+                    ))
+                expand(result.links, depth)
+
+        # Links the budget did not reach are crawled first next time
+        pending: Dict[str, Tuple[str, int, float]] = {}
+        for _, negative_score, depth, _, link in sorted(frontier):
+            if link not in visited and link not in pending:
+                pending[link] = (link, depth, -negative_score)
+        if crawl_store is not None:
+            crawl_store.add_pending(site, list(pending.values()))
+        crawl_span.set(pages=fetched, rate_pages=len(rate_pages))
+
+    merger = BankResponseMerger()
+    for _, _, link, bank_response in sorted(rate_pages, key=lambda item: item[:3]):
+        merger.add(bank_response, link)
+    bank_response = merger.result() if rate_pages else None
+    error = None if bank_response else f"No rate tables found within {fetched} pages of {start}"
+    return CrawlResponse(
+        start_url=start, bank_response=bank_response, error=error, pages=pages,
+        pages_fetched=fetched, frontier=len(pending)
+    )
+
+# Define module exports
+__all__ = ['CrawlStateStore', 'crawl_site', 'extract_links', 'get_crawl_state_store', 'score_link', 'start_url']
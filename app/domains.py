@@ -0,0 +1,36 @@
+# domains.py
+from urllib.parse import urlparse
+
+# Labels under a two-letter country code that are public suffixes themselves, as in
+# 'co.uk', 'com.au' or 'gov.in', so the bank's name is the label before them
+SECOND_LEVEL_LABELS = frozenset({
+    'ac', 'co', 'com', 'edu', 'gob', 'go', 'gov', 'ltd', 'mil', 'ne', 'net', 'nic', 'or', 'org', 'plc', 'sch',
+})
+
+def root_domain(domain: str) -> str:
+    """
+    Returns a bank's root domain, such as 'bank.com' for 'www.bank.com' or 'rates.bank.com'
+    and 'bank.co.uk' for 'www.bank.co.uk'. A scheme, path or port is dropped, and IP
+    addresses are returned as they are.
+
+    Both the rules and the merged LLM results use it, so a bank has one key whichever
+    path extracted its pages.
+    """
+    host = domain.strip().lower()
+    if '://' in host:
+        host = urlparse(host).hostname or ''
+    host = host.split('/')[0].split(':')[0].rstrip('.')
+    labels = host.split('.')
+    if len(labels) <= 2 or all(label.isdigit() for label in labels):
+        return host
+    keep = 3 if len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_LABELS else 2
+    return '.'.join(labels[-keep:])
+
+def same_site(domain: str, site: str) -> bool:
+    """
+    Returns whether domain belongs to the root domain site, subdomains included.
+    """
+    return root_domain(domain) == site
+
+# Define module exports
+__all__ = ['root_domain', 'same_site']
@@ -1,142 +1,425 @@
 # extract.py
-from .utils import get_openai_api_key
-from typing import List, Dict, Optional
-from .models import BankResponse
+from .utils import get_openai_client
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+from .models import BankResponse, ExtractionStats
+from .cache import get_extraction_cache
+from .tokens import count_tokens
+from .relevance import TABLE_RELEVANCE_THRESHOLD, filter_tables
+from .rules import RULE_CONFIDENCE_THRESHOLD, extract_tables_with_rules
+from .metrics import span
+from .merge import BankResponseMerger
+from .prompt import (
+    PROMPT_STYLE, PROMPT_VERSIONS, build_messages, chunk_header, compact_csv_table, fixed_prompt_tokens,
+    response_model, table_domain, to_bank_response,
+)
 import os   
+import contextvars
 import time
-from openai import OpenAI
-from collections import defaultdict
+import random
+import csv
+import io
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def chunk_data(data: str, chunk_size: int) -> List[str]:
+# openai is imported on first use so it does not slow down every cold start
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+MODEL_ID = os.getenv("MODEL_ID", "gpt-4o")
+
+# Identifies the prompt, schema and table format so cached extractions are not reused
+# after a change; see PROMPT_VERSIONS in app/prompt.py.
+PROMPT_VERSION = PROMPT_VERSIONS[PROMPT_STYLE]
+
+# Token budget for the table data in each chunk, excluding the fixed prompt
+MAX_CHUNK_TOKENS = int(os.getenv("MAX_CHUNK_TOKENS", "2000"))
+
+# Concurrency and retry settings for chunk extraction. The defaults keep a typical
+# 8-chunk rate page well inside the 30s Lambda timeout.
+MAX_CONCURRENT_CHUNKS = int(os.getenv("MAX_CONCURRENT_CHUNKS", "4"))
+CHUNK_TIMEOUT_SECONDS = float(os.getenv("CHUNK_TIMEOUT_SECONDS", "20"))
+MAX_CHUNK_RETRIES = int(os.getenv("MAX_CHUNK_RETRIES", "2"))
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 8.0
+
+def split_csv_rows(csv_table: str) -> List[str]:
+    """
+    Splits a CSV table into its serialized rows, keeping quoted newlines inside their row.
+
+    Args:
+        csv_table (str): A CSV table as produced by table_to_csv.
+
+    Returns:
+        List[str]: The table's rows, each including its line terminator.
+    """
+    # Compact tables end their rows with '\n', those from table_to_csv with '\r\n'
+    terminator = '\r\n' if '\r\n' in csv_table else '\n'
+    rows = []
+    for record in csv.reader(io.StringIO(csv_table, newline='')):
+        output = io.StringIO()
+        csv.writer(output, lineterminator=terminator).writerow(record)
+        rows.append(output.getvalue())
+    return rows
+
+def split_table(csv_table: str, max_tokens: int) -> List[str]:
+    """
+    Splits a table that exceeds the token budget into pieces on row boundaries,
+    repeating the header row at the top of each piece.
+
+    A single row larger than the budget is kept whole in its own piece.
+
+    Args:
+        csv_table (str): A CSV table as produced by table_to_csv.
+        max_tokens (int): The token budget for each piece.
+
+    Returns:
+        List[str]: The pieces of the table.
+    """
+    rows = split_csv_rows(csv_table)
+    if len(rows) <= 1:
+        return [csv_table]
+
+    header, body = rows[0], rows[1:]
+    header_tokens = count_tokens(header, MODEL_ID)
+
+    pieces = []
+    current = [header]
+    current_tokens = header_tokens
+    for row in body:
+        row_tokens = count_tokens(row, MODEL_ID)
+        if len(current) > 1 and current_tokens + row_tokens > max_tokens:
+            pieces.append(''.join(current))
+            current = [header]
+            current_tokens = header_tokens
+        current.append(row)
+        current_tokens += row_tokens
+    pieces.append(''.join(current))
+    return pieces
+
+def chunk_tables(csv_tables: List[str], max_tokens: int = MAX_CHUNK_TOKENS, separator: str = '') -> List[str]:
     """
-    Splits a large string into smaller chunks of a specified maximum size.
+    Packs whole CSV tables into chunks of at most max_tokens tokens.
+
+    Tables are never cut mid-row. Tables larger than the budget are split on row
+    boundaries with their header row repeated, so the model never sees orphaned rows.
 
     Args:
-        data (str): The data to be chunked.
-        chunk_size (int): The maximum size of each chunk.
+        csv_tables (List[str]): List of CSV tables as strings.
+        max_tokens (int): The token budget for each chunk.
+        separator (str): Put between the tables of a chunk.
 
     Returns:
         List[str]: A list of data chunks.
     """
     chunks = []
-    for i in range(0, len(data), chunk_size):
-        chunks.append(data[i:i + chunk_size])
+    current: List[str] = []
+    current_tokens = 0
+
+    for csv_table in csv_tables:
+        table_tokens = count_tokens(csv_table, MODEL_ID)
+        pieces = [csv_table] if table_tokens <= max_tokens else split_table(csv_table, max_tokens)
+
+        for piece in pieces:
+            piece_tokens = table_tokens if len(pieces) == 1 else count_tokens(piece, MODEL_ID)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append(separator.join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+
+    if current:
+        chunks.append(separator.join(current))
     return chunks
 
-def extract_with_llm(chunk: str) -> BankResponse:
-    prompt = f"""
-Extract the banking rate data from the following text and structure it according to the provided model.
+def build_chunks(csv_tables: List[str], max_tokens: int = MAX_CHUNK_TOKENS, style: str = PROMPT_STYLE) -> List[str]:
+    """
+    Turns a page's CSV tables into the chunks sent to the LLM.
 
-Special instructions:
-- If a property or object does not exist, do not include it in the output.
-- Do not include 'www' or other subdomains in the bankRootDomain.
-- If dividend rate is given, do not include interest rate.
-- Do not convert percentage to decimal. I.e. if the rate is 0.55%, return 0.55 not 0.0055
+    In the compact prompt style each table is compacted with compact_csv_table, tables
+    are separated by a blank line, and the domain the tables no longer carry is named
+    once at the top of each chunk.
 
-Text:
-{chunk}
-"""
-    client = OpenAI(api_key=get_openai_api_key())
+    Args:
+        csv_tables (List[str]): The page's CSV tables, as produced by table_to_csv.
+        max_tokens (int): The token budget for the table data in each chunk.
+        style (str): The prompt style, 'compact' or 'full'.
 
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant designed to output structured data."},
-            {"role": "user", "content": prompt}
-        ],
-        response_format=BankResponse,  # Directly use the Pydantic model here
-    )
+    Returns:
+        List[str]: A list of data chunks.
+    """
+    if style == 'full' or not csv_tables:
+        return chunk_tables(csv_tables, max_tokens)
 
-    return response.choices[0].message.parsed  # This will be a Pydantic model instance
+    # Assuming all CSV tables belong to the same domain
+    header = chunk_header(table_domain(csv_tables[0]))
+    tables = [compact_csv_table(csv_table) for csv_table in csv_tables]
+    budget = max(1, max_tokens - count_tokens(header, MODEL_ID))
+    return [header + chunk for chunk in chunk_tables([table for table in tables if table], budget, separator='\n')]
 
-def process_and_extract_tables_single(
-    csv_tables: List[str],
-    chunk_size: int
-) -> Optional[BankResponse]:
+def extract_with_llm(
+    chunk: str,
+    timeout: Optional[float] = None,
+    client: Optional["OpenAI"] = None,
+    style: str = PROMPT_STYLE
+) -> BankResponse:
     """
-    Processes the CSV tables for a single URL and extracts structured data using OpenAI's API,
-    returning a merged BankResponse object.
+    Extracts structured banking rate data from a single chunk using OpenAI's API.
+
+    The OpenAI base URL can be pointed at a local fake server with the standard
+    OPENAI_BASE_URL environment variable.
 
     Args:
-        csv_tables (List[str]): List of CSV tables as strings.
-        chunk_size (int): The size of the data chunks to be processed.
+        chunk (str): The chunk of CSV data to extract from, as produced by build_chunks.
+        timeout (Optional[float]): The timeout in seconds for the API call.
+        client (Optional[OpenAI]): The client to use; defaults to the shared client.
+        style (str): The prompt style the chunk was built for, 'compact' or 'full'.
 
     Returns:
-        Optional[BankResponse]: A merged BankResponse object or None if unsuccessful.
+        BankResponse: The extracted data.
     """
-    if not csv_tables:
-        print("No CSV tables to process.")
-        return None
+    if client is None:
+        client, _ = get_openai_client()
 
-    # Assuming all CSV tables belong to the same domain
-    combined_csv = ''.join(csv_tables)
-    chunks = chunk_data(combined_csv, chunk_size)
+    # The fixed prompt tokens are an estimate; the provider reports how many prompt
+    # tokens were served from its prefix cache
+    with span("llm", model=MODEL_ID, fixed_prompt_tokens=fixed_prompt_tokens(style, MODEL_ID)) as llm_span:
+        response = client.beta.chat.completions.parse(
+            model=MODEL_ID,
+            messages=build_messages(chunk, style),
+            response_format=response_model(style),  # Directly use the Pydantic model here
+            timeout=timeout,
+        )
+        if response.usage is not None:
+            details = getattr(response.usage, 'prompt_tokens_details', None)
+            llm_span.set(
+                prompt_tokens=response.usage.prompt_tokens,
+                completion_tokens=response.usage.completion_tokens,
+                cached_prompt_tokens=getattr(details, 'cached_tokens', None) or 0,
+            )
 
-    url_responses: List[BankResponse] = []
+    return to_bank_response(response.choices[0].message.parsed)
 
-    start_time = time.time()
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Returns True for errors worth retrying: timeouts, connection errors, 429s and 5xx responses.
+    """
+    from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+    if isinstance(error, (APITimeoutError, APIConnectionError, RateLimitError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    return False
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Returns a "full jitter" exponential backoff delay for the given retry attempt.
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * (2 ** attempt)))
+
+def extract_chunk_with_retries(
+    chunk: str,
+    timeout: float,
+    max_retries: int
+) -> Tuple[BankResponse, int, float]:
+    """
+    Extracts a single chunk, retrying retryable errors with jittered backoff.
+
+    An authentication failure refreshes the cached API key and client once.
+
+    Args:
+        chunk (str): The chunk of CSV data to extract from.
+        timeout (float): The timeout in seconds for each attempt.
+        max_retries (int): The maximum number of retries after the first attempt.
 
-    for chunk in chunks:
+    Returns:
+        Tuple[BankResponse, int, float]: The extracted data, the number of retries used,
+        and the setup seconds saved by reusing the cached client.
+    """
+    from openai import AuthenticationError
+
+    attempt = 0
+    seconds_saved = 0.0
+    force_refresh = False
+    refreshed = False
+    while True:
+        client, client_seconds_saved = get_openai_client(force_refresh=force_refresh)
+        seconds_saved += client_seconds_saved
+        force_refresh = False
         try:
-            extracted_data_chunk = extract_with_llm(chunk)
-            url_responses.append(extracted_data_chunk)
+            return extract_with_llm(chunk, timeout=timeout, client=client), attempt, seconds_saved
+        except AuthenticationError:
+            if refreshed:
+                raise
+            # The cached key may have been rotated
+            print("Authentication failed; refreshing the OpenAI API key")
+            force_refresh = refreshed = True
+            attempt += 1
         except Exception as e:
-            print(f"Failed to extract data from chunk: {e}")
-            return None
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Retrying chunk after error ({e}); attempt {attempt + 1} of {max_retries} in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
 
-    end_time = time.time()
-    processing_time = end_time - start_time
+def extract_chunks_concurrently(
+    chunks: List[str],
+    max_concurrency: int = MAX_CONCURRENT_CHUNKS,
+    timeout: float = CHUNK_TIMEOUT_SECONDS,
+    max_retries: int = MAX_CHUNK_RETRIES,
+    stats: Optional[ExtractionStats] = None,
+    on_chunk_done: Optional[Callable[[int, BankResponse], None]] = None
+) -> List[Optional[BankResponse]]:
+    """
+    Extracts all chunks with at most max_concurrency LLM calls in flight.
 
-    print(f"Processing time: {processing_time:.2f} seconds")
+    Chunks found in the extraction cache are not sent to the LLM, and successful
+    extractions are written back to it.
 
-    # Merge all responses into a single BankResponse
-    merged_response = merge_bank_responses(url_responses)
+    Args:
+        chunks (List[str]): The chunks of CSV data to extract from.
+        max_concurrency (int): The maximum number of concurrent LLM calls.
+        timeout (float): The timeout in seconds for each LLM call.
+        max_retries (int): The maximum number of retries per chunk.
+        stats (Optional[ExtractionStats]): If given, updated with chunk, retry and cache counts.
+        on_chunk_done (Optional[Callable[[int, BankResponse], None]]): If given, called with
+            each chunk's index and result as soon as it is available, e.g. to persist it.
 
-    return merged_response
+    Returns:
+        List[Optional[BankResponse]]: The results in chunk order, with None for failed chunks.
+    """
+    results: List[Optional[BankResponse]] = [None] * len(chunks)
+    if not chunks:
+        return results
+
+    with span("extract", chunks=len(chunks)) as extract_span:
+        cache = get_extraction_cache(MODEL_ID, PROMPT_VERSION)
+        pending: List[int] = []
+        for index, chunk in enumerate(chunks):
+            cached = cache.get(chunk) if cache is not None else None
+            if cached is not None:
+                results[index] = cached
+                _report_chunk_done(on_chunk_done, index, cached)
+            else:
+                pending.append(index)
+
+        retries = 0
+        failed = 0
+        client_reuses = 0
+        seconds_saved = 0.0
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(pending)))) as executor:
+                futures = {
+                    # Each call runs in a copy of this context so its spans join the request's trace
+                    executor.submit(
+                        contextvars.copy_context().run, extract_chunk_with_retries, chunks[index], timeout, max_retries
+                    ): index
+                    for index in pending
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        results[index], chunk_retries, chunk_seconds_saved = future.result()
+                        retries += chunk_retries
+                        seconds_saved += chunk_seconds_saved
+                        if chunk_seconds_saved > 0:
+                            client_reuses += 1
+                    except Exception as e:
+                        print(f"Failed to extract data from chunk {index + 1} of {len(chunks)}: {e}")
+                        failed += 1
+                        continue
+                    if cache is not None:
+                        cache.set(chunks[index], results[index])
+                    _report_chunk_done(on_chunk_done, index, results[index])
+        extract_span.set(retries=retries, failed_chunks=failed, cache_hits=len(chunks) - len(pending))
 
-def merge_bank_responses(responses: List[BankResponse]) -> BankResponse:
+    if stats is not None:
+        stats.chunks += len(chunks)
+        stats.failed_chunks += failed
+        stats.retries += retries
+        stats.cache_hits += len(chunks) - len(pending)
+        stats.cache_misses += len(pending) if cache is not None else 0
+        stats.client_reuses += client_reuses
+        stats.setup_seconds_saved += seconds_saved
+
+    return results
+
+def _report_chunk_done(
+    on_chunk_done: Optional[Callable[[int, BankResponse], None]],
+    index: int,
+    response: BankResponse
+) -> None:
+    if on_chunk_done is None:
+        return
+    try:
+        on_chunk_done(index, response)
+    except Exception as e:
+        print(f"Failed to report result of chunk {index + 1}: {e}")
+
+def process_and_extract_tables_single(
+    csv_tables: List[str],
+    max_chunk_tokens: int = MAX_CHUNK_TOKENS,
+    max_concurrency: int = MAX_CONCURRENT_CHUNKS,
+    relevance_threshold: float = TABLE_RELEVANCE_THRESHOLD,
+    stats: Optional[ExtractionStats] = None,
+    rule_threshold: float = RULE_CONFIDENCE_THRESHOLD
+) -> Optional[BankResponse]:
     """
-    Merges a list of BankResponse objects into a single BankResponse object.
+    Processes the CSV tables for a single URL and extracts structured data using OpenAI's API,
+    returning a merged BankResponse object.
+
+    Tables that do not look like rate tables are dropped before chunking. Tables with a
+    recognized header layout are extracted by the rules in app/rules.py; only the rest
+    are chunked and sent to the LLM. Chunks are extracted concurrently. If some chunks
+    fail, the merged result of the remaining chunks is returned and the failures are
+    counted in stats.
 
     Args:
-        responses (List[BankResponse]): A list of BankResponse objects to merge.
+        csv_tables (List[str]): List of CSV tables as strings.
+        max_chunk_tokens (int): The token budget for the table data in each chunk.
+        max_concurrency (int): The maximum number of concurrent LLM calls.
+        relevance_threshold (float): The minimum relevance score for a table to be extracted.
+        stats (Optional[ExtractionStats]): If given, updated with skipped table, rule table, chunk,
+            failure and retry counts, and the source of each product.
+        rule_threshold (float): The minimum confidence for a table's rule extraction to be used.
 
     Returns:
-        BankResponse: A merged BankResponse object.
+        Optional[BankResponse]: A merged BankResponse object or None if every chunk failed.
     """
-    if not responses:
+    if not csv_tables:
+        print("No CSV tables to process.")
+        return None
+
+    with span("relevance", tables=len(csv_tables)) as relevance_span:
+        csv_tables, skipped = filter_tables(csv_tables, relevance_threshold, stats=stats)
+        relevance_span.set(tables_skipped=len(skipped))
+    if not csv_tables:
+        print("No rate tables to process.")
+        return None
+
+    with span("rules", tables=len(csv_tables)) as rules_span:
+        rule_responses, csv_tables = extract_tables_with_rules(csv_tables, rule_threshold, stats=stats)
+        rules_span.set(rule_tables=len(rule_responses))
+
+    with span("chunk", tables=len(csv_tables)) as chunk_span:
+        chunks = build_chunks(csv_tables, max_chunk_tokens)
+        chunk_span.set(chunks=len(chunks))
+
+    results = extract_chunks_concurrently(chunks, max_concurrency=max_concurrency, stats=stats)
+    url_responses: List[BankResponse] = [result for result in results if result is not None]
+
+    if not url_responses and not rule_responses:
+        print("Failed to extract data from every chunk.")
         return None
 
-    # Initialize with the first response
-    merged_response = BankResponse(
-        bankRootDomain=responses[0].bankRootDomain,
-        checkingAccounts=[],
-        savingsAccounts=[],
-        moneyMarketAccounts=[],
-        certificatesOfDeposit=[],
-        individualRetirementAccounts=[],
-        loans=[],
-        creditCards=[],
-        fees=[]
-    )
-
-    for response in responses:
-        if response.checkingAccounts:
-            merged_response.checkingAccounts.extend(response.checkingAccounts)
-        if response.savingsAccounts:
-            merged_response.savingsAccounts.extend(response.savingsAccounts)
-        if response.moneyMarketAccounts:
-            merged_response.moneyMarketAccounts.extend(response.moneyMarketAccounts)
-        if response.certificatesOfDeposit:
-            merged_response.certificatesOfDeposit.extend(response.certificatesOfDeposit)
-        if response.individualRetirementAccounts:
-            merged_response.individualRetirementAccounts.extend(response.individualRetirementAccounts)
-        if response.loans:
-            merged_response.loans.extend(response.loans)
-        if response.creditCards:
-            merged_response.creditCards.extend(response.creditCards)
-        if response.fees:
-            merged_response.fees.extend(response.fees)
+    # Merge all responses into a single BankResponse
+    with span("merge", responses=len(rule_responses) + len(url_responses)) as merge_span:
+        merger = BankResponseMerger().add_all(rule_responses, "rules").add_all(url_responses, "llm")
+        merged_response = merger.result()
+        merge_span.set(duplicates=merger.duplicates)
+    if stats is not None:
+        stats.product_sources = merger.sources()
 
     return merged_response
 
@@ -0,0 +1,110 @@
+# fetch_state.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+from .cache import normalize_chunk
+from .models import BankResponse
+
+class PageState(NamedTuple):
+    """
+    What was learned the last time a URL was fetched and extracted.
+    """
+    etag: Optional[str]
+    last_modified: Optional[str]
+    # hash_csv_tables of the page's tables
+    csv_hash: str
+    # The model and prompt version that produced bank_response_json
+    extractor: str
+    bank_response_json: str
+
+    def bank_response(self) -> BankResponse:
+        return BankResponse.model_validate_json(self.bank_response_json)
+
+def hash_csv_tables(csv_tables: List[str]) -> str:
+    """
+    Hashes a page's CSV tables, ignoring cosmetic whitespace changes.
+
+    Args:
+        csv_tables (List[str]): The page's tables as CSV strings.
+
+    Returns:
+        str: A SHA-256 hex digest of the normalized tables.
+    """
+    digest = hashlib.sha256()
+    for csv_table in csv_tables:
+        digest.update(normalize_chunk(csv_table).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class FetchStateStore:
+    """
+    Per-URL fetch metadata and last extraction result, stored in a SQLite database.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fetch_state ("
+                " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, csv_hash TEXT NOT NULL,"
+                " extractor TEXT NOT NULL, bank_response TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def get(self, url: str, extractor: str) -> Optional[PageState]:
+        """
+        Returns the stored state for url, or None if there is none or it was produced
+        by a different model or prompt version.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, csv_hash, extractor, bank_response FROM fetch_state WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        state = PageState(*row)
+        if state.extractor != extractor:
+            return None
+        return state
+
+    def put(self, url: str, state: PageState) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fetch_state"
+                " (url, etag, last_modified, csv_hash, extractor, bank_response, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, *state, time.time())
+            )
+
+_fetch_state_store: Optional[FetchStateStore] = None
+_fetch_state_store_lock = threading.Lock()
+
+def get_fetch_state_store() -> Optional[FetchStateStore]:
+    """
+    Returns the process-wide fetch state store, creating it on first use.
+
+    Returns:
+        Optional[FetchStateStore]: The store, or None if FETCH_STATE_BACKEND is 'none'.
+    """
+    global _fetch_state_store
+    with _fetch_state_store_lock:
+        if _fetch_state_store is None:
+            backend = os.getenv("FETCH_STATE_BACKEND", "sqlite")
+            if backend == "none":
+                return None
+            if backend != "sqlite":
+                raise ValueError(f"Unknown fetch state backend: {backend}")
+            path = os.getenv("FETCH_STATE_PATH", "/tmp/bank-rate-collector/fetch_state.sqlite3")
+            _fetch_state_store = FetchStateStore(path)
+        return _fetch_state_store
+
+# Define module exports
+__all__ = ['PageState', 'FetchStateStore', 'hash_csv_tables', 'get_fetch_state_store']
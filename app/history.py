@@ -0,0 +1,477 @@
+# history.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import typing
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+from .cache import DynamoDBKeyValueStore, KeyValueCacheBackend, KeyValueStore, LocalKeyValueStore, S3KeyValueStore
+from .domains import root_domain
+from .merge import NAME_FIELDS, BankResponseMerger, product_fields
+from .models import BankRates, BankResponse, RateBankSummary, RatePoint, RateSeries
+
+# BankResponse list field -> product model; each has its own table
+PRODUCT_MODELS = product_fields()
+
+def column_type(annotation: Any) -> str:
+    """
+    Returns the SQLite column type for a product field annotation. Fields that may hold
+    more than one type, like a loan term of 60 or "Variable", get no type so SQLite
+    keeps each value as it was given.
+    """
+    types = {arg for arg in (typing.get_args(annotation) or (annotation,)) if arg is not type(None)}
+    if types == {float}:
+        return 'REAL'
+    if types in ({int}, {bool}):
+        return 'INTEGER'
+    if types == {str}:
+        return 'TEXT'
+    return ''
+
+def numeric_fields(model: Type[BaseModel]) -> List[str]:
+    """
+    Returns the rate and amount fields of a product model, e.g. annualPercentageYield.
+    """
+    return [name for name, field in model.model_fields.items() if column_type(field.annotation) == 'REAL']
+
+def label_field(model: Type[BaseModel]) -> str:
+    """
+    Returns the field a product is looked up by: its name, or its term for CDs and IRAs.
+    """
+    return next(name for name in NAME_FIELDS if name in model.model_fields)
+
+def quote_columns(names: List[str]) -> str:
+    return ", ".join(f'"{name}"' for name in names)
+
+def hash_bank_response(bank_response: BankResponse) -> str:
+    return hashlib.sha256(bank_response.model_dump_json().encode('utf-8')).hexdigest()
+
+def series_model(product_type: str, field: str) -> Type[BaseModel]:
+    """
+    Returns the product model of a series query.
+
+    Raises:
+        ValueError: If product_type is not a product list or field is not one of its rate or amount fields.
+    """
+    model = PRODUCT_MODELS.get(product_type)
+    if model is None:
+        raise ValueError(f"Unknown product type: {product_type}")
+    if field not in numeric_fields(model):
+        raise ValueError(f"{product_type} has no rate or amount field {field}")
+    return model
+
+class RateHistoryStore(ABC):
+    """
+    Interface for the history of extracted rates. Each distinct result for a URL is an
+    observation, first seen at observed_at and last seen at checked_at.
+    """
+
+    @abstractmethod
+    def record(self, url: str, bank_response: BankResponse, observed_at: Optional[float] = None) -> bool:
+        """
+        Appends a URL's extraction result, unless it is the same as the URL's last one.
+
+        Args:
+            url (str): The page the result was extracted from.
+            bank_response (BankResponse): The extracted products.
+            observed_at (Optional[float]): When the result was extracted; defaults to now.
+
+        Returns:
+            bool: True if a new observation was stored, False if only its checked_at was updated.
+        """
+
+    @abstractmethod
+    def banks(self) -> List[RateBankSummary]:
+        """
+        Returns each bank with stored rates and when they were last observed and checked.
+        """
+
+    @abstractmethod
+    def latest(self, bank: str) -> Optional[BankRates]:
+        """
+        Returns a bank's current rates: the latest result of each of its URLs, merged.
+        Banks are keyed by root domain, so 'www.bank.com' finds 'bank.com'.
+        """
+
+    @abstractmethod
+    def series(
+        self,
+        bank: str,
+        product_type: str,
+        name: str,
+        field: str = 'annualPercentageYield',
+        since: Optional[float] = None,
+        until: Optional[float] = None
+    ) -> RateSeries:
+        """
+        Returns how one field of a bank's product changed over time, e.g. the APY of its
+        "12 Month Certificate". Products are matched by name (or term for CDs and IRAs),
+        ignoring case.
+
+        Args:
+            bank (str): The bank's root domain.
+            product_type (str): The BankResponse list, e.g. 'certificatesOfDeposit'.
+            name (str): The product's name or term.
+            field (str): The rate or amount field to return.
+            since (Optional[float]): Only observations at or after this time.
+            until (Optional[float]): Only observations at or before this time.
+
+        Raises:
+            ValueError: If product_type is not a product list or field is not one of its rate or amount fields.
+        """
+
+    def close(self) -> None:
+        pass
+
+class SQLiteRateHistoryStore(RateHistoryStore):
+    """
+    Extracted rates over time, stored as typed rows in a SQLite database.
+
+    Each distinct result for a URL is an observation (bank, URL, when it was first and
+    last seen); its products are rows in one table per product type, with a column per
+    model field. A result that is the same as the URL's previous one only moves that
+    observation's checked_at forward, so rates that never change take no extra space.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS observations ("
+                " id INTEGER PRIMARY KEY, bank TEXT NOT NULL, url TEXT NOT NULL,"
+                " observed_at REAL NOT NULL, checked_at REAL NOT NULL, response_hash TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS observations_bank ON observations (bank)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS observations_url ON observations (url)")
+            for table, model in PRODUCT_MODELS.items():
+                self._create_product_table(table, model)
+
+    def _create_product_table(self, table: str, model: Type[BaseModel]) -> None:
+        # Caller must hold lock
+        columns = ", ".join(f'"{name}" {column_type(field.annotation)}'.rstrip() for name, field in model.model_fields.items())
+        self._conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{table}" ('
+            f' observation_id INTEGER NOT NULL REFERENCES observations (id), position INTEGER NOT NULL, {columns})'
+        )
+        self._conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_observation" ON "{table}" (observation_id)')
+        # Fields added to the model since the table was created
+        existing = {row[1] for row in self._conn.execute(f'PRAGMA table_info("{table}")')}
+        for name, field in model.model_fields.items():
+            if name not in existing:
+                self._conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{name}" {column_type(field.annotation)}')
+
+    def record(self, url: str, bank_response: BankResponse, observed_at: Optional[float] = None) -> bool:
+        observed_at = time.time() if observed_at is None else observed_at
+        response_hash = hash_bank_response(bank_response)
+        with self._lock, self._conn:
+            last = self._conn.execute(
+                "SELECT id, response_hash FROM observations WHERE url = ? ORDER BY id DESC LIMIT 1", (url,)
+            ).fetchone()
+            if last is not None and last[1] == response_hash:
+                self._conn.execute("UPDATE observations SET checked_at = ? WHERE id = ?", (observed_at, last[0]))
+                return False
+
+            observation_id = self._conn.execute(
+                "INSERT INTO observations (bank, url, observed_at, checked_at, response_hash) VALUES (?, ?, ?, ?, ?)",
+                (root_domain(bank_response.bankRootDomain), url, observed_at, observed_at, response_hash)
+            ).lastrowid
+            for table, model in PRODUCT_MODELS.items():
+                products = getattr(bank_response, table) or []
+                if not products:
+                    continue
+                names = list(model.model_fields)
+                self._conn.executemany(
+                    f'INSERT INTO "{table}" (observation_id, position, {quote_columns(names)})'
+                    f' VALUES (?, ?, {", ".join("?" for _ in names)})',
+                    ((observation_id, position, *(getattr(product, name) for name in names))
+                     for position, product in enumerate(products))
+                )
+            return True
+
+    def banks(self) -> List[RateBankSummary]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT bank, COUNT(DISTINCT url), MAX(observed_at), MAX(checked_at)"
+                " FROM observations GROUP BY bank ORDER BY bank"
+            ).fetchall()
+        return [RateBankSummary(bank=bank, urls=urls, observed_at=observed, checked_at=checked)
+                for bank, urls, observed, checked in rows]
+
+    def latest(self, bank: str) -> Optional[BankRates]:
+        """
+        Only the rows of the latest observations are read.
+        """
+        bank = root_domain(bank)
+        with self._lock:
+            observations = self._conn.execute(
+                "SELECT o.id, o.url, o.observed_at, o.checked_at FROM observations o"
+                " JOIN (SELECT MAX(id) AS id FROM observations WHERE bank = ? GROUP BY url) latest ON o.id = latest.id"
+                " ORDER BY o.url",
+                (bank,)
+            ).fetchall()
+            if not observations:
+                return None
+            ids = [row[0] for row in observations]
+            lists = {table: self._read_products(table, ids) for table in PRODUCT_MODELS}
+
+        merger = BankResponseMerger()
+        for observation_id in ids:
+            merger.add(BankResponse.model_validate({
+                'bankRootDomain': bank,
+                **{table: products.get(observation_id, []) for table, products in lists.items()},
+            }))
+        return BankRates(
+            bank=bank,
+            urls=[row[1] for row in observations],
+            observed_at=max(row[2] for row in observations),
+            checked_at=max(row[3] for row in observations),
+            bank_response=merger.result(),
+        )
+
+    def _read_products(self, table: str, observation_ids: List[int]) -> Dict[int, List[Dict]]:
+        # Caller must hold lock
+        names = list(PRODUCT_MODELS[table].model_fields)
+        cursor = self._conn.execute(
+            f'SELECT observation_id, {quote_columns(names)} FROM "{table}"'
+            f' WHERE observation_id IN ({", ".join("?" for _ in observation_ids)}) ORDER BY observation_id, position',
+            observation_ids
+        )
+        products: Dict[int, List[Dict]] = {}
+        for row in cursor:
+            products.setdefault(row[0], []).append(dict(zip(names, row[1:])))
+        return products
+
+    def series(
+        self,
+        bank: str,
+        product_type: str,
+        name: str,
+        field: str = 'annualPercentageYield',
+        since: Optional[float] = None,
+        until: Optional[float] = None
+    ) -> RateSeries:
+        bank = root_domain(bank)
+        model = series_model(product_type, field)
+        label = label_field(model)
+        term = 'p."term"' if 'term' in model.model_fields else 'NULL'
+
+        query = (
+            f'SELECT o.url, o.observed_at, o.checked_at, p."{label}", {term}, p."{field}"'
+            f' FROM "{product_type}" p JOIN observations o ON o.id = p.observation_id'
+            f' WHERE o.bank = ? AND p."{label}" = ? COLLATE NOCASE'
+        )
+        params: List[Any] = [bank, name.strip()]
+        if since is not None:
+            query += " AND o.observed_at >= ?"
+            params.append(since)
+        if until is not None:
+            query += " AND o.observed_at <= ?"
+            params.append(until)
+        query += " ORDER BY o.id, p.position"
+
+        with self._lock:
+            points = [
+                RatePoint(url=url, observed_at=observed, checked_at=checked, name=product_name,
+                          term=product_term, value=value)
+                for url, observed, checked, product_name, product_term, value in self._conn.execute(query, params)
+            ]
+        return RateSeries(bank=bank, product_type=product_type, name=name, field=field, points=points)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class KeyValueRateHistoryStore(RateHistoryStore):
+    """
+    Extracted rates over time, stored as JSON items in a key-value store such as DynamoDB
+    or S3, so all Lambda instances and the job worker share one history.
+
+    Each URL's item holds its latest observation and how many came before it; when a
+    different result is recorded, the latest observation moves to an item of its own,
+    numbered in order. A bank's set lists its URLs, and one set lists the banks; members
+    are added atomically, so concurrent workers never drop each other's banks or URLs.
+    Writes of the same URL are not serialized, so of two different results recorded for
+    a URL at the same moment one may be lost.
+    """
+
+    BANKS_KEY = "history:banks"
+
+    def __init__(self, store: KeyValueStore):
+        self.store = store
+        self.backend = KeyValueCacheBackend(store)
+
+    def _get(self, key: str) -> Optional[Dict]:
+        value = self.backend.get(key)
+        return json.loads(value) if value is not None else None
+
+    def _put(self, key: str, item: Dict) -> None:
+        self.backend.set(key, json.dumps(item))
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        return f"history:url:{hashlib.sha256(url.encode('utf-8')).hexdigest()}"
+
+    def _index(self, key: str) -> List[str]:
+        return self.store.set_members(key)
+
+    def record(self, url: str, bank_response: BankResponse, observed_at: Optional[float] = None) -> bool:
+        observed_at = time.time() if observed_at is None else observed_at
+        response_hash = hash_bank_response(bank_response)
+        bank = root_domain(bank_response.bankRootDomain)
+        key = self._url_key(url)
+        item = self._get(key)
+        if item is not None and item['latest']['response_hash'] == response_hash:
+            item['latest']['checked_at'] = observed_at
+            self._put(key, item)
+            return False
+
+        if item is None:
+            item = {'url': url, 'count': 0}
+        else:
+            self._put(f"{key}:{item['count']}", item['latest'])
+            item['count'] += 1
+        self.store.add_to_set(self.BANKS_KEY, bank)
+        self.store.add_to_set(f"history:bank:{bank}", url)
+        item['latest'] = {
+            'bank': bank,
+            'observed_at': observed_at,
+            'checked_at': observed_at,
+            'response_hash': response_hash,
+            'response': bank_response.model_dump(mode='json'),
+        }
+        self._put(key, item)
+        return True
+
+    def _latest_observations(self, bank: str) -> List[Dict]:
+        """
+        Returns the latest observation of each of the bank's URLs, by URL.
+        """
+        observations = []
+        for url in self._index(f"history:bank:{bank}"):
+            item = self._get(self._url_key(url))
+            if item is not None and item['latest']['bank'] == bank:
+                observations.append(dict(item['latest'], url=url))
+        return observations
+
+    def banks(self) -> List[RateBankSummary]:
+        summaries = []
+        for bank in self._index(self.BANKS_KEY):
+            observations = self._latest_observations(bank)
+            if observations:
+                summaries.append(RateBankSummary(
+                    bank=bank,
+                    urls=len(observations),
+                    observed_at=max(observation['observed_at'] for observation in observations),
+                    checked_at=max(observation['checked_at'] for observation in observations),
+                ))
+        return summaries
+
+    def latest(self, bank: str) -> Optional[BankRates]:
+        bank = root_domain(bank)
+        observations = self._latest_observations(bank)
+        if not observations:
+            return None
+        merger = BankResponseMerger()
+        for observation in observations:
+            merger.add(BankResponse.model_validate(observation['response']))
+        return BankRates(
+            bank=bank,
+            urls=[observation['url'] for observation in observations],
+            observed_at=max(observation['observed_at'] for observation in observations),
+            checked_at=max(observation['checked_at'] for observation in observations),
+            bank_response=merger.result(),
+        )
+
+    def series(
+        self,
+        bank: str,
+        product_type: str,
+        name: str,
+        field: str = 'annualPercentageYield',
+        since: Optional[float] = None,
+        until: Optional[float] = None
+    ) -> RateSeries:
+        """
+        Reads every observation of the bank's URLs, one item each.
+        """
+        bank = root_domain(bank)
+        label = label_field(series_model(product_type, field))
+        wanted = name.strip().lower()
+        points = []
+        for url in self._index(f"history:bank:{bank}"):
+            key = self._url_key(url)
+            item = self._get(key)
+            if item is None:
+                continue
+            observations = [self._get(f"{key}:{index}") for index in range(item['count'])] + [item['latest']]
+            for observation in observations:
+                if observation is None or observation['bank'] != bank:
+                    continue
+                if since is not None and observation['observed_at'] < since:
+                    continue
+                if until is not None and observation['observed_at'] > until:
+                    continue
+                for product in observation['response'].get(product_type) or []:
+                    if product.get(label) is not None and str(product[label]).lower() == wanted:
+                        points.append(RatePoint(
+                            url=url, observed_at=observation['observed_at'], checked_at=observation['checked_at'],
+                            name=product[label], term=product.get('term'), value=product.get(field)
+                        ))
+        points.sort(key=lambda point: point.observed_at)
+        return RateSeries(bank=bank, product_type=product_type, name=name, field=field, points=points)
+
+def create_history_store(name: str) -> Optional[RateHistoryStore]:
+    """
+    Creates a rate history store from its name and the HISTORY_* environment variables.
+
+    Args:
+        name (str): One of 'sqlite', 'dynamodb', 's3', 'local-kv' or 'none'.
+
+    Returns:
+        Optional[RateHistoryStore]: The store, or None if the history is disabled.
+    """
+    if name == "none":
+        return None
+    if name == "sqlite":
+        return SQLiteRateHistoryStore(os.getenv("HISTORY_PATH", "/tmp/bank-rate-collector/rate_history.sqlite3"))
+    if name == "dynamodb":
+        return KeyValueRateHistoryStore(DynamoDBKeyValueStore(os.environ["HISTORY_TABLE"]))
+    if name == "s3":
+        return KeyValueRateHistoryStore(S3KeyValueStore(os.environ["HISTORY_BUCKET"], prefix='rate-history/'))
+    if name == "local-kv":
+        return KeyValueRateHistoryStore(LocalKeyValueStore())
+    raise ValueError(f"Unknown history backend: {name}")
+
+_history_store: Optional[RateHistoryStore] = None
+_history_store_lock = threading.Lock()
+
+def get_history_store() -> Optional[RateHistoryStore]:
+    """
+    Returns the process-wide rate history store, creating it on first use.
+
+    Returns:
+        Optional[RateHistoryStore]: The store, or None if HISTORY_BACKEND is 'none'.
+    """
+    global _history_store
+    with _history_store_lock:
+        if _history_store is None:
+            store = create_history_store(os.getenv("HISTORY_BACKEND", "sqlite"))
+            if store is None:
+                return None
+            _history_store = store
+        return _history_store
+
+# Define module exports
+__all__ = [
+    'KeyValueRateHistoryStore', 'RateHistoryStore', 'SQLiteRateHistoryStore', 'create_history_store', 'get_history_store',
+]
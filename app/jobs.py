@@ -0,0 +1,508 @@
+# jobs.py
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+from pydantic import BaseModel, Field
+
+from .cache import CacheBackend, DynamoDBKeyValueStore, KeyValueCacheBackend, LocalKeyValueStore, S3KeyValueStore
+from .extract import MAX_CHUNK_TOKENS, build_chunks, extract_chunks_concurrently
+from .fetch_state import get_fetch_state_store, hash_csv_tables
+from .merge import BankResponseMerger
+from .models import BankResponse, ExtractionStats, JobResponse
+from .pipeline import fetch_with_state, load_page_state, save_page_state, unchanged_result
+from .relevance import filter_tables
+from .rules import extract_tables_with_rules
+from .scrape import FetchedPage, html_to_csv_tables
+
+# How many times a job is attempted before it is marked failed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# How long finished jobs and their chunk results are kept
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", str(24 * 3600)))
+# Seconds before the in-process queue retries a job that did not finish
+JOB_RETRY_DELAY_SECONDS = float(os.getenv("JOB_RETRY_DELAY_SECONDS", "5"))
+# Jobs run at once by the in-process and local SQS workers
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# How long a received message is hidden from other workers, as in SQS. A running job
+# whose record was updated more recently than this is left to the worker running it.
+JOB_VISIBILITY_TIMEOUT_SECONDS = float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "300"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+class JobRecord(BaseModel):
+    """
+    The stored state of a job. Chunk inputs and results are stored separately, so the
+    record stays small however large the page is.
+    """
+
+    job_id: str
+    url: str
+    status: str = JOB_QUEUED
+    attempts: int = 0
+    # The number of chunks to extract, fixed on the first attempt so later attempts resume by index
+    chunk_count: Optional[int] = None
+    # The products of the tables extracted by the rules on the first attempt
+    rules_response_json: Optional[str] = None
+    # Validators and table hash of the fetched page, for the fetch state store
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    csv_hash: Optional[str] = None
+    bank_response_json: Optional[str] = None
+    error: Optional[str] = None
+    stats: ExtractionStats = Field(default_factory=ExtractionStats)
+    created_at: float = Field(default_factory=time.time)
+    updated_at: float = Field(default_factory=time.time)
+
+class JobStore:
+    """
+    Stores job records and per-chunk inputs and results in a cache backend, under 'job:' keys.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    def create(self, url: str) -> JobRecord:
+        job = JobRecord(job_id=uuid.uuid4().hex, url=url)
+        self.save(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        value = self.backend.get(f"job:{job_id}")
+        return JobRecord.model_validate_json(value) if value is not None else None
+
+    def save(self, job: JobRecord) -> None:
+        job.updated_at = time.time()
+        self.backend.set(f"job:{job.job_id}", job.model_dump_json())
+
+    def save_chunk_inputs(self, job_id: str, chunks: List[str]) -> None:
+        for index, chunk in enumerate(chunks):
+            self.backend.set(f"job:{job_id}:input:{index}", chunk)
+
+    def load_chunk_input(self, job_id: str, index: int) -> str:
+        value = self.backend.get(f"job:{job_id}:input:{index}")
+        if value is None:
+            raise JobFailed(f"Chunk {index} of job {job_id} is missing from the job store")
+        return value
+
+    def save_chunk_result(self, job_id: str, index: int, response: BankResponse) -> None:
+        self.backend.set(f"job:{job_id}:chunk:{index}", response.model_dump_json())
+
+    def load_chunk_results(self, job_id: str, count: int) -> Dict[int, BankResponse]:
+        """
+        Returns the saved result of each finished chunk, by chunk index.
+        """
+        results = {}
+        for index in range(count):
+            value = self.backend.get(f"job:{job_id}:chunk:{index}")
+            if value is not None:
+                results[index] = BankResponse.model_validate_json(value)
+        return results
+
+    def response(self, job: JobRecord) -> JobResponse:
+        """
+        Builds the API view of a job, merging the chunks finished so far into a partial result.
+        """
+        chunks = job.chunk_count or 0
+        if job.bank_response_json is not None:
+            bank_response = BankResponse.model_validate_json(job.bank_response_json)
+            chunks_done = chunks
+        else:
+            results = self.load_chunk_results(job.job_id, chunks)
+            bank_response = merge_job_results(job, results).result() if results or job.rules_response_json else None
+            chunks_done = len(results)
+        return JobResponse(
+            job_id=job.job_id,
+            url=job.url,
+            status=job.status,
+            attempts=job.attempts,
+            chunks=chunks,
+            chunks_done=chunks_done,
+            bank_response=bank_response,
+            error=job.error,
+            stats=job.stats,
+            created_at=job.created_at,
+            updated_at=job.updated_at
+        )
+
+def merge_job_results(job: JobRecord, results: Dict[int, BankResponse]) -> BankResponseMerger:
+    """
+    Merges the job's rule extraction and its finished chunks, in chunk order.
+    """
+    merger = BankResponseMerger()
+    if job.rules_response_json is not None:
+        merger.add(BankResponse.model_validate_json(job.rules_response_json), "rules")
+    for index in sorted(results):
+        merger.add(results[index], "llm")
+    return merger
+
+class JobFailed(Exception):
+    """
+    A job failed in a way that retrying will not fix, e.g. the page has no rate tables.
+    """
+
+def prepare_job(job: JobRecord, store: JobStore, stats: ExtractionStats) -> bool:
+    """
+    Fetches and chunks the job's page on its first attempt, saving the chunks in the job store.
+
+    Returns:
+        bool: False if the page is unchanged and the job was completed from the stored result.
+    """
+    fetch_state = get_fetch_state_store()
+    state = load_page_state(fetch_state, job.url)
+    page = fetch_with_state(job.url, state)
+    if page.not_modified:
+        _, bank_response, _, unchanged_stats = unchanged_result(job.url, fetch_state, state, page)
+        job.chunk_count, job.stats, job.bank_response_json = 0, unchanged_stats, bank_response.model_dump_json()
+        return False
+    if page.html is None:
+        raise RuntimeError(f"Failed to retrieve tables from {job.url}")
+
+    csv_tables = html_to_csv_tables(job.url, page.html)
+    if not csv_tables:
+        raise JobFailed(f"No tables found at {job.url}")
+
+    csv_hash = hash_csv_tables(csv_tables)
+    if state is not None and state.csv_hash == csv_hash:
+        _, bank_response, _, unchanged_stats = unchanged_result(job.url, fetch_state, state, page)
+        job.chunk_count, job.stats, job.bank_response_json = 0, unchanged_stats, bank_response.model_dump_json()
+        return False
+
+    csv_tables, _ = filter_tables(csv_tables, stats=stats)
+    if not csv_tables:
+        raise JobFailed(f"No rate tables found at {job.url}")
+
+    rule_responses, csv_tables = extract_tables_with_rules(csv_tables, stats=stats)
+    if rule_responses:
+        job.rules_response_json = BankResponseMerger().add_all(rule_responses).result().model_dump_json()
+    chunks = build_chunks(csv_tables, MAX_CHUNK_TOKENS)
+    # Saved before the record refers to them
+    store.save_chunk_inputs(job.job_id, chunks)
+    job.chunk_count = len(chunks)
+    job.etag, job.last_modified, job.csv_hash = page.etag, page.last_modified, csv_hash
+    return True
+
+def run_job(
+    job_id: str,
+    store: Optional[JobStore] = None,
+    max_attempts: int = JOB_MAX_ATTEMPTS,
+    lease_seconds: float = JOB_VISIBILITY_TIMEOUT_SECONDS
+) -> bool:
+    """
+    Runs one attempt of a job, saving each chunk's result as soon as it is extracted.
+
+    Chunks saved by earlier attempts are not extracted again, so a retried job resumes
+    where the last attempt stopped.
+
+    Args:
+        job_id (str): The job to run.
+        store (Optional[JobStore]): The job store; defaults to the process-wide store.
+        max_attempts (int): Attempts after which an unfinished job is marked failed.
+        lease_seconds (float): How long a running job's last update keeps other workers off it.
+
+    Returns:
+        bool: True if the job is finished (succeeded or failed) and should not be retried.
+    """
+    store = store or get_job_store()
+    job = store.get(job_id)
+    if job is None or job.status in (JOB_SUCCEEDED, JOB_FAILED):
+        return True
+    if job.status == JOB_RUNNING and time.time() - job.updated_at < lease_seconds:
+        # Another worker is still running it; try again after it finishes or goes quiet
+        return False
+
+    job.status = JOB_RUNNING
+    job.attempts += 1
+    store.save(job)
+
+    # Retry, cache and client counts add up over the attempts; the chunk counts are set
+    # from the saved results below
+    stats = job.stats
+    done: Dict[int, BankResponse] = {}
+    try:
+        if job.chunk_count is None and not prepare_job(job, store, stats):
+            job.status, job.error = JOB_SUCCEEDED, None
+            store.save(job)
+            return True
+        store.save(job)
+
+        done = store.load_chunk_results(job.job_id, job.chunk_count)
+        pending = [index for index in range(job.chunk_count) if index not in done]
+        inputs = [store.load_chunk_input(job.job_id, index) for index in pending]
+
+        def save_chunk(position: int, response: BankResponse) -> None:
+            done[pending[position]] = response
+            store.save_chunk_result(job.job_id, pending[position], response)
+            # Also renews this worker's lease on the job
+            store.save(job)
+
+        extract_chunks_concurrently(inputs, stats=stats, on_chunk_done=save_chunk)
+    except JobFailed as e:
+        job.status, job.error = JOB_FAILED, str(e)
+        store.save(job)
+        return True
+    except Exception as e:
+        print(f"Job {job.job_id} attempt {job.attempts} failed: {e}")
+        job.error = str(e)
+
+    if job.chunk_count is not None:
+        stats.chunks, stats.failed_chunks = job.chunk_count, job.chunk_count - len(done)
+
+    if job.chunk_count is not None and len(done) == job.chunk_count:
+        merger = merge_job_results(job, done)
+        bank_response = merger.result()
+        stats.product_sources = merger.sources()
+        job.bank_response_json = bank_response.model_dump_json()
+        job.status, job.error = JOB_SUCCEEDED, None
+        page = FetchedPage(None, etag=job.etag, last_modified=job.last_modified)
+        save_page_state(get_fetch_state_store(), job.url, page, job.csv_hash, bank_response, ExtractionStats())
+        store.save(job)
+        return True
+
+    if job.chunk_count is not None:
+        job.error = f"{job.chunk_count - len(done)} of {job.chunk_count} chunks failed extraction."
+    finished = job.attempts >= max_attempts
+    job.status = JOB_FAILED if finished else JOB_QUEUED
+    store.save(job)
+    return finished
+
+class JobQueue(ABC):
+    """
+    Interface for delivering job ids to workers.
+    """
+
+    @abstractmethod
+    def send(self, job_id: str) -> None:
+        """
+        Queues a job to be run by a worker.
+        """
+
+class InProcessJobQueue(JobQueue):
+    """
+    Runs jobs on a thread pool in this process, retrying unfinished jobs after a delay.
+
+    For local development only: on Lambda the process is frozen after the response.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, retry_delay_seconds: float = JOB_RETRY_DELAY_SECONDS):
+        self.retry_delay_seconds = retry_delay_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job-worker')
+
+    def send(self, job_id: str) -> None:
+        self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id: str) -> None:
+        try:
+            finished = run_job(job_id)
+        except Exception as e:
+            print(f"Job {job_id} could not be run: {e}")
+            finished = False
+        if not finished:
+            timer = threading.Timer(self.retry_delay_seconds, self.send, args=(job_id,))
+            timer.daemon = True
+            timer.start()
+
+class JobMessage(NamedTuple):
+    job_id: str
+    receipt_handle: str
+
+class PollingJobQueue(JobQueue):
+    """
+    SQS-style queue: received messages are hidden for a visibility timeout and are
+    delivered again unless deleted, so a worker that dies mid-job is retried.
+    """
+
+    @abstractmethod
+    def receive(self, max_messages: int = 1, wait_seconds: float = 0) -> List[JobMessage]:
+        """
+        Returns up to max_messages messages, waiting up to wait_seconds for one to arrive.
+        """
+
+    @abstractmethod
+    def delete(self, message: JobMessage) -> None:
+        """
+        Deletes a handled message so it is not delivered again.
+        """
+
+class SQSJobQueue(PollingJobQueue):
+    """
+    Job queue backed by Amazon SQS.
+    """
+
+    def __init__(self, queue_url: str, region_name: Optional[str] = None):
+        import boto3
+        self._client = boto3.client('sqs', region_name=region_name)
+        self.queue_url = queue_url
+
+    def send(self, job_id: str) -> None:
+        self._client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps({'job_id': job_id}))
+
+    def receive(self, max_messages: int = 1, wait_seconds: float = 0) -> List[JobMessage]:
+        response = self._client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=max(1, min(max_messages, 10)),
+            WaitTimeSeconds=int(wait_seconds)
+        )
+        return [
+            JobMessage(json.loads(message['Body'])['job_id'], message['ReceiptHandle'])
+            for message in response.get('Messages', [])
+        ]
+
+    def delete(self, message: JobMessage) -> None:
+        self._client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message.receipt_handle)
+
+class LocalSQSJobQueue(PollingJobQueue):
+    """
+    In-memory stand-in for SQS with the same visibility timeout semantics, for local development.
+    """
+
+    def __init__(self, visibility_timeout_seconds: float = JOB_VISIBILITY_TIMEOUT_SECONDS):
+        self.visibility_timeout_seconds = visibility_timeout_seconds
+        # receipt handle -> (job id, time the message becomes visible)
+        self._messages: "OrderedDict[str, tuple]" = OrderedDict()
+        self._condition = threading.Condition()
+
+    def send(self, job_id: str) -> None:
+        with self._condition:
+            self._messages[uuid.uuid4().hex] = (job_id, 0.0)
+            self._condition.notify()
+
+    def receive(self, max_messages: int = 1, wait_seconds: float = 0) -> List[JobMessage]:
+        deadline = time.monotonic() + wait_seconds
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                received = []
+                for receipt, (job_id, visible_at) in list(self._messages.items()):
+                    if visible_at <= now and len(received) < max_messages:
+                        # Redeliveries get a new receipt handle, as in SQS
+                        del self._messages[receipt]
+                        receipt = uuid.uuid4().hex
+                        self._messages[receipt] = (job_id, now + self.visibility_timeout_seconds)
+                        received.append(JobMessage(job_id, receipt))
+                if received or now >= deadline:
+                    return received
+                self._condition.wait(min(deadline - now, 1.0))
+
+    def delete(self, message: JobMessage) -> None:
+        with self._condition:
+            self._messages.pop(message.receipt_handle, None)
+
+def run_queue_worker(queue: PollingJobQueue, stop: threading.Event, wait_seconds: float = 5) -> None:
+    """
+    Receives and runs jobs until stop is set. Messages of unfinished jobs are left on
+    the queue to be delivered again after the visibility timeout.
+    """
+    while not stop.is_set():
+        for message in queue.receive(max_messages=1, wait_seconds=wait_seconds):
+            try:
+                finished = run_job(message.job_id)
+            except Exception as e:
+                print(f"Job {message.job_id} could not be run: {e}")
+                finished = False
+            if finished:
+                queue.delete(message)
+
+def handle_sqs_event(event: Dict, context=None) -> Dict:
+    """
+    Lambda handler for an SQS event source mapping with ReportBatchItemFailures.
+
+    Messages of unfinished jobs are reported as failures so SQS delivers them again.
+    """
+    failures = []
+    for record in event.get('Records', []):
+        try:
+            finished = run_job(json.loads(record['body'])['job_id'])
+        except Exception as e:
+            print(f"Job message {record.get('messageId')} could not be run: {e}")
+            finished = False
+        if not finished:
+            failures.append({'itemIdentifier': record['messageId']})
+    return {'batchItemFailures': failures}
+
+def create_job_store(name: str) -> JobStore:
+    """
+    Creates a job store from its name and the JOB_* environment variables.
+
+    Args:
+        name (str): One of 'memory', 'dynamodb' or 's3'.
+    """
+    if name == "memory":
+        return JobStore(KeyValueCacheBackend(LocalKeyValueStore(), JOB_TTL_SECONDS))
+    if name == "dynamodb":
+        return JobStore(KeyValueCacheBackend(DynamoDBKeyValueStore(os.environ["JOB_TABLE"]), JOB_TTL_SECONDS))
+    if name == "s3":
+        return JobStore(KeyValueCacheBackend(S3KeyValueStore(os.environ["JOB_BUCKET"], prefix='jobs/'), JOB_TTL_SECONDS))
+    raise ValueError(f"Unknown job store backend: {name}")
+
+def create_job_queue(name: str) -> JobQueue:
+    """
+    Creates a job queue from its name and the JOB_* environment variables. The local
+    SQS stand-in gets JOB_WORKERS background worker threads in this process.
+
+    Args:
+        name (str): One of 'inprocess', 'sqs' or 'local-sqs'.
+    """
+    if name == "inprocess":
+        return InProcessJobQueue()
+    if name == "sqs":
+        return SQSJobQueue(os.environ["JOB_QUEUE_URL"])
+    if name == "local-sqs":
+        queue = LocalSQSJobQueue()
+        stop = threading.Event()
+        for index in range(JOB_WORKERS):
+            threading.Thread(target=run_queue_worker, args=(queue, stop, 1.0), name=f'job-worker-{index}', daemon=True).start()
+        return queue
+    raise ValueError(f"Unknown job queue backend: {name}")
+
+_job_store: Optional[JobStore] = None
+_job_queue: Optional[JobQueue] = None
+_jobs_lock = threading.Lock()
+
+def get_job_store() -> JobStore:
+    """
+    Returns the process-wide job store, selected by JOB_STORE_BACKEND (default 'memory').
+    """
+    global _job_store
+    with _jobs_lock:
+        if _job_store is None:
+            _job_store = create_job_store(os.getenv("JOB_STORE_BACKEND", "memory"))
+        return _job_store
+
+def get_job_queue() -> JobQueue:
+    """
+    Returns the process-wide job queue, selected by JOB_QUEUE_BACKEND (default 'inprocess').
+    """
+    global _job_queue
+    with _jobs_lock:
+        if _job_queue is None:
+            _job_queue = create_job_queue(os.getenv("JOB_QUEUE_BACKEND", "inprocess"))
+        return _job_queue
+
+def submit_job(url: str) -> JobResponse:
+    """
+    Creates a job for url and queues it.
+    """
+    store = get_job_store()
+    job = store.create(url)
+    get_job_queue().send(job.job_id)
+    return store.response(job)
+
+def get_job(job_id: str) -> Optional[JobResponse]:
+    """
+    Returns a job's status and its partial or final result, or None if it does not exist.
+    """
+    store = get_job_store()
+    job = store.get(job_id)
+    return store.response(job) if job is not None else None
+
+# Define module exports
+__all__ = ['submit_job', 'get_job', 'run_job', 'handle_sqs_event', 'JobStore', 'JobQueue', 'InProcessJobQueue', 'SQSJobQueue', 'LocalSQSJobQueue']
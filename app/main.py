@@ -1,13 +1,19 @@
 # app/main.py
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional
-from app.scrape import scrape_single_url
-from app.extract import process_and_extract_tables_single
-from app.models import BankResponse
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from app.pipeline import PROCESSING_FAILED_ERROR, extract_url_coalesced, run_batch_pipeline
+from app.jobs import get_job, submit_job
+from app.history import get_history_store
+from app.crawl import CRAWL_DEPTH_LIMIT, CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES, crawl_site
+from app.browser import prewarm_browser_pool_in_background
+from app.metrics import render_metrics, span, start_trace
+from app.models import BankRates, BankResponse, CrawlResponse, ExtractionStats, JobResponse, RateBankSummary, RateSeries, StageTiming
 from mangum import Mangum  # Import Mangum for AWS Lambda integration
 import logging
+import os
 from urllib.parse import urlparse
 
 # Configure logging
@@ -19,6 +25,13 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Start headless browsers during Lambda init if BROWSER_PREWARM is set
+prewarm_browser_pool_in_background()
+
+# Behind API Gateway the whole batch has to finish within the request timeout, so the
+# Lambda deployment allows far fewer URLs
+MAX_BATCH_URLS = int(os.getenv("MAX_BATCH_URLS", "500"))
+
 class ExtractionRequest(BaseModel):
     url: str
 
@@ -34,30 +47,156 @@ class ExtractionRequest(BaseModel):
 class ExtractionResponse(BaseModel):
     bank_response: Optional[BankResponse]
     error: Optional[str] = None
+    stats: Optional[ExtractionStats] = None
+    # Per-stage breakdown, returned when the request sets the X-Debug-Timing header
+    timing: Optional[List[StageTiming]] = None
+
+class BatchExtractionRequest(BaseModel):
+    urls: List[str] = Field(min_length=1, max_length=MAX_BATCH_URLS)
+
+class BatchExtractionResult(ExtractionResponse):
+    url: str
+
+class CrawlRequest(BaseModel):
+    # A URL or bare domain, usually the bank's home page
+    url: str
+    max_pages: int = Field(default=CRAWL_MAX_PAGES, ge=1, le=CRAWL_MAX_PAGES)
+    max_depth: int = Field(default=CRAWL_MAX_DEPTH, ge=0, le=CRAWL_DEPTH_LIMIT)
 
 @app.post("/extract", response_model=ExtractionResponse)
-def extract_bank_data(request: ExtractionRequest):
+def extract_bank_data(request: ExtractionRequest, x_debug_timing: Optional[str] = Header(default=None)):
     url = request.url  # str
     logger.info(f"Received request to scrape URL: {url}")
-    
-    csv_tables, error = scrape_single_url(url)
+
+    # Concurrent requests for the same URL share one scrape and extraction
+    with start_trace() as trace, span("request"):
+        (_, bank_response, error, stats), how = extract_url_coalesced(url)
+    if how != 'called':
+        logger.info(f"Returning the result of a {'concurrent' if how == 'coalesced' else 'recent'} extraction of URL {url}")
+    timing = trace.breakdown() if x_debug_timing and x_debug_timing.lower() not in ('0', 'false') else None
+
+    if not bank_response:
+        status_code = 500 if error == PROCESSING_FAILED_ERROR else 400
+        logger.error(f"Error processing URL {url}: {error}")
+        raise HTTPException(status_code=status_code, detail=error)
 
     if error:
-        logger.error(f"Error scraping URL {url}: {error}")
-        raise HTTPException(status_code=400, detail=error)
+        logger.warning(f"{error} URL: {url}")
+        return ExtractionResponse(bank_response=bank_response, error=error, stats=stats, timing=timing)
 
-    bank_response = process_and_extract_tables_single(csv_tables, chunk_size=5000)
+    if stats.unchanged_page:
+        logger.info(f"Page unchanged, returning stored data for URL {url}")
+    else:
+        logger.info(f"Successfully processed data for URL {url}")
+    return ExtractionResponse(bank_response=bank_response, stats=stats, timing=timing)
 
-    if not bank_response:
-        logger.error(f"Failed to process scraped data for URL {url}")
-        raise HTTPException(status_code=500, detail="Failed to process the scraped data.")
+@app.post("/extract/batch")
+def extract_bank_data_batch(request: BatchExtractionRequest):
+    """
+    Scrapes and extracts many URLs, streaming one NDJSON line per URL as each one finishes.
+    """
+    logger.info(f"Received batch request for {len(request.urls)} URLs")
 
-    logger.info(f"Successfully processed data for URL {url}")
-    return ExtractionResponse(bank_response=bank_response)
+    def stream_results():
+        for url, bank_response, error, stats in run_batch_pipeline(request.urls):
+            if error:
+                logger.error(f"Error processing URL {url}: {error}")
+            result = BatchExtractionResult(url=url, bank_response=bank_response, error=error, stats=stats)
+            yield result.model_dump_json() + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+def create_extraction_job(request: ExtractionRequest):
+    """
+    Queues an extraction and returns its job id immediately, for pages too large to
+    extract within the request timeout.
+    """
+    job = submit_job(request.url)
+    logger.info(f"Queued job {job.job_id} for URL: {request.url}")
+    return job
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+def get_extraction_job(job_id: str):
+    """
+    Returns a job's status and the merged result of the chunks extracted so far.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.post("/crawl", response_model=CrawlResponse)
+def crawl_bank_site(request: CrawlRequest):
+    """
+    Crawls a bank's site from its home page for rate pages, following the most
+    rate-related links first, and returns their merged rates.
+    """
+    logger.info(f"Received request to crawl: {request.url}")
+    try:
+        with start_trace(), span("request"):
+            result = crawl_site(request.url, max_pages=request.max_pages, max_depth=request.max_depth)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Without rates the pages crawled are still returned, to show where the crawl looked
+    if not result.bank_response:
+        logger.warning(f"{result.error} Pages: {[page.url for page in result.pages]}")
+        return result
+    rate_pages = [page.url for page in result.pages if page.status == 'rates']
+    logger.info(f"Crawled {result.pages_fetched} pages from {result.start_url}, rates found on {rate_pages}")
+    return result
+
+def require_history_store():
+    history = get_history_store()
+    if history is None:
+        raise HTTPException(status_code=404, detail="Rate history is disabled")
+    return history
+
+@app.get("/rates", response_model=List[RateBankSummary])
+def list_rate_banks():
+    """
+    Returns the banks in the rate history and when their rates last changed and were last checked.
+    """
+    return require_history_store().banks()
+
+@app.get("/rates/{bank}", response_model=BankRates)
+def get_latest_rates(bank: str):
+    """
+    Returns a bank's latest rates, merged across the pages they were extracted from.
+    """
+    rates = require_history_store().latest(bank)
+    if rates is None:
+        raise HTTPException(status_code=404, detail=f"No rates stored for {bank}")
+    return rates
+
+@app.get("/rates/{bank}/{product_type}/history", response_model=RateSeries)
+def get_rate_history(
+    bank: str,
+    product_type: str,
+    name: str = Query(description="The product's name, or its term for certificatesOfDeposit and individualRetirementAccounts."),
+    field: str = "annualPercentageYield",
+    since: Optional[float] = None,
+    until: Optional[float] = None
+):
+    """
+    Returns how one rate or amount of a bank's product changed over time, e.g. the APY of its 12 month CD.
+    """
+    try:
+        return require_history_store().series(bank, product_type, name, field=field, since=since, until=until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # Create Mangum handler for AWS Lambda
 handler = Mangum(app, lifespan="off")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Per-stage latency, byte, table, chunk, token and retry counters in the Prometheus text format.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Add a root route for health checks
 @app.get("/")
 def read_root():
@@ -0,0 +1,201 @@
+# merge.py
+import itertools
+import re
+import typing
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from .domains import root_domain
+from .models import BankResponse
+
+# Fields that name a product. Together with the product's required rate and amount
+# fields they identify it, so the same CD or fee extracted from two chunks is kept once.
+NAME_FIELDS = ('name', 'term')
+# Balance requirements that tell apart tiers of a product with the same name, term and
+# rate. A copy is merged into a kept product only if every tier it sets has the same value
+# there, so the tiers a product was first seen with never change.
+TIER_FIELDS = ('minimumBalanceToOpen', 'minimumBalanceToObtainAPY', 'minimumDailyBalance')
+
+# Stands for a tier a copy leaves null, which matches any value of the kept product
+_ANY_TIER = object()
+
+_WHITESPACE = re.compile(r'\s+')
+
+def _list_item_model(annotation: Any) -> Optional[Type[BaseModel]]:
+    """
+    Returns the model of a List[Model] or Optional[List[Model]] annotation, or None.
+    """
+    if typing.get_origin(annotation) in (list, List):
+        (item,) = typing.get_args(annotation)
+        return item if isinstance(item, type) and issubclass(item, BaseModel) else None
+    for arg in typing.get_args(annotation):
+        item = _list_item_model(arg)
+        if item is not None:
+            return item
+    return None
+
+def product_fields(model: Type[BaseModel] = BankResponse) -> Dict[str, Type[BaseModel]]:
+    """
+    Returns the product list fields of the response model and the model of their items,
+    e.g. {'certificatesOfDeposit': CertificateOfDepositResponse, ...}.
+    """
+    fields = {}
+    for name, field in model.model_fields.items():
+        item = _list_item_model(field.annotation)
+        if item is not None:
+            fields[name] = item
+    return fields
+
+def key_fields(model: Type[BaseModel]) -> Tuple[str, ...]:
+    """
+    Returns the fields that identify a product: its name and term, plus the rate and
+    amount fields every extraction must fill in (APY for a CD, APR for a loan, the
+    amount of a fee). Optional fields are not part of the key, so a record missing them
+    is merged with one that has them. The balance tiers (see tier_fields) are matched
+    separately, since a copy may leave them null.
+    """
+    names = tuple(name for name in NAME_FIELDS if name in model.model_fields)
+    required = tuple(
+        name for name, field in model.model_fields.items()
+        if name not in names and field.is_required() and field.annotation in (float, int)
+    )
+    return names + required
+
+def tier_fields(model: Type[BaseModel]) -> Tuple[str, ...]:
+    """
+    Returns the balance tier fields of a product model.
+    """
+    return tuple(name for name in TIER_FIELDS if name in model.model_fields)
+
+def normalize_value(value: Any) -> Any:
+    """
+    Normalizes a key value so cosmetic differences between chunks do not split a product:
+    text is case-folded with whitespace collapsed, numbers are rounded.
+    """
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return round(float(value), 6)
+    return _WHITESPACE.sub(' ', str(value)).strip().casefold()
+
+def product_key(values: Dict[str, Any], names: Tuple[str, ...]) -> Tuple:
+    """
+    Returns the normalized key of a product's field values. Names and terms are compared
+    as text, so a loan term of 60 matches one of "60".
+    """
+    return tuple(
+        normalize_value(str(values[name]) if name in NAME_FIELDS and values[name] is not None else values[name])
+        for name in names
+    )
+
+def tier_patterns(values: Dict[str, Any], names: Tuple[str, ...]) -> Iterable[Tuple]:
+    """
+    Returns the tier patterns a kept product is found by: each tier it sets is either its
+    normalized value or _ANY_TIER, and each tier it leaves null is _ANY_TIER.
+    """
+    choices = [
+        (_ANY_TIER,) if values[name] is None else (normalize_value(values[name]), _ANY_TIER)
+        for name in names
+    ]
+    return itertools.product(*choices)
+
+def tier_query(values: Dict[str, Any], names: Tuple[str, ...]) -> Tuple:
+    """
+    Returns the tier pattern that finds the kept products a copy can be merged into.
+    """
+    return tuple(_ANY_TIER if values[name] is None else normalize_value(values[name]) for name in names)
+
+class BankResponseMerger:
+    """
+    Merges BankResponse objects, for example the results of a page's chunks, as they
+    arrive. Products with the same normalized key are kept once, in the order they were
+    first seen, unless they are different balance tiers; a later duplicate fills in the
+    fields the kept record has as null. Each product is looked up in a hash index under
+    its key and each of its tier patterns, so merging is linear in the number of products.
+    The first bankRootDomain given is kept, reduced to the root domain.
+    """
+
+    def __init__(self, model: Type[BaseModel] = BankResponse):
+        self.model = model
+        self.bank_root_domain: Optional[str] = None
+        self.responses = 0
+        self.duplicates = 0
+        self._items = product_fields(model)
+        self._keys = {field: key_fields(item) for field, item in self._items.items()}
+        self._tiers = {field: tier_fields(item) for field, item in self._items.items()}
+        # product field -> merged field values of each product, in first-seen order
+        self._products: Dict[str, List[Dict[str, Any]]] = {field: [] for field in self._items}
+        # product field -> the source of the first copy of each product
+        self._sources: Dict[str, List[Optional[str]]] = {field: [] for field in self._items}
+        # product field -> (normalized key, tier pattern) -> position of the first product it finds
+        self._index: Dict[str, Dict[Tuple, int]] = {field: {} for field in self._items}
+
+    def add(self, response: BankResponse, source: Optional[str] = None) -> None:
+        """
+        Merges one response into the result.
+
+        Args:
+            response (BankResponse): The response to merge.
+            source (Optional[str]): What produced the response, e.g. 'rules' or 'llm', reported by sources().
+        """
+        self.responses += 1
+        if not self.bank_root_domain and response.bankRootDomain:
+            self.bank_root_domain = root_domain(response.bankRootDomain)
+        for field, products in self._products.items():
+            key_names, tier_names, index = self._keys[field], self._tiers[field], self._index[field]
+            for product in getattr(response, field) or ():
+                values = product.model_dump()
+                key = product_key(values, key_names)
+                position = index.get((key, tier_query(values, tier_names)))
+                if position is None:
+                    for pattern in tier_patterns(values, tier_names):
+                        index.setdefault((key, pattern), len(products))
+                    products.append(values)
+                    self._sources[field].append(source)
+                    continue
+                self.duplicates += 1
+                merged = products[position]
+                # Only fields other than the tiers can be null in merged and set in values
+                for name, value in values.items():
+                    if merged[name] is None and value is not None:
+                        merged[name] = value
+
+    def add_all(self, responses: Iterable[BankResponse], source: Optional[str] = None) -> 'BankResponseMerger':
+        for response in responses:
+            self.add(response, source)
+        return self
+
+    def result(self) -> BankResponse:
+        """
+        Returns the merged response so far. Can be called again after more responses are added.
+        """
+        return self.model.model_validate({
+            'bankRootDomain': self.bank_root_domain or '',
+            **{field: [dict(values) for values in products] for field, products in self._products.items()},
+        })
+
+    def sources(self) -> Dict[str, List[Optional[str]]]:
+        """
+        Returns the source of each product of result(), by product list. Lists with no
+        products are left out.
+        """
+        return {field: list(sources) for field, sources in self._sources.items() if sources}
+
+def merge_bank_responses(responses: List[BankResponse]) -> Optional[BankResponse]:
+    """
+    Merges a list of BankResponse objects into a single BankResponse object, dropping
+    duplicate products.
+
+    Args:
+        responses (List[BankResponse]): A list of BankResponse objects to merge.
+
+    Returns:
+        Optional[BankResponse]: A merged BankResponse object, or None if there are no responses.
+    """
+    if not responses:
+        return None
+    return BankResponseMerger().add_all(responses).result()
+
+# Define module exports
+__all__ = ['BankResponseMerger', 'merge_bank_responses', 'product_fields', 'key_fields', 'tier_fields']
@@ -0,0 +1,196 @@
+# metrics.py
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .models import StageTiming
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the stage duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Span attributes that are summed into Prometheus counters. Other attributes only
+# appear in the logs and the debug timing breakdown.
+COUNTED_ATTRIBUTES = (
+    'bytes', 'tables', 'tables_skipped', 'chunks', 'failed_chunks', 'cache_hits',
+    'prompt_tokens', 'completion_tokens', 'fixed_prompt_tokens', 'cached_prompt_tokens',
+    'retries', 'duplicates', 'rule_tables', 'rate_limited', 'links', 'pages', 'rate_pages',
+    'flights', 'coalesced', 'window_hits', 'wait_timeouts',
+)
+
+METRIC_PREFIX = 'bank_rate_collector'
+
+class Span:
+    """
+    A timed stage of a request, with attributes such as byte, table and token counts.
+    """
+
+    def __init__(self, stage: str, attributes: Dict):
+        self.stage = stage
+        self.attributes = attributes
+        self.seconds = 0.0
+        self.error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+class Trace:
+    """
+    Collects the spans of one request, including spans recorded on worker threads
+    that run in a copy of the request's context.
+    """
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self._lock = threading.Lock()
+        self.spans: List[Span] = []
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def breakdown(self) -> List[StageTiming]:
+        """
+        Sums the spans of each stage, in the order the stages first finished.
+        """
+        stages: Dict[str, StageTiming] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            timing = stages.get(span.stage)
+            if timing is None:
+                timing = stages[span.stage] = StageTiming(stage=span.stage)
+            timing.calls += 1
+            timing.seconds += span.seconds
+            if span.error:
+                timing.errors += 1
+            for name, value in span.attributes.items():
+                if name in COUNTED_ATTRIBUTES:
+                    timing.counts[name] = timing.counts.get(name, 0) + value
+        return list(stages.values())
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('current_trace', default=None)
+
+class MetricsRegistry:
+    """
+    Process-wide stage metrics, rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # stage -> cumulative bucket counts, with a final +Inf bucket
+        self._bucket_counts: Dict[str, List[int]] = {}
+        self._duration_sums: Dict[str, float] = defaultdict(float)
+        self._errors: Dict[str, int] = defaultdict(int)
+        # (attribute, stage) -> total
+        self._counters: Dict[Tuple[str, str], float] = defaultdict(float)
+
+    def observe(self, span: Span) -> None:
+        with self._lock:
+            counts = self._bucket_counts.setdefault(span.stage, [0] * (len(self.buckets) + 1))
+            for index, bound in enumerate(self.buckets):
+                if span.seconds <= bound:
+                    counts[index] += 1
+            counts[-1] += 1
+            self._duration_sums[span.stage] += span.seconds
+            if span.error:
+                self._errors[span.stage] += 1
+            for name, value in span.attributes.items():
+                if name in COUNTED_ATTRIBUTES:
+                    self._counters[(name, span.stage)] += value
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            name = f'{METRIC_PREFIX}_stage_duration_seconds'
+            lines.append(f'# HELP {name} Time spent in each request stage.')
+            lines.append(f'# TYPE {name} histogram')
+            for stage, counts in sorted(self._bucket_counts.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {counts[-1]}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {self._duration_sums[stage]}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {counts[-1]}')
+
+            name = f'{METRIC_PREFIX}_stage_errors_total'
+            lines.append(f'# HELP {name} Stage runs that raised an error.')
+            lines.append(f'# TYPE {name} counter')
+            for stage, count in sorted(self._errors.items()):
+                lines.append(f'{name}{{stage="{stage}"}} {count}')
+
+            for attribute in COUNTED_ATTRIBUTES:
+                totals = sorted((stage, total) for (name_, stage), total in self._counters.items() if name_ == attribute)
+                if not totals:
+                    continue
+                name = f'{METRIC_PREFIX}_stage_{attribute}_total'
+                lines.append(f'# HELP {name} Total {attribute.replace("_", " ")} recorded by each stage.')
+                lines.append(f'# TYPE {name} counter')
+                for stage, total in totals:
+                    lines.append(f'{name}{{stage="{stage}"}} {total}')
+        return '\n'.join(lines) + '\n'
+
+metrics_registry = MetricsRegistry()
+
+@contextmanager
+def start_trace() -> Iterator[Trace]:
+    """
+    Collects the spans recorded in this context (and in copies of it) into a new trace.
+    """
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+@contextmanager
+def span(stage: str, **attributes) -> Iterator[Span]:
+    """
+    Times a stage of a request. The span is logged as JSON, added to the Prometheus
+    metrics, and added to the current trace if there is one.
+
+    Args:
+        stage (str): The stage name, e.g. 'fetch' or 'llm'.
+        **attributes: Initial attributes; more can be added with Span.set.
+
+    Yields:
+        Span: The span being timed.
+    """
+    current = Span(stage, attributes)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.seconds = time.perf_counter() - start
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(current)
+        metrics_registry.observe(current)
+
+        record = {'event': 'span', 'stage': stage, 'seconds': round(current.seconds, 4)}
+        if trace is not None:
+            record['trace_id'] = trace.trace_id
+        if current.error:
+            record['error'] = current.error
+        record.update(current.attributes)
+        logger.info(json.dumps(record, default=str))
+
+def render_metrics() -> str:
+    """
+    Returns the stage metrics in the Prometheus text exposition format.
+    """
+    return metrics_registry.render()
+
+# Define module exports
+__all__ = ['span', 'start_trace', 'render_metrics', 'Span', 'Trace']
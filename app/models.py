@@ -1,4 +1,4 @@
-from typing import List, Union
+from typing import Dict, List, Optional, Union
 from pydantic import BaseModel, Field
 
 class CheckingAccountResponse(BaseModel):
@@ -114,4 +114,119 @@ class BankResponse(BaseModel):
     individualRetirementAccounts: Union[List[IndividualRetirementAccountResponse], None] = Field(default_factory=list)
     loans: Union[List[LoanResponse], None] = Field(default_factory=list)
     creditCards: Union[List[CreditCardResponse], None] = Field(default_factory=list)
-    fees: Union[List[FeeResponse], None] = Field(default_factory=list)
\ No newline at end of file
+    fees: Union[List[FeeResponse], None] = Field(default_factory=list)
+
+class ExtractionStats(BaseModel):
+    """
+    Pydantic model summarizing how the chunks of a single extraction were processed.
+    """
+
+    tables_skipped: int = Field(default=0, description="The number of tables dropped by the relevance filter.")
+    tokens_skipped: int = Field(default=0, description="The number of tokens in the dropped tables.")
+    chunks: int = Field(default=0, description="The number of chunks extracted.")
+    failed_chunks: int = Field(default=0, description="The number of chunks that could not be extracted.")
+    retries: int = Field(default=0, description="The number of LLM calls that were retried.")
+    cache_hits: int = Field(default=0, description="The number of chunks served from the extraction cache.")
+    cache_misses: int = Field(default=0, description="The number of chunks not found in the extraction cache.")
+    client_reuses: int = Field(default=0, description="The number of chunks that reused the cached OpenAI client and API key.")
+    setup_seconds_saved: float = Field(default=0.0, description="Estimated seconds of secret fetching and client setup saved by the reuse.")
+    unchanged_page: bool = Field(default=False, description="Whether the stored result was returned because the page or its tables had not changed.")
+    not_modified: bool = Field(default=False, description="Whether the server answered the conditional request with 304 Not Modified.")
+    rule_tables: int = Field(default=0, description="The number of tables extracted by the header rules instead of the LLM.")
+    product_sources: Dict[str, List[str]] = Field(default_factory=dict, description="For each product list of the result, whether each product came from the 'rules' or the 'llm'.")
+
+class StageTiming(BaseModel):
+    """
+    Pydantic model summarizing the time and work of one stage of a request.
+    """
+
+    stage: str = Field(description="The stage name, e.g. fetch, parse, chunk, llm or merge.")
+    calls: int = Field(default=0, description="The number of times the stage ran.")
+    seconds: float = Field(default=0.0, description="The total seconds spent in the stage, summed over concurrent calls.")
+    errors: int = Field(default=0, description="The number of calls that raised an error.")
+    counts: Dict[str, float] = Field(default_factory=dict, description="Totals such as bytes, tables, chunks, prompt_tokens, completion_tokens and retries.")
+
+class JobResponse(BaseModel):
+    """
+    Pydantic model representing the status and partial or final result of an extraction job.
+    """
+
+    job_id: str = Field(description="The job id.")
+    url: str = Field(description="The URL being extracted.")
+    status: str = Field(description="queued, running, succeeded or failed.")
+    attempts: int = Field(default=0, description="The number of times the job has been started.")
+    chunks: int = Field(default=0, description="The number of chunks to extract, once the page has been fetched.")
+    chunks_done: int = Field(default=0, description="The number of chunks extracted and saved so far.")
+    bank_response: Optional[BankResponse] = Field(default=None, description="The merged result of the chunks extracted so far.")
+    error: Optional[str] = Field(default=None, description="Why the last attempt failed or was incomplete.")
+    stats: Optional[ExtractionStats] = None
+    created_at: float = Field(description="When the job was created, in seconds since the epoch.")
+    updated_at: float = Field(description="When the job was last updated, in seconds since the epoch.")
+
+class RateBankSummary(BaseModel):
+    """
+    Pydantic model summarizing the stored rate history of a bank.
+    """
+
+    bank: str = Field(description="The root domain of the bank.")
+    urls: int = Field(description="The number of pages its rates were extracted from.")
+    observed_at: float = Field(description="When its rates last changed, in seconds since the epoch.")
+    checked_at: float = Field(description="When its rates were last extracted, in seconds since the epoch.")
+
+class BankRates(BaseModel):
+    """
+    Pydantic model representing the current rates of a bank from the rate history.
+    """
+
+    bank: str = Field(description="The root domain of the bank.")
+    urls: List[str] = Field(description="The pages the rates were extracted from.")
+    observed_at: float = Field(description="When the rates last changed, in seconds since the epoch.")
+    checked_at: float = Field(description="When the rates were last extracted, in seconds since the epoch.")
+    bank_response: BankResponse = Field(description="The latest result of each page, merged.")
+
+class RatePoint(BaseModel):
+    """
+    Pydantic model representing one value of a product's rate history.
+    """
+
+    url: str = Field(description="The page the value was extracted from.")
+    observed_at: float = Field(description="When the value was first extracted, in seconds since the epoch.")
+    checked_at: float = Field(description="When the value was last extracted unchanged, in seconds since the epoch.")
+    name: Optional[Union[int, str]] = Field(default=None, description="The product's name, or term for CDs and IRAs.")
+    term: Optional[Union[int, str]] = Field(default=None, description="The product's term, if it has one.")
+    value: Optional[float] = Field(default=None, description="The value of the requested field.")
+
+class RateSeries(BaseModel):
+    """
+    Pydantic model representing how one field of a bank's product changed over time.
+    """
+
+    bank: str = Field(description="The root domain of the bank.")
+    product_type: str = Field(description="The BankResponse list of the product, e.g. certificatesOfDeposit.")
+    name: str = Field(description="The product's name, or term for CDs and IRAs.")
+    field: str = Field(description="The field the values are of, e.g. annualPercentageYield.")
+    points: List[RatePoint] = Field(default_factory=list, description="The values in the order they were observed.")
+
+class CrawlPage(BaseModel):
+    """
+    Pydantic model summarizing one page of a crawl.
+    """
+
+    url: str = Field(description="The page URL.")
+    depth: int = Field(description="The number of links followed from the start URL.")
+    score: float = Field(description="How rate-related its link text and URL looked; higher is crawled first.")
+    status: str = Field(description="rates, no_rate_tables, failed, or known when its stored links were followed without fetching it.")
+    error: Optional[str] = Field(default=None, description="Why the page has no rates, if it has none.")
+    stats: Optional[ExtractionStats] = None
+
+class CrawlResponse(BaseModel):
+    """
+    Pydantic model representing the merged result of a crawl of a bank's site.
+    """
+
+    start_url: str = Field(description="The URL the crawl started from.")
+    bank_response: Optional[BankResponse] = Field(default=None, description="The results of every rate page, merged.")
+    error: Optional[str] = Field(default=None, description="Why no rates were found, if none were.")
+    pages: List[CrawlPage] = Field(default_factory=list, description="The pages crawled, in the order they finished.")
+    pages_fetched: int = Field(default=0, description="The number of pages fetched, counted against the page budget.")
+    frontier: int = Field(default=0, description="The number of discovered links left for the next crawl.")
@@ -0,0 +1,346 @@
+# parsers.py
+import codecs
+import csv
+import io
+import os
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple, Union
+
+# Which backend html_to_csv_tables uses: 'stream' (standard library, no DOM),
+# 'lxml' (lxml iterparse, if installed) or 'bs4' (full BeautifulSoup tree)
+HTML_PARSER_BACKEND = os.getenv("HTML_PARSER_BACKEND", "stream")
+
+# Text inside these elements is not part of a cell's text, matching BeautifulSoup's get_text
+SKIP_TEXT_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+
+# Upper limits from the HTML specification, so a malformed span cannot blow up the grid
+MAX_ROWSPAN = 65534
+MAX_COLSPAN = 1000
+
+FEED_SIZE = 64 * 1024
+
+# (text, rowspan, colspan)
+Cell = Tuple[str, int, int]
+
+def parse_span(value: Optional[str], maximum: int, zero_spans_all: bool = False) -> int:
+    """
+    Parses a rowspan/colspan attribute. Missing or invalid values count as 1. A zero
+    counts as the maximum if zero_spans_all (rowspan="0" spans to the end of the table).
+    """
+    if value is None:
+        return 1
+    match = re.match(r'\s*(\d+)', value)
+    if not match:
+        return 1
+    span = int(match.group(1))
+    if span == 0:
+        return maximum if zero_spans_all else 1
+    return min(span, maximum)
+
+def parse_cell_spans(rowspan: Optional[str], colspan: Optional[str]) -> Tuple[int, int]:
+    return parse_span(rowspan, MAX_ROWSPAN, zero_spans_all=True), parse_span(colspan, MAX_COLSPAN)
+
+def expand_spans(rows: List[List[Cell]]) -> List[List[str]]:
+    """
+    Expands rowspan and colspan so that a spanned value is repeated in every grid
+    position it covers.
+
+    Args:
+        rows (List[List[Cell]]): Each row's cells as (text, rowspan, colspan) tuples.
+
+    Returns:
+        List[List[str]]: The rows of the expanded grid.
+    """
+    grid = []
+    # Column index -> (rows remaining, text) for cells spanning down from earlier rows
+    pending: Dict[int, Tuple[int, str]] = {}
+
+    for cells in rows:
+        out: List[str] = []
+
+        def take_pending() -> None:
+            while len(out) in pending:
+                remaining, text = pending.pop(len(out))
+                if remaining > 1:
+                    pending[len(out)] = (remaining - 1, text)
+                out.append(text)
+
+        for text, rowspan, colspan in cells:
+            take_pending()
+            for _ in range(colspan):
+                if rowspan > 1:
+                    pending[len(out)] = (rowspan - 1, text)
+                out.append(text)
+
+        # Cells spanning down into columns after this row's last cell
+        for column in sorted(pending):
+            if column >= len(out):
+                out.extend([''] * (column - len(out)))
+                take_pending()
+
+        grid.append(out)
+    return grid
+
+def rows_to_csv(rows: List[List[str]], domain: str) -> str:
+    """
+    Writes table rows as CSV, with the domain prepended to the first row.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    for index, row in enumerate(rows):
+        writer.writerow([domain] + row if index == 0 else row)
+    return output.getvalue()
+
+def decode_html(html: Union[str, bytes]) -> str:
+    """
+    Decodes page bytes using the BOM or the declared <meta> charset, falling back to
+    UTF-8 and then Windows-1252.
+    """
+    if isinstance(html, str):
+        return html
+
+    for bom, encoding in ((codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')):
+        if html.startswith(bom):
+            return html[len(bom):].decode(encoding, errors='replace')
+
+    declared = re.search(rb'<meta[^>]+charset=["\']?([\w-]+)', html[:4096], re.IGNORECASE)
+    if declared:
+        try:
+            return html.decode(declared.group(1).decode('ascii'))
+        except (LookupError, UnicodeDecodeError):
+            pass
+    try:
+        return html.decode('utf-8')
+    except UnicodeDecodeError:
+        return html.decode('windows-1252', errors='replace')
+
+class _TableState:
+    def __init__(self, index: int):
+        self.index = index
+        self.rows: List[List[Cell]] = []
+        self.row: Optional[List[Cell]] = None
+        # [text parts, rowspan, colspan] of the open cell
+        self.cell: Optional[list] = None
+
+    def close_cell(self) -> None:
+        if self.cell is not None and self.row is not None:
+            parts, rowspan, colspan = self.cell
+            self.row.append((''.join(parts), rowspan, colspan))
+        self.cell = None
+
+    def close_row(self) -> None:
+        self.close_cell()
+        if self.row is not None:
+            self.rows.append(self.row)
+        self.row = None
+
+class StreamingTableParser(HTMLParser):
+    """
+    Collects the rows of every <table> from a stream of HTML without building a DOM.
+
+    Rows belong to their nearest enclosing table and cells to their nearest row. A
+    cell's text includes the text of any tables nested inside it.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tables: List[Optional[List[List[Cell]]]] = []
+        self._stack: List[_TableState] = []
+        self._skip_depth = 0
+        # Text since the last tag; a text node can arrive in several handle_data calls
+        self._text: List[str] = []
+
+    def _flush_text(self) -> None:
+        text = ''.join(self._text).strip()
+        self._text.clear()
+        if text:
+            for table in self._stack:
+                if table.cell is not None:
+                    table.cell[0].append(text)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if tag in SKIP_TEXT_TAGS:
+            self._skip_depth += 1
+        if tag == 'table':
+            self._stack.append(_TableState(len(self.tables)))
+            self.tables.append(None)
+        elif not self._stack:
+            return
+        elif tag == 'tr':
+            self._stack[-1].close_row()
+            self._stack[-1].row = []
+        elif tag in ('td', 'th'):
+            table = self._stack[-1]
+            if table.row is not None:
+                table.close_cell()
+                attributes = dict(attrs)
+                table.cell = [[], *parse_cell_spans(attributes.get('rowspan'), attributes.get('colspan'))]
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in ('td', 'th', 'tr', 'table'):
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if tag in SKIP_TEXT_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        if not self._stack:
+            return
+        if tag in ('td', 'th'):
+            self._stack[-1].close_cell()
+        elif tag == 'tr':
+            self._stack[-1].close_row()
+        elif tag == 'table':
+            self._finish_table()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def handle_decl(self, decl):
+        self._flush_text()
+
+    def handle_pi(self, data):
+        self._flush_text()
+
+    def unknown_decl(self, data):
+        self._flush_text()
+
+    def _finish_table(self) -> None:
+        table = self._stack.pop()
+        table.close_row()
+        self.tables[table.index] = table.rows
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        while self._stack:
+            self._finish_table()
+
+def stream_table_rows(html: Union[str, bytes]) -> List[List[List[Cell]]]:
+    """
+    Parses every table on a page with the standard library's streaming HTML parser.
+    """
+    text = decode_html(html)
+    parser = StreamingTableParser()
+    for start in range(0, len(text), FEED_SIZE):
+        parser.feed(text[start:start + FEED_SIZE])
+    parser.close()
+    return [rows or [] for rows in parser.tables]
+
+def _lxml_text(element) -> str:
+    parts = []
+
+    def walk(node):
+        tag = node.tag
+        if isinstance(tag, str) and tag.lower() not in SKIP_TEXT_TAGS:
+            if node.text:
+                parts.append(node.text.strip())
+            for child in node:
+                walk(child)
+                if child.tail:
+                    parts.append(child.tail.strip())
+
+    walk(element)
+    return ''.join(parts)
+
+def lxml_table_rows(html: Union[str, bytes]) -> List[List[List[Cell]]]:
+    """
+    Parses every table on a page with lxml's iterparse, discarding everything outside
+    tables as soon as it has been parsed.
+    """
+    from lxml import etree
+
+    source = html.encode('utf-8') if isinstance(html, str) else html
+    tables: List[Optional[List[List[Cell]]]] = []
+    stack: List[_TableState] = []
+
+    for event, element in etree.iterparse(io.BytesIO(source), events=('start', 'end'), html=True, recover=True):
+        tag = element.tag.lower() if isinstance(element.tag, str) else None
+        if event == 'start':
+            if tag == 'table':
+                stack.append(_TableState(len(tables)))
+                tables.append(None)
+            elif stack and tag == 'tr':
+                stack[-1].close_row()
+                stack[-1].row = []
+            elif stack and tag in ('td', 'th') and stack[-1].row is not None:
+                stack[-1].close_cell()
+                stack[-1].cell = [[], *parse_cell_spans(element.get('rowspan'), element.get('colspan'))]
+            continue
+
+        if stack and tag in ('td', 'th'):
+            if stack[-1].cell is not None:
+                stack[-1].cell[0].append(_lxml_text(element))
+            stack[-1].close_cell()
+        elif stack and tag == 'tr':
+            stack[-1].close_row()
+        elif stack and tag == 'table':
+            table = stack.pop()
+            table.close_row()
+            tables[table.index] = table.rows
+
+        if not stack:
+            # Free everything that has been fully parsed outside of a table
+            element.clear()
+
+    while stack:
+        table = stack.pop()
+        table.close_row()
+        tables[table.index] = table.rows
+    return [rows or [] for rows in tables]
+
+def bs4_table_rows(html: Union[str, bytes]) -> List[List[List[Cell]]]:
+    """
+    Parses every table on a page from a full BeautifulSoup tree.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    return [tag_table_rows(table) for table in soup.find_all('table')]
+
+def tag_table_rows(table) -> List[List[Cell]]:
+    """
+    Returns the rows of a BeautifulSoup <table> Tag, skipping rows of nested tables.
+    """
+    rows = []
+    for row in table.find_all('tr'):
+        if row.find_parent('table') is not table:
+            continue
+        rows.append([
+            (col.get_text(strip=True), *parse_cell_spans(col.get('rowspan'), col.get('colspan')))
+            for col in row.find_all(['td', 'th'])
+            if col.find_parent('tr') is row
+        ])
+    return rows
+
+TABLE_ROW_BACKENDS = {
+    'stream': stream_table_rows,
+    'lxml': lxml_table_rows,
+    'bs4': bs4_table_rows,
+}
+
+def html_tables_to_csv(html: Union[str, bytes], domain: str, backend: str = HTML_PARSER_BACKEND) -> List[str]:
+    """
+    Converts every table on a page to CSV, expanding rowspan and colspan.
+
+    Args:
+        html (Union[str, bytes]): The page HTML.
+        domain (str): The domain prepended to each table's first row.
+        backend (str): 'stream', 'lxml' or 'bs4'.
+
+    Returns:
+        List[str]: One CSV string per table, in document order.
+    """
+    if backend not in TABLE_ROW_BACKENDS:
+        raise ValueError(f"Unknown HTML parser backend: {backend}")
+    return [rows_to_csv(expand_spans(rows), domain) for rows in TABLE_ROW_BACKENDS[backend](html)]
+
+# Define module exports
+__all__ = ['html_tables_to_csv', 'expand_spans', 'tag_table_rows']
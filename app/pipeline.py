@@ -0,0 +1,354 @@
+# pipeline.py
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from .coalesce import get_coalescer, normalize_url
+from .extract import MAX_CHUNK_TOKENS, MODEL_ID, PROMPT_VERSION, process_and_extract_tables_single
+from .fetch_state import FetchStateStore, PageState, get_fetch_state_store, hash_csv_tables
+from .history import get_history_store
+from .models import BankResponse, ExtractionStats
+from .rules import RULES_VERSION
+from .scheduler import FetchScheduler, get_fetch_scheduler, get_host
+from .scrape import FetchedPage, fetch_scheduled, html_to_csv_tables
+
+# Concurrency limits for each stage of a batch. Fetching is I/O bound and parsing is
+# CPU bound; each extraction additionally runs up to MAX_CONCURRENT_CHUNKS LLM calls.
+BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", "8"))
+BATCH_PARSE_CONCURRENCY = int(os.getenv("BATCH_PARSE_CONCURRENCY", "2"))
+BATCH_EXTRACT_CONCURRENCY = int(os.getenv("BATCH_EXTRACT_CONCURRENCY", "4"))
+# URLs a batch has not finished within this many seconds are reported as timed out
+BATCH_TIMEOUT_SECONDS = float(os.getenv("BATCH_TIMEOUT_SECONDS", "900"))
+
+# (url, bank_response, error, stats)
+BatchResult = Tuple[str, Optional[BankResponse], Optional[str], ExtractionStats]
+
+PROCESSING_FAILED_ERROR = "Failed to process the scraped data."
+BATCH_ABANDONED_ERROR = "The batch was stopped before this URL was extracted."
+
+# Identifies what produced a stored page result, so a new model, prompt or rule set extracts again
+EXTRACTOR = f"{MODEL_ID}:{PROMPT_VERSION}:rules-{RULES_VERSION}"
+
+def load_page_state(store: Optional[FetchStateStore], url: str) -> Optional[PageState]:
+    """
+    Returns the stored state for url if its result was produced by the current model, prompt and rules.
+    """
+    if store is None:
+        return None
+    return store.get(url, EXTRACTOR)
+
+def fetch_with_state(
+    url: str,
+    state: Optional[PageState],
+    scheduler: Optional[FetchScheduler] = None,
+    browser_fallback: bool = True
+) -> FetchedPage:
+    """
+    Fetches url through the fetch scheduler, sending the stored validators as conditional request headers.
+    """
+    if state is None:
+        return fetch_scheduled(url, scheduler=scheduler, browser_fallback=browser_fallback)
+    return fetch_scheduled(
+        url, etag=state.etag, last_modified=state.last_modified, scheduler=scheduler, browser_fallback=browser_fallback
+    )
+
+def unchanged_result(url: str, store: FetchStateStore, state: PageState, page: FetchedPage) -> BatchResult:
+    """
+    Returns the stored result for a page that was not modified or whose tables are unchanged.
+    """
+    if not page.not_modified:
+        # Keep the new validators so the next fetch can be conditional
+        store.put(url, state._replace(etag=page.etag, last_modified=page.last_modified))
+    bank_response = state.bank_response()
+    record_history(url, bank_response)
+    stats = ExtractionStats(unchanged_page=True, not_modified=page.not_modified)
+    return url, bank_response, None, stats
+
+def record_history(url: str, bank_response: BankResponse) -> None:
+    """
+    Appends a complete result to the rate history, if it is enabled. An unchanged result
+    only updates when the URL's rates were last checked. Failures are logged, so the
+    history never costs a caller its result.
+    """
+    try:
+        history = get_history_store()
+        if history is not None:
+            history.record(url, bank_response)
+    except Exception as e:
+        print(f"Failed to record rate history for {url}: {e}")
+
+def extraction_error(url: str, bank_response: Optional[BankResponse], stats: ExtractionStats) -> Optional[str]:
+    if not bank_response and not stats.chunks and stats.tables_skipped:
+        return f"No rate tables found at {url}"
+    if not bank_response:
+        return PROCESSING_FAILED_ERROR
+    if stats.failed_chunks:
+        return f"Partial result: {stats.failed_chunks} of {stats.chunks} chunks failed extraction."
+    return None
+
+def save_page_state(
+    store: Optional[FetchStateStore],
+    url: str,
+    page: FetchedPage,
+    csv_hash: str,
+    bank_response: Optional[BankResponse],
+    stats: ExtractionStats
+) -> None:
+    # Partial results are neither stored nor added to the history, so the page is
+    # extracted again next time
+    if not bank_response or stats.failed_chunks:
+        return
+    if store is not None:
+        store.put(url, PageState(
+            etag=page.etag,
+            last_modified=page.last_modified,
+            csv_hash=csv_hash,
+            extractor=EXTRACTOR,
+            bank_response_json=bank_response.model_dump_json()
+        ))
+    record_history(url, bank_response)
+
+def extract_url(
+    url: str,
+    scheduler: Optional[FetchScheduler] = None,
+    max_chunk_tokens: int = MAX_CHUNK_TOKENS
+) -> BatchResult:
+    """
+    Scrapes and extracts a single URL.
+
+    If the server answers the conditional request with 304, or the page's tables hash
+    the same as last time, the stored result is returned without parsing or calling
+    the LLM, and stats.unchanged_page is set.
+
+    Args:
+        url (str): The URL to scrape.
+        scheduler (Optional[FetchScheduler]): The fetch scheduler; defaults to the process-wide one.
+        max_chunk_tokens (int): The token budget for the table data in each chunk.
+
+    Returns:
+        BatchResult: The (url, bank_response, error, stats) tuple.
+    """
+    store = get_fetch_state_store()
+    state = load_page_state(store, url)
+    page = fetch_with_state(url, state, scheduler)
+    return extract_fetched_page(url, page, state, store, max_chunk_tokens)
+
+def extract_fetched_page(
+    url: str,
+    page: FetchedPage,
+    state: Optional[PageState],
+    store: Optional[FetchStateStore],
+    max_chunk_tokens: int = MAX_CHUNK_TOKENS
+) -> BatchResult:
+    """
+    Extracts a page fetched with fetch_with_state, returning the stored result if it
+    was not modified or its tables are unchanged. See extract_url.
+    """
+    if page.not_modified:
+        return unchanged_result(url, store, state, page)
+    if page.html is None:
+        return url, None, f"Failed to retrieve tables from {url}", ExtractionStats()
+
+    try:
+        csv_tables = html_to_csv_tables(url, page.html)
+    except Exception as e:
+        return url, None, str(e), ExtractionStats()
+    if not csv_tables:
+        return url, None, f"No tables found at {url}", ExtractionStats()
+
+    csv_hash = hash_csv_tables(csv_tables)
+    if state is not None and state.csv_hash == csv_hash:
+        return unchanged_result(url, store, state, page)
+
+    stats = ExtractionStats()
+    bank_response = process_and_extract_tables_single(csv_tables, max_chunk_tokens=max_chunk_tokens, stats=stats)
+    save_page_state(store, url, page, csv_hash, bank_response, stats)
+    return url, bank_response, extraction_error(url, bank_response, stats), stats
+
+def dump_result(result: BatchResult) -> str:
+    url, bank_response, error, stats = result
+    return json.dumps({
+        'url': url,
+        'bank_response': bank_response.model_dump(mode='json') if bank_response else None,
+        'error': error,
+        'stats': stats.model_dump(mode='json'),
+    })
+
+def load_result(value: str) -> BatchResult:
+    data = json.loads(value)
+    bank_response = BankResponse.model_validate(data['bank_response']) if data['bank_response'] else None
+    return data['url'], bank_response, data['error'], ExtractionStats.model_validate(data['stats'])
+
+def extract_url_coalesced(url: str) -> Tuple[BatchResult, str]:
+    """
+    Scrapes and extracts a single URL like extract_url, unless the same normalized URL
+    is being extracted already or was extracted a moment ago: then that extraction's
+    result is returned instead. Results with an error are only shared with the callers
+    that waited for them.
+
+    Args:
+        url (str): The URL to scrape.
+
+    Returns:
+        Tuple[BatchResult, str]: The (url, bank_response, error, stats) tuple, and 'called',
+        'coalesced' or 'window' as returned by Coalescer.run.
+    """
+    coalescer = get_coalescer()
+    if coalescer is None:
+        return extract_url(url), 'called'
+
+    result = None
+
+    def call() -> Tuple[str, bool]:
+        nonlocal result
+        result = extract_url(url)
+        _, bank_response, error, _ = result
+        return dump_result(result), bank_response is not None and error is None
+
+    value, how = coalescer.run(f"extract:{EXTRACTOR}:{normalize_url(url)}", call)
+    return (result if how == 'called' else load_result(value)), how
+
+def run_batch_pipeline(
+    urls: List[str],
+    max_chunk_tokens: int = MAX_CHUNK_TOKENS,
+    fetch_concurrency: int = BATCH_FETCH_CONCURRENCY,
+    parse_concurrency: int = BATCH_PARSE_CONCURRENCY,
+    extract_concurrency: int = BATCH_EXTRACT_CONCURRENCY,
+    scheduler: Optional[FetchScheduler] = None,
+    timeout_seconds: float = BATCH_TIMEOUT_SECONDS
+) -> Iterator[BatchResult]:
+    """
+    Scrapes and extracts many URLs, overlapping fetching, parsing and LLM extraction.
+
+    Each stage runs on its own thread pool, so one URL can be extracted while others
+    are still being fetched or parsed. Fetches go through the fetch scheduler, which
+    rate limits each host and reuses its pooled connections. URLs wait in a queue per
+    host until the host has a free slot, so the fetch threads are not tied up by a host
+    with many URLs or a slow site.
+
+    Args:
+        urls (List[str]): The URLs to scrape.
+        max_chunk_tokens (int): The token budget for the table data in each chunk.
+        fetch_concurrency (int): The maximum number of concurrent page fetches.
+        parse_concurrency (int): The maximum number of pages parsed concurrently.
+        extract_concurrency (int): The maximum number of URLs extracted concurrently.
+        scheduler (Optional[FetchScheduler]): The fetch scheduler; defaults to the process-wide one.
+        timeout_seconds (float): How long the whole batch may take; URLs not finished by
+            then get a timeout error.
+
+    Yields:
+        BatchResult: One (url, bank_response, error, stats) tuple per URL, in completion order.
+    """
+    results: "queue.Queue[BatchResult]" = queue.Queue()
+    fetch_pool = ThreadPoolExecutor(max_workers=fetch_concurrency, thread_name_prefix='batch-fetch')
+    parse_pool = ThreadPoolExecutor(max_workers=parse_concurrency, thread_name_prefix='batch-parse')
+    extract_pool = ThreadPoolExecutor(max_workers=extract_concurrency, thread_name_prefix='batch-extract')
+
+    scheduler = scheduler or get_fetch_scheduler()
+    store = get_fetch_state_store()
+    lock = threading.Lock()
+    host_pending: Dict[str, Deque[str]] = defaultdict(deque)
+    host_in_flight: Dict[str, int] = defaultdict(int)
+
+    def fail(url: str, error: str) -> None:
+        results.put((url, None, error, ExtractionStats()))
+
+    def dispatch(host: str) -> None:
+        # Caller must hold lock
+        while host_pending[host] and host_in_flight[host] < scheduler.per_host_concurrency:
+            url = host_pending[host].popleft()
+            host_in_flight[host] += 1
+            try:
+                fetch_pool.submit(fetch_stage, url, host)
+            except RuntimeError:
+                # The batch was abandoned and the pools shut down
+                host_in_flight[host] -= 1
+                fail(url, BATCH_ABANDONED_ERROR)
+                return
+
+    def fetch_stage(url: str, host: str) -> None:
+        state = None
+        try:
+            state = load_page_state(store, url)
+            page = fetch_with_state(url, state, scheduler)
+        except Exception as e:
+            page = FetchedPage(None)
+            print(f"Failed to fetch {url}: {e}")
+        finally:
+            with lock:
+                host_in_flight[host] -= 1
+                dispatch(host)
+
+        if page.not_modified:
+            try:
+                results.put(unchanged_result(url, store, state, page))
+            except Exception as e:
+                fail(url, str(e))
+            return
+        if page.html is None:
+            fail(url, f"Failed to retrieve tables from {url}")
+            return
+        try:
+            parse_pool.submit(parse_stage, url, page, state)
+        except RuntimeError:
+            fail(url, BATCH_ABANDONED_ERROR)
+
+    def parse_stage(url: str, page: FetchedPage, state: Optional[PageState]) -> None:
+        try:
+            csv_tables = html_to_csv_tables(url, page.html)
+            if not csv_tables:
+                fail(url, f"No tables found at {url}")
+                return
+            csv_hash = hash_csv_tables(csv_tables)
+            if state is not None and state.csv_hash == csv_hash:
+                results.put(unchanged_result(url, store, state, page))
+                return
+        except Exception as e:
+            fail(url, str(e))
+            return
+
+        try:
+            extract_pool.submit(extract_stage, url, csv_tables, page, csv_hash)
+        except RuntimeError:
+            fail(url, BATCH_ABANDONED_ERROR)
+
+    def extract_stage(url: str, csv_tables: List[str], page: FetchedPage, csv_hash: str) -> None:
+        stats = ExtractionStats()
+        try:
+            bank_response = process_and_extract_tables_single(csv_tables, max_chunk_tokens=max_chunk_tokens, stats=stats)
+            save_page_state(store, url, page, csv_hash, bank_response, stats)
+        except Exception as e:
+            results.put((url, None, str(e), stats))
+            return
+        results.put((url, bank_response, extraction_error(url, bank_response, stats), stats))
+
+    try:
+        with lock:
+            for url in urls:
+                host_pending[get_host(url)].append(url)
+            for host in list(host_pending):
+                dispatch(host)
+
+        # A stage that dies without a result must not hold up the rest of the stream
+        deadline = time.monotonic() + timeout_seconds
+        missing = Counter(urls)
+        for _ in range(len(urls)):
+            try:
+                result = results.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            missing[result[0]] -= 1
+            yield result
+        for url in missing.elements():
+            yield url, None, f"Timed out after {timeout_seconds:g}s before {url} was extracted.", ExtractionStats()
+    finally:
+        for pool in (fetch_pool, parse_pool, extract_pool):
+            pool.shutdown(wait=False, cancel_futures=True)
+
+# Define module exports
+__all__ = ['run_batch_pipeline', 'extract_url', 'extract_url_coalesced']
@@ -0,0 +1,181 @@
+# prompt.py
+import csv
+import io
+import json
+import os
+import re
+import typing
+from functools import lru_cache
+from typing import Any, Dict, List, Type, Union
+
+from pydantic import BaseModel, ConfigDict, Field, create_model
+
+from .models import BankResponse
+from .tokens import count_tokens
+
+# 'compact' sends the instructions as a fixed system message, a schema without field
+# descriptions and tables without padding; 'full' sends the original prompt and schema.
+PROMPT_STYLE = os.getenv("PROMPT_STYLE", "compact")
+
+# Bump the style's version whenever its prompt, schema or table format changes so
+# cached extractions are not reused.
+PROMPT_VERSIONS = {'full': '1', 'compact': '2'}
+if PROMPT_STYLE not in PROMPT_VERSIONS:
+    raise ValueError(f"Unknown prompt style: {PROMPT_STYLE}")
+
+FULL_SYSTEM_PROMPT = "You are a helpful assistant designed to output structured data."
+
+# The same for every call, so together with the schema it forms a prefix the provider
+# can cache. The field notes stand in for the schema descriptions that say more than
+# the field name.
+COMPACT_SYSTEM_PROMPT = """Extract the banking rate data from the CSV tables of a bank's rate page and structure it according to the provided model.
+The first line gives the bank's domain. Each table starts with its header row; tables are separated by blank lines.
+
+Special instructions:
+- If a property or object does not exist, do not include it in the output.
+- Do not include 'www' or other subdomains in the bankRootDomain.
+- If dividend rate is given, do not include interest rate.
+- Do not convert percentage to decimal. I.e. if the rate is 0.55%, return 0.55 not 0.0055
+
+Field notes:
+- Fields other than name, term and the required rates and amounts are "if any".
+- minimumDailyBalance of a savings account may also be its balance requirement for interest.
+- doesEarnRewards: whether a credit card earns rewards.
+- feeUnit: the unit of a fee's amount; oneTime and recurringInterval: whether and how often the fee recurs."""
+
+_WHITESPACE = re.compile(r'\s+')
+
+def full_prompt(chunk: str) -> str:
+    """
+    Builds the original extraction prompt for a chunk of CSV data.
+    """
+    return f"""
+Extract the banking rate data from the following text and structure it according to the provided model.
+
+Special instructions:
+- If a property or object does not exist, do not include it in the output.
+- Do not include 'www' or other subdomains in the bankRootDomain.
+- If dividend rate is given, do not include interest rate.
+- Do not convert percentage to decimal. I.e. if the rate is 0.55%, return 0.55 not 0.0055
+
+Text:
+{chunk}
+"""
+
+def build_messages(chunk: str, style: str = PROMPT_STYLE) -> List[Dict[str, str]]:
+    """
+    Builds the chat messages for a chunk. In the compact style everything before the
+    chunk is the same for every call.
+    """
+    if style == 'full':
+        return [
+            {"role": "system", "content": FULL_SYSTEM_PROMPT},
+            {"role": "user", "content": full_prompt(chunk)},
+        ]
+    return [
+        {"role": "system", "content": COMPACT_SYSTEM_PROMPT},
+        {"role": "user", "content": chunk},
+    ]
+
+def _compact_annotation(annotation: Any) -> Any:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return compact_model(annotation)
+    args = typing.get_args(annotation)
+    if not args:
+        return annotation
+    compact_args = tuple(_compact_annotation(arg) for arg in args)
+    if typing.get_origin(annotation) is Union:
+        return Union[compact_args]
+    return typing.get_origin(annotation)[compact_args]
+
+def _drop_titles(schema: Dict[str, Any]) -> None:
+    # Pydantic titles each model and field after its name, which the schema already has
+    schema.pop('title', None)
+    for field_schema in schema.get('properties', {}).values():
+        field_schema.pop('title', None)
+
+@lru_cache(maxsize=None)
+def compact_model(model: Type[BaseModel]) -> Type[BaseModel]:
+    """
+    Returns a copy of a response model with the same fields, types and defaults but no
+    descriptions or titles, so its JSON schema costs fewer prompt tokens.
+    """
+    fields = {}
+    for name, field in model.model_fields.items():
+        if field.default_factory is not None:
+            info = Field(default_factory=field.default_factory)
+        elif field.is_required():
+            info = Field()
+        else:
+            info = Field(default=field.default)
+        fields[name] = (_compact_annotation(field.annotation), info)
+    return create_model(
+        model.__name__,
+        __config__=ConfigDict(json_schema_extra=_drop_titles),
+        __doc__=None,
+        __module__=__name__,
+        **fields
+    )
+
+def response_model(style: str = PROMPT_STYLE) -> Type[BaseModel]:
+    """
+    Returns the model sent as the response format; parse its output with to_bank_response.
+    """
+    return BankResponse if style == 'full' else compact_model(BankResponse)
+
+def to_bank_response(parsed: BaseModel) -> BankResponse:
+    if isinstance(parsed, BankResponse):
+        return parsed
+    return BankResponse.model_validate(parsed.model_dump())
+
+def table_domain(csv_table: str) -> str:
+    """
+    Returns the domain table_to_csv put in the first cell of a table.
+    """
+    first_row = next(csv.reader(io.StringIO(csv_table, newline='')), [])
+    return first_row[0] if first_row else ''
+
+def compact_csv_table(csv_table: str) -> str:
+    """
+    Rewrites a table from table_to_csv with fewer tokens: without the domain cell,
+    with whitespace in cells collapsed, without empty rows, columns and trailing
+    cells, and with '\\n' line endings.
+    """
+    rows = [
+        [_WHITESPACE.sub(' ', cell).strip() for cell in row]
+        for row in csv.reader(io.StringIO(csv_table, newline=''))
+    ]
+    if rows and rows[0]:
+        rows[0] = rows[0][1:]
+    rows = [row for row in rows if any(row)]
+    width = max((len(row) for row in rows), default=0)
+    used = [column for column in range(width) if any(column < len(row) and row[column] for row in rows)]
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    for row in rows:
+        cells = [row[column] if column < len(row) else '' for column in used]
+        while cells and not cells[-1]:
+            cells.pop()
+        writer.writerow(cells)
+    return output.getvalue()
+
+def chunk_header(domain: str) -> str:
+    # Compact tables have no domain cell, so each chunk names the domain once
+    return f"{domain}\n\n"
+
+@lru_cache(maxsize=None)
+def fixed_prompt_tokens(style: str = PROMPT_STYLE, model: str = "gpt-4o") -> int:
+    """
+    Estimates the tokens every call pays for whatever its chunk: the messages without
+    the chunk, plus the response schema.
+    """
+    messages = build_messages("", style)
+    schema = json.dumps(response_model(style).model_json_schema(), separators=(',', ':'))
+    return sum(count_tokens(message["content"], model) for message in messages) + count_tokens(schema, model)
+
+# Define module exports
+__all__ = [
+    'PROMPT_STYLE', 'PROMPT_VERSIONS', 'build_messages', 'chunk_header', 'compact_csv_table', 'compact_model',
+    'fixed_prompt_tokens', 'response_model', 'table_domain', 'to_bank_response',
+]
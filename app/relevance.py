@@ -0,0 +1,101 @@
+# relevance.py
+import csv
+import io
+import os
+import re
+from typing import List, Optional, Tuple
+
+from .models import ExtractionStats
+from .tokens import count_tokens
+
+# Tables scoring below this are not sent to the LLM. Tuned on
+# benchmarks/fixtures/relevance_labels.json with benchmarks/eval_relevance.py.
+TABLE_RELEVANCE_THRESHOLD = float(os.getenv("TABLE_RELEVANCE_THRESHOLD", "0.3"))
+
+RATE_KEYWORDS = re.compile(
+    r'\b(apy|apr|annual percentage|interest|dividends?|rates?|yield|terms?|months?|years?|'
+    r'certificates?|cds?|ira|savings|checking|money market|share|loans?|mortgage|'
+    r'fixed|variable|fees?|minimum|balance|deposit|tier|points|payment)\b',
+    re.IGNORECASE
+)
+PERCENT_VALUE = re.compile(r'\d+(?:\.\d+)?\s*%')
+DOLLAR_VALUE = re.compile(r'\$\s?\d')
+NUMERIC_VALUE = re.compile(r'\d')
+NON_RATE_VALUE = re.compile(
+    r'\b(\d{1,2}:\d{2}\s*(?:am|pm)?|monday|tuesday|wednesday|thursday|friday|saturday|sunday|closed|'
+    r'\(\d{3}\)\s*\d{3}-\d{4}|\d{3}-\d{3}-\d{4}|log ?in|sign ?in)\b',
+    re.IGNORECASE
+)
+
+# Cells with more words than this are treated as prose, e.g. disclosures and footnotes
+PROSE_WORDS = 8
+
+def score_table(csv_table: str) -> float:
+    """
+    Scores how likely a CSV table is to contain rate, product or fee data.
+
+    The score combines rate-related keywords in the table, the fraction of cells holding
+    percentages or dollar amounts, and numeric density, minus the fraction of cells that
+    look like opening hours, phone numbers, navigation or prose.
+
+    Args:
+        csv_table (str): A CSV table as produced by table_to_csv.
+
+    Returns:
+        float: A score between 0 and 1; higher means more likely relevant.
+    """
+    cells = [
+        cell.strip()
+        for row in csv.reader(io.StringIO(csv_table, newline=''))
+        for cell in row
+        if cell.strip()
+    ]
+    if not cells:
+        return 0.0
+
+    keywords = {match.lower() for cell in cells for match in RATE_KEYWORDS.findall(cell)}
+    short_cells = [cell for cell in cells if len(cell) <= 40]
+    value_cells = sum(1 for cell in short_cells if PERCENT_VALUE.search(cell) or DOLLAR_VALUE.search(cell))
+    numeric_cells = sum(1 for cell in short_cells if NUMERIC_VALUE.search(cell))
+    non_rate_cells = sum(1 for cell in cells if NON_RATE_VALUE.search(cell))
+    prose_cells = sum(1 for cell in cells if len(cell.split()) > PROSE_WORDS)
+
+    keyword_score = min(1.0, len(keywords) / 3)
+    value_score = min(1.0, 2 * value_cells / len(cells))
+    numeric_score = numeric_cells / len(cells)
+    penalty = (non_rate_cells + 0.5 * prose_cells) / len(cells)
+
+    score = 0.35 * keyword_score + 0.5 * value_score + 0.15 * numeric_score - penalty
+    return max(0.0, min(1.0, score))
+
+def filter_tables(
+    csv_tables: List[str],
+    threshold: float = TABLE_RELEVANCE_THRESHOLD,
+    stats: Optional[ExtractionStats] = None
+) -> Tuple[List[str], List[str]]:
+    """
+    Drops tables that are unlikely to contain rate data before any tokens are spent on them.
+
+    Args:
+        csv_tables (List[str]): List of CSV tables as strings.
+        threshold (float): The minimum score for a table to be kept.
+        stats (Optional[ExtractionStats]): If given, updated with the skipped table and token counts.
+
+    Returns:
+        Tuple[List[str], List[str]]: The kept tables in page order, and the skipped tables.
+    """
+    kept, skipped = [], []
+    for csv_table in csv_tables:
+        if score_table(csv_table) >= threshold:
+            kept.append(csv_table)
+        else:
+            skipped.append(csv_table)
+
+    if stats is not None:
+        stats.tables_skipped += len(skipped)
+        stats.tokens_skipped += sum(count_tokens(csv_table) for csv_table in skipped)
+
+    return kept, skipped
+
+# Define module exports
+__all__ = ['score_table', 'filter_tables']
@@ -0,0 +1,292 @@
+# rules.py
+import csv
+import io
+import os
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from pydantic import ValidationError
+
+from .domains import root_domain
+from .merge import product_fields
+from .models import BankResponse, ExtractionStats
+
+# Tables whose rule extraction scores below this are sent to the LLM. Set above 1 to
+# send every table to the LLM.
+RULE_CONFIDENCE_THRESHOLD = float(os.getenv("RULE_CONFIDENCE_THRESHOLD", "0.9"))
+
+# Bump whenever the rules change so stored page results are not reused.
+RULES_VERSION = "2"
+
+# Header patterns and the field each recognized column fills, checked in order so the
+# more specific headers ("Minimum Balance to Earn APY") win over the general ones
+# ("Minimum Balance"). Matched against the lower-cased header with whitespace collapsed.
+HEADER_FIELDS: List[Tuple[re.Pattern, str]] = [(re.compile(pattern), field) for pattern, field in (
+    (r'dividend (frequency|paid|compounded)|compounding|frequency of dividends', 'dividendFrequency'),
+    (r'payment per \$?1,?000', 'paymentPer1000Dollars'),
+    (r'^min(imum)? (monthly )?payment', 'minimumPayment'),
+    (r'(balance|minimum) to (earn|obtain)|^min(imum)? balance$', 'minimumBalanceToObtainAPY'),
+    (r'^min(imum)? daily balance', 'minimumDailyBalance'),
+    (r'^min(imum)? (to open|opening deposit|opening balance|deposit)|^opening deposit', 'minimumBalanceToOpen'),
+    (r'^max(imum)? (loan )?amount', 'maximumLoanAmount'),
+    (r'^annual fee', 'annualFee'),
+    (r'^rewards?$|earns? rewards', 'doesEarnRewards'),
+    (r'^apy\b|annual percentage yield', 'annualPercentageYield'),
+    (r'^apr\b|annual percentage rate', 'annualPercentageRate'),
+    (r'^dividend( rate)?$', 'dividendRate'),
+    (r'^(interest )?rates?$|^interest$', 'interestRate'),
+    (r'^terms?( length)?$', 'term'),
+    (r'^(fee|fees|amount|fee amount|cost|charge)$', 'feeAmount'),
+    (r'^(unit|frequency|per|charged)$', 'feeUnit'),
+    (r'^(account|account type|account name|product|product name|loan|loan type|card|'
+     r'service|description|program|plan|type|name)$', 'name'),
+    # Columns with no place in the models; recognized so they do not lower the confidence
+    (r'^points?$', None),
+)]
+
+PERCENT_FIELDS = {'interestRate', 'annualPercentageYield', 'annualPercentageRate', 'dividendRate'}
+DOLLAR_FIELDS = {
+    'minimumBalanceToObtainAPY', 'minimumBalanceToOpen', 'minimumDailyBalance', 'minimumPayment',
+    'maximumLoanAmount', 'paymentPer1000Dollars', 'annualFee', 'feeAmount',
+}
+BOOL_FIELDS = {'doesEarnRewards'}
+
+NULL_VALUES = {'', 'none', 'n/a', 'na', '-', '--', '—', 'not applicable'}
+PERCENT_VALUE = re.compile(r'^(\d+(?:\.\d+)?)\s*%?$')
+DOLLAR_VALUE = re.compile(r'^\$?\s*(\d[\d,]*(?:\.\d+)?)$')
+TRUE_VALUES = {'yes', 'y', 'true'}
+FALSE_VALUES = {'no', 'n', 'false'}
+RECURRING_UNIT = re.compile(r'\b(day|week|month|quarter|year)\b')
+RECURRING_INTERVALS = {'day': 'daily', 'week': 'weekly', 'month': 'monthly', 'quarter': 'quarterly', 'year': 'annually'}
+
+# Product names that identify the kind of deposit account, checked in order
+ACCOUNT_KINDS: List[Tuple[re.Pattern, str]] = [(re.compile(pattern, re.IGNORECASE), field) for pattern, field in (
+    (r'\bira\b|retirement', 'individualRetirementAccounts'),
+    (r'certificate|\bcds?\b|term deposit', 'certificatesOfDeposit'),
+    (r'money market', 'moneyMarketAccounts'),
+    (r'checking|share draft', 'checkingAccounts'),
+    (r'savings|\bshare\b|\bclub\b', 'savingsAccounts'),
+)]
+CARD_NAME = re.compile(r'\b(card|visa|mastercard|amex|discover)\b', re.IGNORECASE)
+
+# BankResponse list field -> product model
+PRODUCT_MODELS = product_fields()
+
+class ParseError(ValueError):
+    """
+    A cell did not hold the kind of value its column calls for.
+    """
+
+class RuleExtraction(NamedTuple):
+    """
+    The result of extracting one table with the rules.
+    """
+
+    response: Optional[BankResponse]
+    # Fraction of the table the rules understood: recognized columns times parsed rows
+    confidence: float
+    # Why the rules could not handle the table, if they could not
+    reason: Optional[str] = None
+    # The header and the rows the rules could not parse, as a CSV table for the LLM
+    unparsed: Optional[str] = None
+
+def header_field(header: str) -> Tuple[bool, Optional[str]]:
+    """
+    Returns whether a header is recognized, and the model field its column fills.
+    """
+    text = re.sub(r'\s+', ' ', header).strip().lower()
+    for pattern, field in HEADER_FIELDS:
+        if pattern.search(text):
+            return True, field
+    return False, None
+
+def parse_value(field: str, cell: str):
+    """
+    Parses a cell for a model field; None for empty or 'None' cells.
+
+    Raises:
+        ParseError: If the cell holds something else, e.g. a range or a note.
+    """
+    text = cell.strip()
+    if text.lower() in NULL_VALUES:
+        return None
+    if field in PERCENT_FIELDS:
+        match = PERCENT_VALUE.match(text)
+        if match is None:
+            raise ParseError(f"{field}: {text!r} is not a rate")
+        return float(match.group(1))
+    if field in DOLLAR_FIELDS:
+        match = DOLLAR_VALUE.match(text)
+        if match is None:
+            raise ParseError(f"{field}: {text!r} is not an amount")
+        return float(match.group(1).replace(',', ''))
+    if field in BOOL_FIELDS:
+        if text.lower() in TRUE_VALUES:
+            return True
+        if text.lower() in FALSE_VALUES:
+            return False
+        raise ParseError(f"{field}: {text!r} is not yes or no")
+    return text
+
+def table_kind(fields: Dict[str, int]) -> Optional[str]:
+    """
+    Returns the BankResponse list a table's products belong in from its columns, 'deposits'
+    if that depends on each product's name, or None if the layout is not recognized.
+    """
+    rate_fields = PERCENT_FIELDS & fields.keys()
+    if 'feeAmount' in fields and 'name' in fields and not rate_fields:
+        return 'fees'
+    if 'annualPercentageRate' in fields and ('name' in fields or 'term' in fields):
+        if 'annualFee' in fields or 'doesEarnRewards' in fields:
+            return 'creditCards'
+        return 'loans'
+    if 'annualPercentageYield' in fields:
+        if 'name' in fields:
+            return 'deposits'
+        if 'term' in fields:
+            return 'certificatesOfDeposit'
+    return None
+
+def row_kind(kind: str, values: Dict) -> Optional[str]:
+    if kind == 'loans' and values.get('name') and CARD_NAME.search(values['name']):
+        return 'creditCards'
+    if kind != 'deposits':
+        return kind
+    for pattern, field in ACCOUNT_KINDS:
+        if pattern.search(values.get('name') or ''):
+            return field
+    return None
+
+def build_product(kind: str, values: Dict):
+    """
+    Builds the product model for a row's parsed values.
+
+    Raises:
+        ParseError: If the row cannot be extracted without the LLM's judgement.
+        ValidationError: If the values do not fit the model, e.g. a required rate is missing.
+    """
+    model = PRODUCT_MODELS[kind]
+    values = dict(values)
+    if kind in ('certificatesOfDeposit', 'individualRetirementAccounts') and not values.get('term'):
+        # A CD table labels its rows with the term, e.g. "12 Month Certificate"
+        values['term'] = values.get('name')
+    if kind == 'fees':
+        unit = (values.get('feeUnit') or '').lower()
+        recurring = RECURRING_UNIT.search(unit)
+        values['oneTime'] = False if recurring else None
+        values['recurringInterval'] = RECURRING_INTERVALS[recurring.group(1)] if recurring else None
+    if values.get('dividendRate') is not None and values.get('interestRate') is None and kind == 'checkingAccounts':
+        # The checking model requires an interest rate, and the prompt keeps dividend and
+        # interest rates apart; leave the choice to the LLM
+        raise ParseError("checking account with only a dividend rate")
+
+    return model.model_validate({name: values.get(name) for name in model.model_fields})
+
+def extract_table_with_rules(csv_table: str) -> RuleExtraction:
+    """
+    Extracts the products of a table with a recognized header layout without calling the LLM.
+
+    Each header is matched to a model field (Term, Interest Rate, APY, Minimum to Open, ...)
+    and the kind of product is decided from the columns and, for deposit accounts, from
+    each row's name. The confidence is the fraction of columns recognized times the
+    fraction of rows parsed into products, so a table with an unknown column, a range
+    such as "$0 - $2,499" or a second header row scores below 1. The rows that were
+    not parsed are returned with the header as a table of their own.
+
+    Args:
+        csv_table (str): A CSV table as produced by table_to_csv, whose first cell is the domain.
+
+    Returns:
+        RuleExtraction: The extracted products and the confidence in them.
+    """
+    rows = [row for row in csv.reader(io.StringIO(csv_table, newline='')) if any(cell.strip() for cell in row)]
+    if len(rows) < 2 or len(rows[0]) < 3:
+        return RuleExtraction(None, 0.0, "no header and data rows")
+
+    domain, headers = rows[0][0], rows[0][1:]
+    fields: Dict[str, int] = {}
+    recognized = 0
+    for index, header in enumerate(headers):
+        known, field = header_field(header)
+        recognized += known
+        if field is None:
+            continue
+        if field in fields:
+            return RuleExtraction(None, 0.0, f"more than one {field} column")
+        fields[field] = index
+
+    kind = table_kind(fields)
+    if kind is None:
+        return RuleExtraction(None, 0.0, "header layout not recognized")
+
+    lists: Dict[str, List] = {}
+    parsed = 0
+    errors = []
+    unparsed_rows = []
+    for row in rows[1:]:
+        if len(row) != len(headers):
+            errors.append(f"row has {len(row)} cells for {len(headers)} columns")
+            unparsed_rows.append(row)
+            continue
+        try:
+            values = {field: parse_value(field, row[index]) for field, index in fields.items()}
+            product_kind = row_kind(kind, values)
+            if product_kind is None:
+                raise ParseError(f"no account type in {values.get('name')!r}")
+            product = build_product(product_kind, values)
+        except (ParseError, ValidationError) as e:
+            errors.append(str(e).splitlines()[0])
+            unparsed_rows.append(row)
+            continue
+        lists.setdefault(product_kind, []).append(product)
+        parsed += 1
+
+    confidence = recognized / len(headers) * parsed / (len(rows) - 1)
+    reason = None
+    if recognized < len(headers):
+        reason = "unrecognized columns: " + ", ".join(h for h in headers if not header_field(h)[0])
+    elif errors:
+        reason = f"{len(errors)} rows not parsed, e.g. {errors[0]}"
+    response = BankResponse(bankRootDomain=root_domain(domain), **lists) if parsed else None
+    unparsed = None
+    if unparsed_rows:
+        output = io.StringIO()
+        csv.writer(output).writerows([rows[0]] + unparsed_rows)
+        unparsed = output.getvalue()
+    return RuleExtraction(response, confidence, reason, unparsed)
+
+def extract_tables_with_rules(
+    csv_tables: List[str],
+    threshold: float = RULE_CONFIDENCE_THRESHOLD,
+    stats: Optional[ExtractionStats] = None,
+    extract: Callable[[str], RuleExtraction] = extract_table_with_rules
+) -> Tuple[List[BankResponse], List[str]]:
+    """
+    Extracts the tables the rules handle with at least `threshold` confidence, and returns
+    the rest for the LLM. The rows the rules could not parse in a table they handle are
+    also left for the LLM, as a table with the same header.
+
+    Args:
+        csv_tables (List[str]): List of CSV tables as strings.
+        threshold (float): The minimum confidence for a table's rule extraction to be used.
+        stats (Optional[ExtractionStats]): If given, updated with the number of tables extracted by the rules.
+
+    Returns:
+        Tuple[List[BankResponse], List[str]]: The rule extractions, and the tables left for the LLM, in page order.
+    """
+    responses, remaining = [], []
+    for csv_table in csv_tables:
+        result = extract(csv_table)
+        if result.response is not None and result.confidence >= threshold:
+            responses.append(result.response)
+            if result.unparsed is not None:
+                remaining.append(result.unparsed)
+        else:
+            remaining.append(csv_table)
+
+    if stats is not None:
+        stats.rule_tables += len(responses)
+    return responses, remaining
+
+# Define module exports
+__all__ = ['extract_table_with_rules', 'extract_tables_with_rules', 'RuleExtraction']
@@ -0,0 +1,184 @@
+# scheduler.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import span
+
+# Timeouts for each page request. The connect and read timeouts are passed to requests;
+# the total timeout also stops a server that trickles out a page slowly.
+FETCH_CONNECT_TIMEOUT_SECONDS = float(os.getenv("FETCH_CONNECT_TIMEOUT_SECONDS", "5"))
+FETCH_READ_TIMEOUT_SECONDS = float(os.getenv("FETCH_READ_TIMEOUT_SECONDS", "10"))
+FETCH_TOTAL_TIMEOUT_SECONDS = float(os.getenv("FETCH_TOTAL_TIMEOUT_SECONDS", "20"))
+
+# Politeness limits for each host: requests per second (with bursts of up to
+# FETCH_BURST) and requests in flight
+FETCH_RATE_PER_SECOND = float(os.getenv("FETCH_RATE_PER_SECOND", "2"))
+FETCH_BURST = int(os.getenv("FETCH_BURST", "4"))
+FETCH_PER_HOST_CONCURRENCY = int(os.getenv("FETCH_PER_HOST_CONCURRENCY", "2"))
+# Requests in flight across all hosts
+FETCH_MAX_CONCURRENCY = int(os.getenv("FETCH_MAX_CONCURRENCY", "16"))
+# Idle hosts beyond this have their connection pools closed
+FETCH_MAX_HOSTS = int(os.getenv("FETCH_MAX_HOSTS", "64"))
+
+class TokenBucket:
+    """
+    A thread-safe token bucket. Callers reserve a token and sleep until it is theirs,
+    so waiting callers are served in the order they asked.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token, going into debt if there is none.
+
+        Returns:
+            float: The seconds to wait before using the token.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+class HostState:
+    """
+    The connection pool and limits of one host.
+    """
+
+    def __init__(self, per_host_concurrency: int, rate: float, burst: int):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=per_host_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.slots = threading.BoundedSemaphore(per_host_concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.in_flight = 0
+
+class FetchScheduler:
+    """
+    Schedules page fetches politely and fairly across hosts.
+
+    Each host has its own keep-alive connection pool, token-bucket rate limit and
+    in-flight limit, and all hosts share a global in-flight limit. A fetch takes its
+    host's slot and waits for its host's token before it takes a global slot, so a slow
+    or rate-limited host never holds more than its own share of the global slots and
+    cannot hold up fetches from other hosts.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = FETCH_MAX_CONCURRENCY,
+        per_host_concurrency: int = FETCH_PER_HOST_CONCURRENCY,
+        rate_per_second: float = FETCH_RATE_PER_SECOND,
+        burst: int = FETCH_BURST,
+        connect_timeout: float = FETCH_CONNECT_TIMEOUT_SECONDS,
+        read_timeout: float = FETCH_READ_TIMEOUT_SECONDS,
+        total_timeout: float = FETCH_TOTAL_TIMEOUT_SECONDS,
+        max_hosts: int = FETCH_MAX_HOSTS
+    ):
+        self.per_host_concurrency = per_host_concurrency
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.total_timeout = total_timeout
+        self.max_hosts = max_hosts
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._hosts: "OrderedDict[str, HostState]" = OrderedDict()
+
+    def _host(self, host: str) -> HostState:
+        # Caller must hold lock
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostState(self.per_host_concurrency, self.rate_per_second, self.burst)
+            self._evict_idle_hosts()
+        self._hosts.move_to_end(host)
+        return state
+
+    def _evict_idle_hosts(self) -> None:
+        # Caller must hold lock
+        for host in list(self._hosts):
+            if len(self._hosts) <= self.max_hosts:
+                break
+            if self._hosts[host].in_flight == 0:
+                self._hosts.pop(host).session.close()
+
+    def session(self, url: str) -> requests.Session:
+        """
+        Returns the pooled session of url's host.
+        """
+        with self._lock:
+            return self._host(get_host(url)).session
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        """
+        Waits until a request to url's host is allowed, and holds its host and global
+        slots until the block exits. The wait is recorded as a 'fetch_wait' span.
+        """
+        host = get_host(url)
+        with self._lock:
+            state = self._host(host)
+            state.in_flight += 1
+        host_slot = global_slot = False
+        try:
+            with span("fetch_wait", domain=host) as wait_span:
+                state.slots.acquire()
+                host_slot = True
+                delay = state.bucket.reserve()
+                if delay > 0:
+                    time.sleep(delay)
+                self._slots.acquire()
+                global_slot = True
+                wait_span.set(rate_limited=delay > 0)
+            yield
+        finally:
+            if global_slot:
+                self._slots.release()
+            if host_slot:
+                state.slots.release()
+            with self._lock:
+                state.in_flight -= 1
+
+    def close(self) -> None:
+        with self._lock:
+            for state in self._hosts.values():
+                state.session.close()
+            self._hosts.clear()
+
+def get_host(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+_scheduler: Optional[FetchScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_fetch_scheduler() -> FetchScheduler:
+    """
+    Returns the process-wide fetch scheduler, whose connection pools are reused across
+    requests and warm Lambda invocations.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FetchScheduler()
+        return _scheduler
+
+# Define module exports
+__all__ = ['FetchScheduler', 'TokenBucket', 'get_fetch_scheduler']
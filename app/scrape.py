@@ -1,51 +1,260 @@
 # scrape.py
 import time
-import random
+import re
 import requests
-from bs4 import BeautifulSoup
-from bs4.element import Tag
-from typing import List, Dict, Optional, Tuple
-import csv
-import io
-from openai import OpenAI
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from typing import TYPE_CHECKING, ContextManager, List, Dict, NamedTuple, Optional, Tuple, Union
+from contextlib import nullcontext
 from urllib.parse import urlparse
+from .browser import prefers_browser, remember_browser_needed, render_page
+from .metrics import span
+from .scheduler import FetchScheduler, get_fetch_scheduler
+from .parsers import HTML_PARSER_BACKEND, expand_spans, html_tables_to_csv, rows_to_csv, tag_table_rows
 
-def fetch_tables(url: str, session: requests.Session, headers: Dict[str, str]) -> Tuple[str, Optional[List[Tag]]]:
+# BeautifulSoup is only needed by the Tag-based helpers, so it is imported on first use
+if TYPE_CHECKING:
+    from bs4.element import Tag
+
+SCRAPE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Connection': 'keep-alive',
+    'sec-ch-ua': '"Not/A)Brand";v="8", "Chromium";v="126", "Google Chrome";v="126"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"macOS"',
+    'sec-fetch-dest': 'document',
+    'sec-fetch-mode': 'navigate',
+    'sec-fetch-site': 'none',
+    'sec-fetch-user': '?1',
+    'upgrade-insecure-requests': '1'
+}
+
+# Statuses that mean the site blocks plain requests or is overloaded, so the browser may
+# get the page; any other status, such as 404 or 410, is final
+BROWSER_FALLBACK_STATUSES = frozenset({403, 429, 503})
+
+_TABLE_TAG = re.compile(rb'<table[\s>]', re.IGNORECASE)
+
+class FetchedPage(NamedTuple):
+    # The page HTML, or None if it could not be retrieved or was not modified
+    html: Optional[Union[str, bytes]]
+    not_modified: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+class FetchTimeout(requests.Timeout):
+    """
+    A page took longer than the total timeout to download.
+    """
+
+def fetch_page(
+    url: str,
+    session: requests.Session,
+    headers: Dict[str, str],
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    timeout: Optional[Tuple[float, float]] = None,
+    total_timeout: Optional[float] = None,
+    browser_fallback: bool = True,
+    slot: Optional[ContextManager[None]] = None
+) -> FetchedPage:
+    """
+    Downloads a page, falling back to a pooled headless browser if the site blocks
+    requests (a status in BROWSER_FALLBACK_STATUSES) or answers with a page without
+    tables, which it may build with JavaScript. Domains whose pages loaded in the
+    browser recently go straight to it, unless there are validators to send: a
+    conditional request comes first, so an unchanged page is not rendered again.
+
+    Args:
+        url (str): The URL to fetch.
+        session (requests.Session): The session to fetch with.
+        headers (Dict[str, str]): The request headers.
+        etag (Optional[str]): The ETag of the stored copy, sent as If-None-Match.
+        last_modified (Optional[str]): The Last-Modified of the stored copy, sent as If-Modified-Since.
+        timeout (Optional[Tuple[float, float]]): The connect and read timeouts in seconds.
+        total_timeout (Optional[float]): The maximum seconds to spend downloading the page.
+        browser_fallback (bool): Whether to render the page in the browser if requests does not get it.
+            If False, the browser is never used.
+        slot (Optional[ContextManager[None]]): Held while the page is requested, such as the
+            fetch scheduler's slot for its host; it is released before the browser renders the page.
+
+    Returns:
+        FetchedPage: The page and its validators, or None as the HTML for other statuses.
+        A page that times out is not retried in the browser. Responses fetched with requests are
+        returned as bytes so the parser can detect their encoding. A rendered page carries the
+        validators of the request made before it, if any.
+    """
+    domain = get_domain_from_url(url)
+    slot = slot or nullcontext()
+    if browser_fallback and prefers_browser(domain) and not (etag or last_modified):
+        # With nothing to revalidate the request would be wasted. Waits for the host's turn
+        # like a request, but renders without holding its slot.
+        with slot:
+            pass
+        return _render_page(url) or FetchedPage(None)
+
+    with slot, span("fetch", domain=domain) as fetch_span:
+        page, render = _request_page(url, session, headers, etag, last_modified, timeout, total_timeout, browser_fallback)
+        fetch_span.set(bytes=len(page.html) if page.html else 0, not_modified=page.not_modified)
+    if not render:
+        return page
+    rendered = _render_page(url)
+    if rendered is None:
+        return page
+    remember_browser_needed(domain)
+    # The next fetch of the page can then be conditional
+    return rendered._replace(etag=page.etag, last_modified=page.last_modified)
+
+def _request_page(
+    url: str,
+    session: requests.Session,
+    headers: Dict[str, str],
+    etag: Optional[str],
+    last_modified: Optional[str],
+    timeout: Optional[Tuple[float, float]],
+    total_timeout: Optional[float],
+    browser_fallback: bool
+) -> Tuple[FetchedPage, bool]:
+    """
+    Requests a page with requests.
+
+    Returns:
+        Tuple[FetchedPage, bool]: The page, and whether to load it in the browser instead.
+    """
     try:
-        response = session.get(url, headers=headers)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            tables = soup.find_all('table')
-            return url, tables
-        else:
-            # Fall back to Selenium if requests fails
-            # Useful if websites load content dynamically with JavaScript.
-            chrome_options = Options()
-            chrome_options.add_argument('--headless')
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            driver = webdriver.Chrome(service=Service(), options=chrome_options)
-
-            driver.get(url)
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, 'table'))
-            )
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
-            tables = soup.find_all('table')
-            driver.quit()
-            return url, tables
+        conditional_headers = dict(headers)
+        if etag:
+            conditional_headers['If-None-Match'] = etag
+        if last_modified:
+            conditional_headers['If-Modified-Since'] = last_modified
+
+        with session.get(url, headers=conditional_headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and (etag or last_modified):
+                return FetchedPage(None, not_modified=True, etag=etag, last_modified=last_modified), False
+            if response.status_code == 200:
+                page = FetchedPage(
+                    read_body(response, total_timeout),
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified')
+                )
+                # Tables may be loaded dynamically with JavaScript
+                return page, browser_fallback and not _TABLE_TAG.search(page.html)
+            return FetchedPage(None), browser_fallback and response.status_code in BROWSER_FALLBACK_STATUSES
     except requests.RequestException as e:
         print(f"Failed to retrieve {url} with requests: {e}")
-        return url, None
+        return FetchedPage(None), False
+    except Exception as e:
+        print(f"An error occurred with {url} using requests: {e}")
+        return FetchedPage(None), False
+
+def _render_page(url: str) -> Optional[FetchedPage]:
+    """
+    Loads a page in the pooled headless browser, which limits its own concurrency.
+
+    Returns:
+        Optional[FetchedPage]: The rendered page, or None if no table appeared or the browser failed.
+    """
+    try:
+        return FetchedPage(render_page(url))
     except Exception as e:
         print(f"An error occurred with {url} using Selenium: {e}")
+        return None
+
+def read_body(response: requests.Response, total_timeout: Optional[float]) -> bytes:
+    """
+    Reads a streamed response body, giving up once total_timeout seconds have passed.
+
+    Raises:
+        FetchTimeout: If the body is not read in time.
+    """
+    if total_timeout is None:
+        return response.content
+    deadline = time.monotonic() + total_timeout
+    # read1 returns whatever has arrived instead of blocking for a full chunk, so a
+    # trickling server is noticed on time; urllib3 1.x only has the blocking read
+    read = getattr(response.raw, 'read1', None)
+    if read is None:
+        chunks = response.iter_content(chunk_size=1024)
+    else:
+        chunks = iter(lambda: read(64 * 1024, decode_content=True), b'')
+    parts = []
+    for part in chunks:
+        parts.append(part)
+        if time.monotonic() > deadline:
+            raise FetchTimeout(f"Reading {response.url} took longer than {total_timeout}s")
+    return b''.join(parts)
+
+def fetch_scheduled(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    scheduler: Optional[FetchScheduler] = None,
+    headers: Dict[str, str] = SCRAPE_HEADERS,
+    browser_fallback: bool = True
+) -> FetchedPage:
+    """
+    Fetches a page through the fetch scheduler, which applies per-host rate and
+    concurrency limits, the global concurrency limit and the request timeouts, and
+    reuses a keep-alive connection pool per host. See fetch_page.
+
+    Args:
+        url (str): The URL to fetch.
+        etag (Optional[str]): The ETag of the stored copy, sent as If-None-Match.
+        last_modified (Optional[str]): The Last-Modified of the stored copy, sent as If-Modified-Since.
+        scheduler (Optional[FetchScheduler]): The scheduler; defaults to the process-wide one.
+        headers (Dict[str, str]): The request headers.
+        browser_fallback (bool): Whether to render the page in the browser if requests does not get it.
+
+    Returns:
+        FetchedPage: The page and its validators.
+    """
+    scheduler = scheduler or get_fetch_scheduler()
+    # The slot is not held while a page renders in the browser, so a slow render does
+    # not hold up other fetches of its host or the global limit
+    return fetch_page(
+        url, scheduler.session(url), headers, etag, last_modified,
+        timeout=scheduler.timeout, total_timeout=scheduler.total_timeout,
+        browser_fallback=browser_fallback, slot=scheduler.slot(url)
+    )
+
+def fetch_html(url: str, session: requests.Session, headers: Dict[str, str]) -> Optional[Union[str, bytes]]:
+    """
+    Downloads a page unconditionally. See fetch_page.
+    """
+    return fetch_page(url, session, headers).html
+
+def parse_tables(html: Union[str, bytes]) -> List["Tag"]:
+    """
+    Parses a page and returns all of its <table> elements.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.find_all('table')
+
+def fetch_tables(url: str, session: requests.Session, headers: Dict[str, str]) -> Tuple[str, Optional[List["Tag"]]]:
+    html = fetch_html(url, session, headers)
+    if html is None:
         return url, None
+    return url, parse_tables(html)
+
+def html_to_csv_tables(url: str, html: Union[str, bytes], backend: str = HTML_PARSER_BACKEND) -> List[str]:
+    """
+    Parses a page fetched from url and converts its tables to CSV strings.
+
+    Args:
+        url (str): The URL the page was fetched from.
+        html (Union[str, bytes]): The page HTML.
+        backend (str): The parser backend: 'stream', 'lxml' or 'bs4'.
+
+    Returns:
+        List[str]: One CSV string per table.
+    """
+    with span("parse", backend=backend, bytes=len(html)) as parse_span:
+        csv_tables = html_tables_to_csv(html, get_domain_from_url(url), backend)
+        parse_span.set(tables=len(csv_tables))
+    return csv_tables
 
 def scrape_single_url(url: str) -> Tuple[Optional[List[str]], Optional[str]]:
     """
@@ -57,32 +266,14 @@ def scrape_single_url(url: str) -> Tuple[Optional[List[str]], Optional[str]]:
     Returns:
         Tuple[Optional[List[str]], Optional[str]]: A list of CSV strings if successful, else an error message.
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Connection': 'keep-alive',
-        'sec-ch-ua': '"Not/A)Brand";v="8", "Chromium";v="126", "Google Chrome";v="126"',
-        'sec-ch-ua-mobile': '?0',
-        'sec-ch-ua-platform': '"macOS"',
-        'sec-fetch-dest': 'document',
-        'sec-fetch-mode': 'navigate',
-        'sec-fetch-site': 'none',
-        'sec-fetch-user': '?1',
-        'upgrade-insecure-requests': '1'
-    }
-
-    session = requests.Session()
-
     try:
-        url_fetched, tables = fetch_tables(url, session, headers)
-        if tables is None:
-            return None, f"Failed to retrieve tables from {url_fetched}"
+        html = fetch_scheduled(url).html
+        if html is None:
+            return None, f"Failed to retrieve tables from {url}"
         
-        csv_tables = convert_tables_to_csv({url_fetched: tables}).get(url_fetched, [])
+        csv_tables = html_to_csv_tables(url, html)
         if not csv_tables:
-            return None, f"No tables found at {url_fetched}"
+            return None, f"No tables found at {url}"
         
         return csv_tables, None
     except Exception as e:
@@ -92,22 +283,11 @@ def get_domain_from_url(url: str) -> str:
     parsed_url = urlparse(url)
     return parsed_url.netloc
 
-def table_to_csv(table: Tag, domain: str) -> str:
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    first_row = True
-    for row in table.find_all('tr'):
-        cols = row.find_all(['td', 'th'])
-        row_data = [col.get_text(strip=True) for col in cols]
-        if first_row:
-            row_data.insert(0, domain)
-            first_row = False
-        writer.writerow(row_data)
-
-    return output.getvalue()
+def table_to_csv(table: "Tag", domain: str) -> str:
+    # Rows of nested tables are left to those tables, and rowspan/colspan are expanded
+    return rows_to_csv(expand_spans(tag_table_rows(table)), domain)
 
-def convert_tables_to_csv(results: Dict[str, Optional[List[Tag]]]) -> Dict[str, List[str]]:
+def convert_tables_to_csv(results: Dict[str, Optional[List["Tag"]]]) -> Dict[str, List[str]]:
     csv_results: Dict[str, List[str]] = {}
 
     for url, tables in results.items():
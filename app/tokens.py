@@ -0,0 +1,45 @@
+# tokens.py
+import math
+from functools import lru_cache
+
+# Average characters per token for English text and CSV with GPT-4 class tokenizers
+CHARS_PER_TOKEN = 4
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    # Imported on first use; tiktoken is optional and slow to import
+    try:
+        import tiktoken
+    except ImportError:  # fall back to an estimate
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # e.g. the encoding files could not be downloaded
+        print(f"Failed to load tiktoken encoding for {model}, estimating tokens instead: {e}")
+        return None
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Counts the tokens in text for the given model.
+
+    Uses tiktoken when it is installed, otherwise estimates from the character count.
+
+    Args:
+        text (str): The text to count.
+        model (str): The model whose tokenizer to use.
+
+    Returns:
+        int: The number of tokens.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+# Define module exports
+__all__ = ['count_tokens']
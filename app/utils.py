@@ -1,40 +1,113 @@
-import boto3
-from botocore.exceptions import ClientError
 import os
 import json
-from dotenv import load_dotenv
-from typing import List
+import threading
+import time
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from .models import BankResponse
 
-# Fetch OpenAI API key from local environment or AWS Secrets Manager
-def get_openai_api_key():
-    if os.getenv("ENVIRONMENT") == "local":
-        # Use key from .env for local development
-        return os.getenv("OPENAI_API_KEY")
-    else:
-        # The name and region of the secret in AWS Secrets Manager
-        secret_name = "bank-rate-collector/openai-api-key" 
-        region_name = "us-east-2" 
+# boto3 and openai are imported on first use so they do not slow down every cold start
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+# How long the API key fetched from Secrets Manager is reused before it is fetched again
+OPENAI_API_KEY_TTL_SECONDS = float(os.getenv("OPENAI_API_KEY_TTL_SECONDS", "3600"))
+
+_credentials_lock = threading.Lock()
+_secrets_client = None
+_cached_api_key: Optional[str] = None
+_cached_api_key_fetched_at = 0.0
+_openai_client: Optional["OpenAI"] = None
+_openai_client_api_key: Optional[str] = None
+# Measured cost of the last secret fetch and client construction, used to estimate
+# the latency saved each time the cached client is reused.
+_last_secret_fetch_seconds = 0.0
+_last_client_build_seconds = 0.0
+
+def _fetch_openai_api_key_from_secrets_manager() -> str:
+    import boto3
+    from botocore.exceptions import ClientError
 
-        # Create a Secrets Manager client
+    global _secrets_client
+
+    # The name and region of the secret in AWS Secrets Manager
+    secret_name = "bank-rate-collector/openai-api-key" 
+    region_name = "us-east-2" 
+
+    # Create a Secrets Manager client once and reuse it across invocations
+    if _secrets_client is None:
         session = boto3.session.Session()
-        client = session.client(
+        _secrets_client = session.client(
             service_name='secretsmanager',
             region_name=region_name
         )
 
-        try:
-            get_secret_value_response = client.get_secret_value(
-                SecretId=secret_name
-            )
-        except ClientError as e:
-            # For a list of exceptions thrown, see
-            # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
-            raise e
-
-        secret = get_secret_value_response['SecretString']
-        secret_dict = json.loads(secret)
-        return secret_dict["OPENAI_API_KEY"]
+    try:
+        get_secret_value_response = _secrets_client.get_secret_value(
+            SecretId=secret_name
+        )
+    except ClientError as e:
+        # For a list of exceptions thrown, see
+        # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
+        raise e
+
+    secret = get_secret_value_response['SecretString']
+    secret_dict = json.loads(secret)
+    return secret_dict["OPENAI_API_KEY"]
+
+# Fetch OpenAI API key from local environment or AWS Secrets Manager
+def get_openai_api_key(force_refresh: bool = False):
+    """
+    Returns the OpenAI API key, caching the Secrets Manager value for OPENAI_API_KEY_TTL_SECONDS.
+
+    Args:
+        force_refresh (bool): Fetch the secret again even if the cached value has not expired.
+
+    Returns:
+        str: The OpenAI API key.
+    """
+    global _cached_api_key, _cached_api_key_fetched_at, _last_secret_fetch_seconds
+
+    if os.getenv("ENVIRONMENT") == "local":
+        # Use key from .env for local development
+        return os.getenv("OPENAI_API_KEY")
+
+    with _credentials_lock:
+        age = time.monotonic() - _cached_api_key_fetched_at
+        if _cached_api_key is None or force_refresh or age >= OPENAI_API_KEY_TTL_SECONDS:
+            start_time = time.perf_counter()
+            _cached_api_key = _fetch_openai_api_key_from_secrets_manager()
+            _last_secret_fetch_seconds = time.perf_counter() - start_time
+            _cached_api_key_fetched_at = time.monotonic()
+        return _cached_api_key
+
+def get_openai_client(force_refresh: bool = False) -> Tuple["OpenAI", float]:
+    """
+    Returns a shared OpenAI client, reused across chunks and warm Lambda invocations so
+    its keep-alive connection pool is reused too.
+
+    Args:
+        force_refresh (bool): Re-fetch the API key and rebuild the client, e.g. after an
+            authentication failure.
+
+    Returns:
+        Tuple[OpenAI, float]: The client and the estimated setup seconds saved by reusing
+        it (0.0 if it was just built).
+    """
+    from openai import OpenAI
+
+    global _openai_client, _openai_client_api_key, _last_client_build_seconds
+
+    api_key = get_openai_api_key(force_refresh=force_refresh)
+    with _credentials_lock:
+        if _openai_client is not None and _openai_client_api_key == api_key and not force_refresh:
+            return _openai_client, _last_secret_fetch_seconds + _last_client_build_seconds
+
+        start_time = time.perf_counter()
+        # Retries are handled by the extraction engine
+        _openai_client = OpenAI(api_key=api_key, max_retries=0)
+        _openai_client_api_key = api_key
+        _last_client_build_seconds = time.perf_counter() - start_time
+        return _openai_client, 0.0
 
 # Print the CSV content for each URL
 def print_csv_tables(csv_tables_dict):
@@ -0,0 +1,146 @@
+# benchmarks/bench_coalesce.py
+"""
+Sends a burst of concurrent POST /extract requests for the same corpus page, spelled
+a few different ways, to the FastAPI app in-process, with the replay server for the
+page and the fake OpenAI server for the LLM. Reports the page fetches, LLM calls and
+latency of the burst with coalescing off and on, then sends one more request within
+the result window, and finally runs the same extraction in several processes sharing
+the SQLite flight store.
+
+Fails if a coalesced burst or the processes fetch the page more than once, the
+responses of a burst differ, the repeat fetches the page again, or the coalesced
+requests are not counted in the metrics.
+
+    python -m benchmarks.bench_coalesce [--clients 20] [--processes 4] [--latency 0.2] [--llm-latency 0.3]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from benchmarks.bench_pipeline import call_asgi, percentile
+from benchmarks.corpus import load_manifest
+from benchmarks.fake_openai_server import FakeOpenAIConfig, start_fake_openai_server
+from benchmarks.replay_server import ReplayConfig, replay_path, start_replay_server
+
+def spellings(base: str, path: str) -> List[str]:
+    """
+    Returns ways a client may spell the same page URL.
+    """
+    return [f"{base}{path}", f"{base}{path}#rates", f"HTTP{base[4:]}{path}"]
+
+def burst(app, urls: List[str], clients: int) -> Tuple[List[int], List[bytes], List[float]]:
+    def request(index: int) -> Tuple[int, bytes, float]:
+        start = time.perf_counter()
+        status, body = call_asgi(app, "POST", "/extract", json.dumps({"url": urls[index % len(urls)]}).encode())
+        return status, body, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(request, range(clients)))
+    return [status for status, _, _ in results], [body for _, body, _ in results], [seconds for _, _, seconds in results]
+
+def extract_in_process(url: str, barrier) -> Tuple[str, str]:
+    """
+    Runs in a spawned process with the environment of the parent.
+    """
+    from app.pipeline import dump_result, extract_url_coalesced
+
+    barrier.wait()
+    result, how = extract_url_coalesced(url)
+    return dump_result(result), how
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the replay server waits before each page.")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--page", type=int, default=0, help="Index of the corpus page in manifest.json.")
+    args = parser.parse_args()
+
+    page_server, pages = start_replay_server(config=ReplayConfig(latency=args.latency))
+    llm_server, llm = start_fake_openai_server(config=FakeOpenAIConfig(latency=args.llm_latency))
+    directory = tempfile.mkdtemp()
+    os.environ.update(
+        ENVIRONMENT="local",
+        OPENAI_API_KEY="benchmark",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{llm_server.server_port}/v1",
+        # Without the caches every request that is not coalesced fetches and extracts
+        EXTRACTION_CACHE_BACKEND="none",
+        FETCH_STATE_BACKEND="none",
+        HISTORY_BACKEND="none",
+        FETCH_RATE_PER_SECOND="0",
+        FETCH_PER_HOST_CONCURRENCY=str(args.clients),
+        COALESCE_PATH=os.path.join(directory, "coalesce.sqlite3"),
+    )
+    # Imported after the environment is set up
+    import app.coalesce
+    from app.main import app as fastapi_app
+    from app.metrics import render_metrics
+
+    base = f"http://127.0.0.1:{page_server.server_port}"
+    path = replay_path(load_manifest()[args.page]["url"])
+    urls = spellings(base, path)
+    failures = []
+
+    print(f"{'coalescing':<11} {'requests':>8} {'fetches':>8} {'llm calls':>9} {'p50 ms':>8} {'p95 ms':>8} {'wall s':>7}")
+    for backend in ("none", "memory"):
+        os.environ["COALESCE_BACKEND"] = backend
+        app.coalesce._coalescer = None
+        fetches, calls = pages.requests, llm.calls
+        start = time.perf_counter()
+        statuses, bodies, seconds = burst(fastapi_app, urls, args.clients)
+        wall = time.perf_counter() - start
+        fetches, calls = pages.requests - fetches, llm.calls - calls
+        print(f"{backend:<11} {args.clients:>8} {fetches:>8} {calls:>9} {percentile(seconds, 0.5) * 1000:>8.0f} "
+              f"{percentile(seconds, 0.95) * 1000:>8.0f} {wall:>7.2f}")
+        if any(status != 200 for status in statuses):
+            failures.append(f"{backend}: statuses {sorted(set(statuses))}")
+        if backend == "memory":
+            if fetches != 1:
+                failures.append(f"the coalesced burst fetched the page {fetches} times")
+            if len(set(bodies)) != 1:
+                failures.append("the responses of the coalesced burst differ")
+
+    fetches = pages.requests
+    status, body = call_asgi(fastapi_app, "POST", "/extract", json.dumps({"url": urls[0]}).encode())
+    print(f"repeat within the window: {pages.requests - fetches} fetches, same response: {body == bodies[0]}")
+    if pages.requests != fetches or body != bodies[0]:
+        failures.append("the repeat within the window was extracted again")
+
+    prefix, suffix = "bank_rate_collector_stage_", "_total"
+    counted = {}
+    for line in render_metrics().splitlines():
+        name = line.split("{")[0]
+        if 'stage="coalesce"' in line and name.startswith(prefix) and name.endswith(suffix):
+            counted[name[len(prefix):-len(suffix)]] = float(line.rsplit(" ", 1)[1])
+    print(f"metrics: {counted}")
+    if counted.get("coalesced", 0) + counted.get("window_hits", 0) < args.clients:
+        failures.append(f"coalesced requests are missing from the metrics: {counted}")
+
+    # Separate processes, as with several uvicorn workers, sharing the SQLite store
+    os.environ["COALESCE_BACKEND"] = "sqlite"
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Manager().Barrier(args.processes)
+    fetches = pages.requests
+    with context.Pool(args.processes) as pool:
+        results = pool.starmap(extract_in_process, [(urls[index % len(urls)], barrier) for index in range(args.processes)])
+    fetches = pages.requests - fetches
+    hows = sorted(how for _, how in results)
+    print(f"{args.processes} processes, sqlite store: {fetches} fetches, {hows}")
+    if fetches != 1:
+        failures.append(f"{args.processes} processes fetched the page {fetches} times")
+    if len({value for value, _ in results}) != 1:
+        failures.append("the processes returned different results")
+
+    for failure in sorted(set(failures)):
+        print(f"FAIL {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
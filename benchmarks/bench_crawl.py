@@ -0,0 +1,262 @@
+# benchmarks/bench_crawl.py
+"""
+Crawls a synthetic bank site served by a local stub server, whose rate tables are the
+recorded corpus pages spread over a few pages among product pages, navigation and a
+feed of filler pages, with the fake OpenAI server for the LLM. Reports:
+
+- first crawl:  the pages fetched and LLM calls to find the rate pages, next to the
+                pages a breadth-first crawl in link order fetches to find them all
+- repeat crawl: the requests, 304s and LLM calls of crawling the site again; the
+                known rate pages are revalidated and the rest of the budget goes
+                to links the first crawl did not reach
+- revalidation: the same after the stored pages without rates went stale, so every
+                page crawled before is fetched again with its validators
+- small budget: the rate pages found by consecutive crawls that each fetch only a
+                few pages, which refresh the known rate pages first and continue
+                from the stored frontier
+
+Fails if the first crawl misses a rate page or exceeds its budget, a page without
+rate tables reaches the LLM, a path disallowed by robots.txt is fetched, the repeat
+crawl calls the LLM, fetches more or returns different rates, a page crawled before
+is downloaded again instead of answering 304, or the small crawls do not find every
+rate page. Crawl times are mostly the fetch scheduler's per-host rate limit.
+
+    python -m benchmarks.bench_crawl [--filler 30] [--max-pages 12] [--small-budget 6]
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Set, Tuple
+
+from benchmarks.corpus import load_rendered_pages
+from benchmarks.fake_openai_server import FakeOpenAIConfig, start_fake_openai_server
+
+RATE_PATHS = ["/rates", "/rates/certificates", "/loans/rates", "/personal/savings/rates", "/fees"]
+ROBOTS = b"User-agent: *\nDisallow: /private/\n"
+
+def link_list(links: List[Tuple[str, str]]) -> str:
+    return " ".join(f'<a href="{href}">{text}</a>' for href, text in links)
+
+def build_site(filler: int) -> Dict[str, bytes]:
+    """
+    Returns the site's pages by path. Filler pages come first on the home page, so a
+    crawl in link order reaches them before the product pages.
+    """
+    stories = [(f"/stories/{index}", f"Member story {index}") for index in range(filler)]
+    pages = {
+        "/": f"""<html><body>
+<header><nav>{link_list([("/", "Home"), ("/login", "Log In"), ("/careers", "Careers"), ("/locations", "Locations & Hours")])}</nav></header>
+<section><h2>Community</h2>{link_list(stories)}</section>
+<section>{link_list([("/personal", "Personal"), ("/business", "Business"), ("/about", "About Us"),
+                      ("/personal/savings", "Savings Accounts"), ("/loans", "Loans"),
+                      ("/private/rates", "Staff Rates"), ("/rates", "Today's Rates")])}</section>
+<footer>{link_list([("/privacy", "Privacy"), ("mailto:help@example.com", "Email us"), ("/disclosures.pdf", "Disclosures")])}</footer>
+</body></html>""",
+        "/personal": f"<html><body>{link_list([('/personal/checking', 'Checking'), ('/personal/savings', 'Savings'), ('/fees', 'Fee Schedule')])}</body></html>",
+        "/personal/savings": f"<html><body><p>Grow your savings.</p>{link_list([('/personal/savings/rates', 'See savings rates')])}</body></html>",
+        "/personal/checking": "<html><body><p>Free checking for everyone.</p></body></html>",
+        "/loans": f"<html><body><p>Borrow with us.</p>{link_list([('/loans/rates', 'Loan rates'), ('/loans/apply', 'Apply now')])}</body></html>",
+        "/business": "<html><body><p>Banking for your business.</p></body></html>",
+        "/about": "<html><body><table><tr><th>Board member</th><th>Since</th></tr><tr><td>Pat Lee</td><td>2011</td></tr></table></body></html>",
+        "/locations": "<html><body><table><tr><th>Branch</th><th>Hours</th></tr><tr><td>Main St</td><td>Monday 9:00 am</td></tr></table></body></html>",
+        "/private/rates": "<html><body><table><tr><th>Term</th><th>APY</th></tr><tr><td>12 months</td><td>9.99%</td></tr></table></body></html>",
+    }
+    for path, _ in stories:
+        pages[path] = f"<html><body><p>A story from our members.</p>{link_list([('/', 'Home')])}</body></html>"
+    corpus = load_rendered_pages()
+    for index, path in enumerate(RATE_PATHS):
+        html = corpus[index % len(corpus)]["html"]
+        if path == "/rates":
+            links = link_list([("/rates/certificates", "Certificate Rates"), ("/loans/rates", "Loan Rates")])
+            html = html.replace(b"</body>", links.encode() + b"</body>")
+        pages[path] = html
+    return {path: page if isinstance(page, bytes) else page.encode() for path, page in pages.items()}
+
+class SiteConfig:
+    def __init__(self, pages: Dict[str, bytes]):
+        self.pages = pages
+        self.requests: List[str] = []
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+def start_site_server(config: SiteConfig) -> ThreadingHTTPServer:
+    class SiteHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            with config.lock:
+                config.requests.append(path)
+            page = ROBOTS if path == "/robots.txt" else config.pages.get(path)
+            if page is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            etag = '"%s"' % hashlib.sha256(page).hexdigest()[:32]
+            if self.headers.get("If-None-Match") == etag:
+                with config.lock:
+                    config.not_modified += 1
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain" if path == "/robots.txt" else "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(page)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def breadth_first_fetches(base: str, pages: Dict[str, bytes], rate_urls: Set[str], max_depth: int) -> int:
+    """
+    Returns how many pages a breadth-first crawl following links in page order fetches
+    before it has fetched every rate page.
+    """
+    from app.crawl import LinkParser, normalize_link, start_url
+    from app.parsers import decode_html
+    from app.domains import root_domain, same_site
+
+    start = start_url(base)
+    site = root_domain(start.split("/")[2])
+    queue, seen, found, fetched = deque([(start, 0)]), {start}, set(), 0
+    while queue and found != rate_urls:
+        url, depth = queue.popleft()
+        page = pages.get("/" + url.split("/", 3)[3])
+        fetched += 1
+        if url in rate_urls:
+            found.add(url)
+        if page is None or depth >= max_depth:
+            continue
+        parser = LinkParser()
+        parser.feed(decode_html(page))
+        parser.close()
+        for href, _ in parser.links:
+            link = normalize_link(url, href)
+            if link is not None and same_site(link.split("/")[2], site) and link not in seen:
+                seen.add(link)
+                queue.append((link, depth + 1))
+    return fetched
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filler", type=int, default=30, help="Filler pages linked from the home page.")
+    parser.add_argument("--max-pages", type=int, default=12)
+    parser.add_argument("--max-depth", type=int, default=2)
+    parser.add_argument("--small-budget", type=int, default=6)
+    parser.add_argument("--small-runs", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    site = SiteConfig(build_site(args.filler))
+    site_server = start_site_server(site)
+    llm_server, llm = start_fake_openai_server(config=FakeOpenAIConfig(latency=args.llm_latency))
+    directory = tempfile.mkdtemp()
+    os.environ.update(
+        ENVIRONMENT="local",
+        OPENAI_API_KEY="benchmark",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{llm_server.server_port}/v1",
+        # Without the extraction cache every LLM call reaches the fake server
+        EXTRACTION_CACHE_BACKEND="none",
+        HISTORY_BACKEND="none",
+        FETCH_STATE_PATH=os.path.join(directory, "fetch_state.sqlite3"),
+        CRAWL_STATE_PATH=os.path.join(directory, "crawl_state.sqlite3"),
+    )
+    # Imported after the environment is set up
+    import app.crawl
+    import app.fetch_state
+    from app.crawl import crawl_site
+
+    def reset_stores(name: str) -> None:
+        os.environ.update(
+            FETCH_STATE_PATH=os.path.join(directory, f"{name}-fetch_state.sqlite3"),
+            CRAWL_STATE_PATH=os.path.join(directory, f"{name}-crawl_state.sqlite3"),
+        )
+        app.crawl._crawl_state_store = None
+        app.fetch_state._fetch_state_store = None
+
+    def crawl(max_pages: int):
+        requests_before, not_modified_before, calls_before = len(site.requests), site.not_modified, llm.calls
+        start = time.perf_counter()
+        result = crawl_site(base, max_pages=max_pages, max_depth=args.max_depth)
+        seconds = time.perf_counter() - start
+        return (result, seconds, len(site.requests) - requests_before,
+                site.not_modified - not_modified_before, llm.calls - calls_before)
+
+    base = f"http://127.0.0.1:{site_server.server_port}"
+    rate_urls = {base + path for path in RATE_PATHS}
+    failures = []
+
+    reset_stores("full")
+    first, seconds, requests, _, calls = crawl(args.max_pages)
+    found = {page.url for page in first.pages if page.status == "rates"}
+    llm_pages = [page.url for page in first.pages if page.stats and page.stats.chunks and page.url not in rate_urls]
+    baseline = breadth_first_fetches(base, site.pages, rate_urls, args.max_depth)
+    print(f"first crawl:  {first.pages_fetched} pages fetched ({requests} requests with robots.txt), "
+          f"{len(found)} of {len(rate_urls)} rate pages, {calls} LLM calls, {seconds:.2f}s; "
+          f"breadth-first in link order fetches {baseline} pages")
+    for page in first.pages:
+        print(f"  {page.status:<15} depth {page.depth} score {page.score:>4.1f} {page.url}")
+    if found != rate_urls:
+        failures.append(f"the first crawl missed {sorted(rate_urls - found)}")
+    if first.pages_fetched > args.max_pages:
+        failures.append(f"the first crawl fetched {first.pages_fetched} pages with a budget of {args.max_pages}")
+    if llm_pages:
+        failures.append(f"pages without rate tables reached the LLM: {llm_pages}")
+    if any(path.startswith("/private/") for path in site.requests):
+        failures.append("a path disallowed by robots.txt was fetched")
+    if not first.bank_response:
+        failures.append("the first crawl returned no rates")
+
+    crawled = {page.url for page in first.pages if page.stats is not None}
+    for name, refresh_seconds in (("repeat crawl", app.crawl.CRAWL_REFRESH_SECONDS), ("revalidation", 0.0)):
+        app.crawl.CRAWL_REFRESH_SECONDS = refresh_seconds
+        result, seconds, result_requests, not_modified, calls = crawl(args.max_pages)
+        known = sum(1 for page in result.pages if page.status == "known")
+        refetched = [page for page in result.pages if page.stats is not None and page.url in crawled]
+        downloaded = [page.url for page in refetched if not page.stats.not_modified]
+        print(f"{name + ':':<13} {result.pages_fetched} pages fetched ({result_requests} requests, {not_modified} not modified), "
+              f"{len(refetched)} of them crawled before, {known} pages followed from stored links, "
+              f"{calls} LLM calls, {seconds:.2f}s")
+        if calls:
+            failures.append(f"the {name} made {calls} LLM calls")
+        if result_requests > requests:
+            failures.append(f"the {name} made {result_requests} requests, the first crawl {requests}")
+        if downloaded:
+            failures.append(f"the {name} downloaded pages crawled before again: {downloaded}")
+        if result.bank_response is None or first.bank_response.model_dump() != result.bank_response.model_dump():
+            failures.append(f"the {name} returned different rates")
+        crawled |= {page.url for page in result.pages if page.stats is not None}
+
+    reset_stores("small")
+    found_so_far: Set[str] = set()
+    for run in range(1, args.small_runs + 1):
+        result, _, _, _, _ = crawl(args.small_budget)
+        found_so_far |= {page.url for page in result.pages if page.status == "rates"}
+        print(f"budget {args.small_budget}, crawl {run}: {len(found_so_far)} of {len(rate_urls)} rate pages found so far, "
+              f"{result.frontier} links left in the frontier")
+        if found_so_far == rate_urls:
+            break
+    if found_so_far != rate_urls:
+        failures.append(f"{args.small_runs} crawls of {args.small_budget} pages did not find every rate page")
+
+    for failure in sorted(set(failures)):
+        print(f"FAIL {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# benchmarks/bench_fetch.py
+"""
+Exercises the fetch scheduler against local stub servers and fails if it is not
+polite, fair or bounded in time:
+
+- fairness:   a slow host's URLs do not delay a fast host's URLs
+- rate limit: requests to one host stay within its token bucket
+- timeouts:   a server that never answers, and one that trickles out its page,
+              are both given up on within the configured timeouts
+- reuse:      sequential fetches from one host reuse its keep-alive connections
+
+    python -m benchmarks.bench_fetch [--slow-latency 2] [--rate 5]
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+from app.scheduler import FetchScheduler
+from app.scrape import fetch_scheduled
+
+PAGE = b"<html><body><table><tr><th>Term</th><th>APY</th></tr><tr><td>12 months</td><td>4.00%</td></tr></table></body></html>"
+
+class StubConfig:
+    """
+    Behavior and request log of one stub server.
+    """
+
+    def __init__(self, latency: float = 0.0, hang: float = 0.0, trickle: float = 0.0):
+        self.latency = latency
+        # Seconds to wait before answering at all
+        self.hang = hang
+        # Seconds between each byte of the body
+        self.trickle = trickle
+        self.request_times: List[float] = []
+        self.connections = set()
+        self.lock = threading.Lock()
+
+def start_stub_server(config: StubConfig) -> Tuple[ThreadingHTTPServer, str]:
+    class StubHandler(BaseHTTPRequestHandler):
+        # Keep-alive, so connection reuse can be observed
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            with config.lock:
+                config.request_times.append(time.monotonic())
+                config.connections.add(self.client_address)
+            time.sleep(config.hang or config.latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(PAGE)))
+            self.end_headers()
+            try:
+                if not config.trickle:
+                    self.wfile.write(PAGE)
+                    return
+                for index in range(len(PAGE)):
+                    self.wfile.write(PAGE[index:index + 1])
+                    self.wfile.flush()
+                    time.sleep(config.trickle)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up, as it should with the hanging and trickling servers
+                self.close_connection = True
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def timed_fetch(url: str, scheduler: FetchScheduler) -> Tuple[float, bool]:
+    start = time.perf_counter()
+    page = fetch_scheduled(url, scheduler=scheduler)
+    return time.perf_counter() - start, page.html is not None
+
+def check_fairness(slow_latency: float, urls: int) -> List[str]:
+    slow, slow_base = start_stub_server(StubConfig(latency=slow_latency))
+    fast, fast_base = start_stub_server(StubConfig(latency=0.01))
+    scheduler = FetchScheduler(max_concurrency=4, per_host_concurrency=2, rate_per_second=0, read_timeout=slow_latency * 2)
+
+    # The slow host's URLs are submitted first
+    jobs = [f"{slow_base}/slow/{i}" for i in range(urls)] + [f"{fast_base}/fast/{i}" for i in range(urls)]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        results = list(executor.map(lambda url: timed_fetch(url, scheduler), jobs))
+    slow_times, fast_times = [seconds for seconds, _ in results[:urls]], [seconds for seconds, _ in results[urls:]]
+    print(f"fairness:   slow host last page after {max(slow_times):.2f}s, fast host last page after {max(fast_times):.2f}s")
+    scheduler.close()
+    for server in (slow, fast):
+        server.shutdown()
+
+    failures = []
+    if not all(ok for _, ok in results):
+        failures.append("fairness: some fetches failed")
+    if max(fast_times) > slow_latency:
+        failures.append(f"fairness: the fast host waited {max(fast_times):.2f}s behind the slow host")
+    return failures
+
+def check_rate_limit(rate: float, burst: int, urls: int) -> List[str]:
+    config = StubConfig()
+    server, base = start_stub_server(config)
+    scheduler = FetchScheduler(per_host_concurrency=4, rate_per_second=rate, burst=burst)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=urls) as executor:
+        list(executor.map(lambda i: timed_fetch(f"{base}/page/{i}", scheduler), range(urls)))
+    elapsed = time.monotonic() - start
+    times = sorted(config.request_times)
+    # The most requests that arrived within any one second
+    busiest = max(sum(1 for other in times if t <= other < t + 1) for t in times)
+    print(f"rate limit: {urls} requests at {rate}/s (burst {burst}) took {elapsed:.2f}s, at most {busiest} in one second")
+    scheduler.close()
+    server.shutdown()
+
+    failures = []
+    if busiest > rate + burst:
+        failures.append(f"rate limit: {busiest} requests in one second, limit {rate}/s with burst {burst}")
+    if elapsed < (urls - burst) / rate * 0.9:
+        failures.append(f"rate limit: {urls} requests finished in {elapsed:.2f}s, faster than the limit allows")
+    return failures
+
+def check_timeouts(read_timeout: float, total_timeout: float) -> List[str]:
+    failures = []
+    scheduler = FetchScheduler(rate_per_second=0, read_timeout=read_timeout, total_timeout=total_timeout)
+    for name, config, limit in (
+        ("hanging", StubConfig(hang=read_timeout * 10), read_timeout),
+        ("trickling", StubConfig(trickle=read_timeout / 4), total_timeout + read_timeout),
+    ):
+        server, base = start_stub_server(config)
+        seconds, ok = timed_fetch(f"{base}/{name}", scheduler)
+        print(f"timeouts:   {name} server given up on after {seconds:.2f}s (limit {limit:.2f}s)")
+        if ok:
+            failures.append(f"timeouts: the {name} server's page was returned")
+        if seconds > limit + 0.5:
+            failures.append(f"timeouts: the {name} server held the fetch for {seconds:.2f}s")
+        server.shutdown()
+    scheduler.close()
+    return failures
+
+def check_reuse(urls: int) -> List[str]:
+    config = StubConfig()
+    server, base = start_stub_server(config)
+    scheduler = FetchScheduler(per_host_concurrency=2, rate_per_second=0)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(lambda i: timed_fetch(f"{base}/page/{i}", scheduler), range(urls)))
+    print(f"reuse:      {urls} fetches used {len(config.connections)} connections")
+    scheduler.close()
+    server.shutdown()
+    if len(config.connections) > scheduler.per_host_concurrency:
+        return [f"reuse: {urls} fetches opened {len(config.connections)} connections"]
+    return []
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="Response delay of the slow host in seconds.")
+    parser.add_argument("--rate", type=float, default=5.0, help="Requests per second allowed per host.")
+    parser.add_argument("--burst", type=int, default=2)
+    parser.add_argument("--urls", type=int, default=12, help="URLs per host.")
+    parser.add_argument("--read-timeout", type=float, default=1.0)
+    parser.add_argument("--total-timeout", type=float, default=2.0)
+    args = parser.parse_args()
+
+    failures = []
+    failures += check_fairness(args.slow_latency, args.urls)
+    failures += check_rate_limit(args.rate, args.burst, args.urls)
+    failures += check_timeouts(args.read_timeout, args.total_timeout)
+    failures += check_reuse(args.urls)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# benchmarks/bench_history.py
+"""
+Fills a rate history store with a simulated daily sweep of many banks, where a few
+banks change their rates each day, and reports the database size next to the JSON
+the same sweeps return, the record rate and the latency of the latest-rates and
+APY time series queries. Fails if a query does not return what was recorded or an
+unchanged result adds rows. With --backend local-kv, runs the same sweep against the
+key-value store used with DynamoDB or S3, held in memory.
+
+    python -m benchmarks.bench_history [--banks 200] [--days 90] [--change-rate 0.1] [--backend sqlite]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+from app.cache import LocalKeyValueStore
+from app.history import KeyValueRateHistoryStore, SQLiteRateHistoryStore
+from app.models import BankResponse, CertificateOfDepositResponse, FeeResponse, LoanResponse, SavingsAccountResponse
+from benchmarks.bench_pipeline import percentile
+
+CD_TERMS = ["3 Month", "6 Month", "12 Month", "18 Month", "24 Month", "36 Month", "48 Month", "60 Month"]
+LOAN_NAMES = ["New Auto", "Used Auto", "Personal", "Home Equity Line of Credit", "30 Year Fixed Mortgage"]
+FEE_NAMES = ["Overdraft", "Wire Transfer", "Stop Payment", "Foreign ATM", "Paper Statement", "Returned Item"]
+
+def make_response(bank: str, level: float) -> BankResponse:
+    """
+    Builds a bank's rate sheet around a rate level, so a change of level changes every rate.
+    """
+    return BankResponse(
+        bankRootDomain=bank,
+        savingsAccounts=[
+            SavingsAccountResponse(name=name, interestRate=round(level * factor, 2), annualPercentageYield=round(level * factor * 1.01, 2),
+                                   minimumBalanceToObtainAPY=None, minimumBalanceToOpen=25.0, minimumDailyBalance=None,
+                                   dividendRate=None, dividendFrequency=None)
+            for name, factor in (("Regular Savings", 0.05), ("High Yield Savings", 0.9))
+        ],
+        certificatesOfDeposit=[
+            CertificateOfDepositResponse(term=term, interestRate=None, annualPercentageYield=round(level + index * 0.05, 2),
+                                         minimumBalanceToObtainAPY=None, minimumBalanceToOpen=500.0, minimumDailyBalance=None)
+            for index, term in enumerate(CD_TERMS)
+        ],
+        loans=[
+            LoanResponse(name=name, term=60 if "Auto" in name else "Variable", annualPercentageRate=round(level + 2 + index, 3),
+                         minimumPayment=None, maximumLoanAmount=None, paymentPer1000Dollars=None, interestRate=None)
+            for index, name in enumerate(LOAN_NAMES)
+        ],
+        fees=[
+            FeeResponse(name=name, feeAmount=float(5 + index * 5), feeUnit="USD", oneTime=True, recurringInterval=None)
+            for index, name in enumerate(FEE_NAMES)
+        ],
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--banks", type=int, default=200)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--change-rate", type=float, default=0.1, help="Fraction of banks whose rates change each day.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=("sqlite", "local-kv"), default="sqlite")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    banks = [f"bank{index:04d}.com" for index in range(args.banks)]
+    levels = {bank: round(rng.uniform(3.0, 4.5), 2) for bank in banks}
+    # bank -> [(observed_at, 12 Month APY)] for each change, to check the time series against
+    expected: Dict[str, List] = {bank: [] for bank in banks}
+    latest: Dict[str, BankResponse] = {}
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "rate_history.sqlite3")
+        if args.backend == "sqlite":
+            store = SQLiteRateHistoryStore(path)
+        else:
+            items = LocalKeyValueStore()
+            store = KeyValueRateHistoryStore(items)
+        json_bytes = records = new_observations = 0
+        start = time.perf_counter()
+        for day in range(args.days):
+            observed_at = 1_700_000_000 + day * 86400
+            for bank in banks:
+                if day and rng.random() < args.change_rate:
+                    levels[bank] = round(levels[bank] + rng.choice((-0.25, 0.25)), 2)
+                response = make_response(bank, levels[bank])
+                json_bytes += len(response.model_dump_json())
+                records += 1
+                if store.record(f"https://www.{bank}/rates", response, observed_at=observed_at):
+                    new_observations += 1
+                    expected[bank].append((observed_at, response.certificatesOfDeposit[2].annualPercentageYield))
+                latest[bank] = response
+        record_seconds = time.perf_counter() - start
+        if args.backend == "sqlite":
+            db_bytes = os.path.getsize(path)
+        else:
+            db_bytes = sum(len(item['key']) + len(item['value']) for item in items._items.values())
+            db_bytes += sum(len(key) + sum(map(len, members)) for key, members in items._sets.items())
+
+        if new_observations != sum(len(changes) for changes in expected.values()):
+            failures.append("unchanged results were stored as new observations")
+
+        latest_seconds, series_seconds = [], []
+        tracemalloc.start()
+        for _ in range(args.queries):
+            bank = rng.choice(banks)
+            start = time.perf_counter()
+            rates = store.latest(bank)
+            latest_seconds.append(time.perf_counter() - start)
+            if rates is None or rates.bank_response != latest[bank]:
+                failures.append(f"latest rates of {bank} differ from the last recorded result")
+
+            start = time.perf_counter()
+            series = store.series(bank, "certificatesOfDeposit", "12 month")
+            series_seconds.append(time.perf_counter() - start)
+            if [(point.observed_at, point.value) for point in series.points] != expected[bank]:
+                failures.append(f"12 Month APY series of {bank} differs from the recorded changes")
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        store.close()
+
+    print(f"{args.banks} banks x {args.days} days, {args.change_rate:.0%} change per day: "
+          f"{records} results, {new_observations} observations stored")
+    print(f"size:    {json_bytes / 1e6:.1f} MB of JSON responses, {db_bytes / 1e6:.1f} MB history {args.backend} store "
+          f"({json_bytes / max(db_bytes, 1):.0f}x smaller)")
+    print(f"record:  {records / record_seconds:.0f} results/s")
+    print(f"latest:  p50 {percentile(latest_seconds, 0.5) * 1000:.2f} ms, p95 {percentile(latest_seconds, 0.95) * 1000:.2f} ms")
+    print(f"series:  p50 {percentile(series_seconds, 0.5) * 1000:.2f} ms, p95 {percentile(series_seconds, 0.95) * 1000:.2f} ms")
+    print(f"queries: peak {peak / 1e3:.0f} KB allocated")
+    for failure in sorted(set(failures)):
+        print(f"FAIL {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
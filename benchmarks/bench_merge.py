@@ -0,0 +1,99 @@
+# benchmarks/bench_merge.py
+"""
+Scaling benchmark for the BankResponse merge engine. Times merges of growing random
+pages and fails if the time per product grows with the page size.
+
+The random chunk results it merges, with duplicated products that differ in case,
+whitespace and missing optional fields, are also used by tests/test_merge.py, which
+checks the merge properties and hand-written expected merges.
+
+    python -m benchmarks.bench_merge [--seed 0] [--max-products 50000]
+"""
+import argparse
+import random
+import time
+from typing import Any, Dict, List
+
+from app.merge import merge_bank_responses, product_fields
+from app.models import BankResponse
+
+NAMES = ["Premier Checking", "Basic Savings", "Money Market Plus", "Share Certificate", "Auto Loan", "Overdraft Fee", "Visa Rewards"]
+TERMS = ["6 Months", "12 Months", "18 Months", "24 Months", "60", 60]
+
+def random_text(rng: random.Random, choices: List[Any]) -> Any:
+    value = rng.choice(choices)
+    if not isinstance(value, str):
+        return value
+    # Cosmetic variants that must merge with the original
+    return rng.choice([value, value.upper(), value.lower(), f"  {value} ", value.replace(" ", "  ")])
+
+def random_value(rng: random.Random, name: str, field) -> Any:
+    annotation = str(field.annotation)
+    if not field.is_required() or "None" in annotation:
+        if rng.random() < 0.5:
+            return None
+    if name == "name":
+        return random_text(rng, NAMES)
+    if name == "term":
+        value = random_text(rng, TERMS)
+        return value if "int" in annotation or isinstance(value, str) else str(value)
+    if "bool" in annotation:
+        return rng.random() < 0.5
+    if "float" in annotation:
+        return rng.choice([0.05, 0.5, 1.25, 4.5, 25.0])
+    return rng.choice(["Monthly", "Quarterly", "Per Item"])
+
+def random_response(rng: random.Random, products: int) -> BankResponse:
+    fields = product_fields()
+    lists: Dict[str, List] = {field: [] for field in fields}
+    for _ in range(products):
+        field = rng.choice(list(fields))
+        item = fields[field]
+        lists[field].append(item(**{name: random_value(rng, name, info) for name, info in item.model_fields.items()}))
+    return BankResponse(bankRootDomain="example.com", **lists)
+
+def split(rng: random.Random, response: BankResponse, parts: int) -> List[BankResponse]:
+    """
+    Splits a response's products across `parts` responses, keeping their order.
+    """
+    chunks = [{field: [] for field in product_fields()} for _ in range(parts)]
+    for field in product_fields():
+        products = getattr(response, field)
+        cuts = sorted(rng.randint(0, len(products)) for _ in range(parts - 1))
+        for index, (start, end) in enumerate(zip([0] + cuts, cuts + [len(products)])):
+            chunks[index][field] = products[start:end]
+    return [BankResponse(bankRootDomain=response.bankRootDomain, **chunk) for chunk in chunks]
+
+def time_merge(rng: random.Random, products: int, chunks: int = 20) -> float:
+    responses = split(rng, random_response(rng, products), chunks)
+    start = time.perf_counter()
+    merge_bank_responses(responses)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-products", type=int, default=50000, help="Largest page to time.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failures = []
+
+    print(f"{'products':>9} {'ms':>9} {'us/product':>11}")
+    per_product = []
+    products = 500
+    while products <= args.max_products:
+        seconds = min(time_merge(rng, products) for _ in range(3))
+        per_product.append(seconds / products)
+        print(f"{products:>9} {seconds * 1000:>9.1f} {seconds / products * 1e6:>11.2f}")
+        products *= 10
+    if len(per_product) > 1 and per_product[-1] > per_product[0] * 3:
+        failures.append("merge time per product grows with the page size")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/bench_parsers.py
+"""
+Micro-benchmark of the HTML table parser backends. Checks that every backend
+produces the same CSV as the BeautifulSoup path on the corpus, and that tables
+without spans match the original (span-unaware) table_to_csv, then times each
+backend and measures its peak Python memory on a large synthetic page.
+
+    python -m benchmarks.bench_parsers [--repeat 5] [--scale 40]
+"""
+import argparse
+import csv
+import io
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from app.parsers import TABLE_ROW_BACKENDS, html_tables_to_csv
+from benchmarks.corpus import load_manifest, read_page
+
+def legacy_tables_to_csv(html, domain):
+    """The original span-unaware conversion, kept here for comparison."""
+    csv_tables = []
+    for table in BeautifulSoup(html, 'html.parser').find_all('table'):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        first_row = True
+        for row in table.find_all('tr'):
+            row_data = [col.get_text(strip=True) for col in row.find_all(['td', 'th'])]
+            if first_row:
+                row_data.insert(0, domain)
+                first_row = False
+            writer.writerow(row_data)
+        csv_tables.append(output.getvalue())
+    return csv_tables
+
+def large_page(scale):
+    pages = [read_page(entry.get("rendered", entry["file"])) for entry in load_manifest()]
+    return b"<html><body>" + b"".join(pages) * scale + b"</body></html>"
+
+def check_corpus():
+    ok = True
+    for entry in load_manifest():
+        for file_name in [entry["file"]] + ([entry["rendered"]] if "rendered" in entry else []):
+            html = read_page(file_name)
+            reference = html_tables_to_csv(html, "example.com", "bs4")
+            for backend in TABLE_ROW_BACKENDS:
+                if html_tables_to_csv(html, "example.com", backend) != reference:
+                    print(f"MISMATCH {backend} on {file_name}")
+                    ok = False
+            legacy = legacy_tables_to_csv(html, "example.com")
+            for index, (new, old) in enumerate(zip(reference, legacy)):
+                if new != old and "span" not in str(BeautifulSoup(html, 'html.parser').find_all('table')[index]):
+                    print(f"MISMATCH legacy on {file_name} table {index}")
+                    ok = False
+    print("Corpus output identical across backends" if ok else "Corpus output differs")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=40, help="Copies of the corpus in the large page.")
+    args = parser.parse_args()
+
+    ok = check_corpus()
+
+    html = large_page(args.scale)
+    print(f"Large page: {len(html) / 1e6:.1f} MB")
+    print(f"{'backend':<8} {'best s':>8} {'peak MB':>8} {'tables':>7}")
+    for backend in ["bs4"] + [name for name in TABLE_ROW_BACKENDS if name != "bs4"]:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            csv_tables = html_tables_to_csv(html, "example.com", backend)
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        html_tables_to_csv(html, "example.com", backend)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{backend:<8} {min(timings):>8.3f} {peak / 1e6:>8.1f} {len(csv_tables):>7}")
+
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
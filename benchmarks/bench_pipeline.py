@@ -0,0 +1,242 @@
+# benchmarks/bench_pipeline.py
+"""
+Offline end-to-end benchmark of the scrape and extract pipeline, using the replay
+server for the bank pages and the fake OpenAI server for the LLM.
+
+Three modes are measured:
+- scrape:  scrape_single_url against the replayed pages
+- extract: process_and_extract_tables_single on the parsed tables
+- app:     POST /extract on the FastAPI app, called in-process over ASGI
+
+For each mode it reports p50/p95 latency, throughput at the given concurrency,
+LLM calls per page and the peak RSS of the process so far. Save a run with
+--output and compare later runs against it with --baseline to catch regressions.
+
+    python -m benchmarks.bench_pipeline --concurrency 4 --iterations 5 --llm-latency 0.2
+    python -m benchmarks.bench_pipeline --output baseline.json
+    python -m benchmarks.bench_pipeline --baseline baseline.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.corpus import load_manifest, read_page
+from benchmarks.fake_openai_server import FakeOpenAIConfig, start_fake_openai_server
+from benchmarks.replay_server import ReplayConfig, replay_path, start_replay_server
+
+MODES = ("scrape", "extract", "app")
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Returns the nearest-rank percentile of values.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def call_asgi(app, method: str, path: str, body: bytes) -> Tuple[int, bytes]:
+    """
+    Sends one HTTP request to an ASGI app in-process and returns the status and body.
+    """
+    async def run() -> Tuple[int, bytes]:
+        request_sent = False
+        response_done = asyncio.Event()
+        status = 0
+        chunks: List[bytes] = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body"):
+                    response_done.set()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            "client": ("127.0.0.1", 0),
+            "server": ("benchmark", 80),
+        }
+        await app(scope, receive, send)
+        return status, b"".join(chunks)
+
+    return asyncio.run(run())
+
+def run_mode(
+    name: str,
+    work: Callable[[Dict], bool],
+    pages: List[Dict],
+    iterations: int,
+    concurrency: int,
+    llm: FakeOpenAIConfig
+) -> Dict:
+    """
+    Runs work once per page per iteration with `concurrency` threads and summarizes it.
+    work returns True if the page succeeded.
+    """
+    jobs = [page for _ in range(iterations) for page in pages]
+    latencies: List[float] = []
+    errors = 0
+    calls_before = llm.calls
+
+    def timed(page: Dict) -> Tuple[float, bool]:
+        start = time.perf_counter()
+        try:
+            ok = work(page)
+        except Exception as e:
+            print(f"{name}: {page['url']} raised {e}", file=sys.stderr)
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for seconds, ok in executor.map(timed, jobs):
+            latencies.append(seconds)
+            errors += 0 if ok else 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": name,
+        "pages": len(jobs),
+        "errors": errors,
+        "concurrency": concurrency,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "throughput_pages_per_s": round(len(jobs) / elapsed, 2) if elapsed else 0.0,
+        "llm_calls_per_page": round((llm.calls - calls_before) / len(jobs), 2) if jobs else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """
+    Returns a description of every metric that is worse than the baseline by more than tolerance.
+    """
+    regressions = []
+    previous = {result["mode"]: result for result in baseline}
+    # metric -> True if higher is worse
+    metrics = {"p50_ms": True, "p95_ms": True, "peak_rss_mb": True, "llm_calls_per_page": True, "throughput_pages_per_s": False}
+    for result in results:
+        old = previous.get(result["mode"])
+        if old is None:
+            continue
+        for metric, higher_is_worse in metrics.items():
+            before, after = old[metric], result[metric]
+            if higher_is_worse and after > before * (1 + tolerance) and after - before > 1e-9:
+                regressions.append(f"{result['mode']} {metric}: {before} -> {after}")
+            if not higher_is_worse and after < before * (1 - tolerance):
+                regressions.append(f"{result['mode']} {metric}: {before} -> {after}")
+        if result["errors"] > old["errors"]:
+            regressions.append(f"{result['mode']} errors: {old['errors']} -> {result['errors']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated modes to run.")
+    parser.add_argument("--iterations", type=int, default=3, help="Times each page is processed per mode.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Pages processed at once.")
+    parser.add_argument("--page-latency", type=float, default=0.02, help="Replay server response delay in seconds.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM response delay in seconds.")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="Keep the extraction cache and fetch state enabled.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="Fail if results regress against this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression.")
+    args = parser.parse_args()
+
+    llm_server, llm = start_fake_openai_server(config=FakeOpenAIConfig(args.llm_latency, args.llm_jitter, args.llm_error_rate))
+    page_server, _ = start_replay_server(config=ReplayConfig(args.page_latency))
+    os.environ.update(
+        ENVIRONMENT="local",
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "benchmark"),
+        OPENAI_BASE_URL=f"http://127.0.0.1:{llm_server.server_port}/v1",
+        # Every corpus page is served from one host; politeness limits would measure
+        # the rate limit instead of the pipeline
+        FETCH_RATE_PER_SECOND="0",
+        FETCH_PER_HOST_CONCURRENCY=str(max(args.concurrency, 2)),
+    )
+    if not args.cache:
+        # Every iteration should do the full work, without reusing a recent identical request
+        os.environ.update(EXTRACTION_CACHE_BACKEND="none", FETCH_STATE_BACKEND="none", COALESCE_BACKEND="none")
+
+    # Imported after the environment is set up
+    from app.extract import process_and_extract_tables_single
+    from app.main import app
+    from app.scrape import html_to_csv_tables, scrape_single_url
+
+    base = f"http://127.0.0.1:{page_server.server_port}"
+    pages = []
+    for entry in load_manifest():
+        url = base + replay_path(entry["url"])
+        html = read_page(entry.get("rendered", entry["file"]))
+        pages.append({"url": url, "csv_tables": html_to_csv_tables(url, html)})
+
+    def scrape(page: Dict) -> bool:
+        csv_tables, error = scrape_single_url(page["url"])
+        return error is None
+
+    def extract(page: Dict) -> bool:
+        return process_and_extract_tables_single(page["csv_tables"]) is not None
+
+    def call_app(page: Dict) -> bool:
+        status, _ = call_asgi(app, "POST", "/extract", json.dumps({"url": page["url"]}).encode())
+        return status == 200
+
+    work = {"scrape": scrape, "extract": extract, "app": call_app}
+    results = []
+    for mode in args.modes.split(","):
+        results.append(run_mode(mode, work[mode], pages, args.iterations, args.concurrency, llm))
+
+    print(f"{'mode':<8} {'pages':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'pages/s':>8} {'llm/page':>9} {'rss MB':>7}")
+    for result in results:
+        print(
+            f"{result['mode']:<8} {result['pages']:>6} {result['errors']:>6} {result['p50_ms']:>9} {result['p95_ms']:>9} "
+            f"{result['throughput_pages_per_s']:>8} {result['llm_calls_per_page']:>9} {result['peak_rss_mb']:>7}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/bench_prompt.py
+"""
+Compares the tokens per LLM call of the full and compact prompt styles on the
+recorded corpus: the fixed prompt and schema tokens every call pays, the tokens of
+the table data and the number of calls, for the tables left to the LLM after the
+relevance filter and the rules (or every table with --all-tables). Then sends each page's chunks to the fake OpenAI
+server in both styles and reports the prompt and cached prompt tokens it counts.
+
+Fails if the compact style costs more tokens, loses a table cell, or its schema
+does not parse a response the same as BankResponse.
+
+    python -m benchmarks.bench_prompt [--tokens 2000] [--all-tables]
+"""
+import argparse
+import csv
+import io
+import os
+import re
+from collections import Counter
+from typing import Dict, List
+
+from app.merge import product_fields
+from app.models import BankResponse
+from app.prompt import build_messages, compact_csv_table, fixed_prompt_tokens, response_model, to_bank_response
+from app.relevance import filter_tables
+from app.rules import extract_tables_with_rules
+from app.scrape import html_to_csv_tables
+from app.tokens import count_tokens
+from benchmarks.bench_rules import load_labeled_tables
+from benchmarks.corpus import load_rendered_pages
+from benchmarks.fake_openai_server import DEFAULT_BANK_RESPONSE, start_fake_openai_server
+
+STYLES = ("full", "compact")
+
+def cells(csv_table: str, skip_domain: bool) -> Counter:
+    """
+    Counts a table's non-empty cells with whitespace collapsed.
+    """
+    counts = Counter()
+    for index, row in enumerate(csv.reader(io.StringIO(csv_table, newline=''))):
+        for cell in row[1:] if skip_domain and index == 0 else row:
+            text = re.sub(r'\s+', ' ', cell).strip()
+            if text:
+                counts[text] += 1
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=None, help="Token budget for the table data in each chunk.")
+    parser.add_argument("--all-tables", action="store_true", help="Measure every table, not only those left to the LLM.")
+    args = parser.parse_args()
+
+    server, config = start_fake_openai_server()
+    os.environ.update(
+        ENVIRONMENT="local",
+        OPENAI_API_KEY="benchmark",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{server.server_port}/v1",
+    )
+    # Imported after the environment is set up
+    from app.extract import MAX_CHUNK_TOKENS, MODEL_ID, build_chunks, extract_with_llm
+    from app.metrics import start_trace
+    budget = args.tokens or MAX_CHUNK_TOKENS
+
+    failures = []
+    for source, csv_table, _ in load_labeled_tables():
+        if source != "inline" and cells(compact_csv_table(csv_table), False) != cells(csv_table, True):
+            failures.append(f"compacting {source} changed its cells")
+    for _, _, expected in load_labeled_tables() + [("", "", DEFAULT_BANK_RESPONSE)]:
+        # The labels leave out null fields, which the model responds with
+        data = {"bankRootDomain": "example.com", **expected}
+        for product_list, model in product_fields().items():
+            data[product_list] = [{name: product.get(name) for name in model.model_fields} for product in data.get(product_list) or []]
+        if to_bank_response(response_model("compact").model_validate(data)) != BankResponse.model_validate(data):
+            failures.append("the compact schema parses a response differently")
+
+    fixed = {style: fixed_prompt_tokens(style, MODEL_ID) for style in STYLES}
+    print(f"Fixed tokens per call: full {fixed['full']}, compact {fixed['compact']}; "
+          f"static prefix of the compact style is {fixed['compact']} tokens "
+          f"({'cacheable' if fixed['compact'] >= 1024 else 'below the 1024-token caching minimum'})")
+    print(f"{'page':<55} {'style':<8} {'calls':>5} {'fixed':>7} {'tables':>7} {'total':>7}")
+
+    totals: Dict[str, List[int]] = {style: [0, 0, 0] for style in STYLES}
+    pages = []
+    for page in load_rendered_pages():
+        csv_tables = html_to_csv_tables(page["url"], page["html"])
+        if not args.all_tables:
+            csv_tables, _ = filter_tables(csv_tables)
+            _, csv_tables = extract_tables_with_rules(csv_tables)
+        if not csv_tables:
+            continue
+        pages.append(csv_tables)
+        for style in STYLES:
+            chunks = build_chunks(csv_tables, budget, style)
+            table_tokens = sum(
+                sum(count_tokens(message["content"], MODEL_ID) for message in build_messages(chunk, style))
+                - sum(count_tokens(message["content"], MODEL_ID) for message in build_messages("", style))
+                for chunk in chunks
+            )
+            calls = len(chunks)
+            for index, value in enumerate((calls, calls * fixed[style], table_tokens)):
+                totals[style][index] += value
+            print(f"{page['url']:<55} {style:<8} {calls:>5} {calls * fixed[style]:>7} {table_tokens:>7} "
+                  f"{calls * fixed[style] + table_tokens:>7}")
+
+    for style in STYLES:
+        calls, fixed_tokens, table_tokens = totals[style]
+        print(f"{'total':<55} {style:<8} {calls:>5} {fixed_tokens:>7} {table_tokens:>7} {fixed_tokens + table_tokens:>7}")
+    before, after = (sum(totals[style][1:]) for style in STYLES)
+    print(f"Compact prompts use {after} of {before} tokens ({1 - after / max(before, 1):.0%} fewer)")
+    if after >= before:
+        failures.append(f"the compact style uses {after} tokens, the full style {before}")
+
+    # Prompt and cached tokens as counted by the fake server, which caches prefixes like the real API
+    for style in STYLES:
+        config.prefixes.clear()
+        with start_trace() as trace:
+            for csv_tables in pages:
+                for chunk in build_chunks(csv_tables, budget, style):
+                    extract_with_llm(chunk, style=style)
+        counts = next((timing.counts for timing in trace.breakdown() if timing.stage == "llm"), {})
+        print(f"fake server, {style:<8} prompt tokens {int(counts.get('prompt_tokens', 0)):>7}, "
+              f"cached {int(counts.get('cached_prompt_tokens', 0)):>7}")
+
+    for failure in sorted(set(failures)):
+        print(f"FAIL {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# benchmarks/bench_rules.py
+"""
+Compares the rule-based table extractor with the LLM on the hand-labeled tables in
+fixtures/extraction_labels.json: tables handled, product precision/recall, field
+accuracy and latency per table, for the rules, the LLM and the hybrid that sends
+only the tables the rules are not confident about to the LLM.
+
+By default the LLM is the fake OpenAI server, which measures latency and call counts
+but not accuracy. Pass --live to call the real API (OPENAI_API_KEY must be set).
+
+    python -m benchmarks.bench_rules [--threshold 0.9] [--llm-latency 1.5] [--live] [--verbose]
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.merge import key_fields, product_fields, product_key
+from app.models import BankResponse
+from app.rules import RULE_CONFIDENCE_THRESHOLD, extract_table_with_rules
+from app.scrape import html_to_csv_tables
+from benchmarks.bench_pipeline import percentile
+from benchmarks.corpus import load_manifest, read_page
+from benchmarks.fake_openai_server import FakeOpenAIConfig, start_fake_openai_server
+
+LABELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "extraction_labels.json")
+
+def load_labeled_tables() -> List[Tuple[str, str, Dict]]:
+    """
+    Returns (source, csv_table, expected products by BankResponse list) for each labeled table.
+    """
+    with open(LABELS_PATH) as f:
+        labels = json.load(f)
+
+    urls = {}
+    for entry in load_manifest():
+        urls[entry["file"]] = entry["url"]
+        if "rendered" in entry:
+            urls[entry["rendered"]] = entry["url"]
+
+    pages: Dict[str, List[str]] = {}
+    labeled = []
+    for table in labels["tables"]:
+        if "csv" in table:
+            labeled.append(("inline", table["csv"], table["expected"]))
+            continue
+        if table["file"] not in pages:
+            pages[table["file"]] = html_to_csv_tables(urls[table["file"]], read_page(table["file"]))
+        labeled.append((f"{table['file']}#{table['table']}", pages[table["file"]][table["table"]], table["expected"]))
+    return labeled
+
+def same_value(expected, actual) -> bool:
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)) and not isinstance(expected, bool):
+        return abs(expected - actual) < 1e-6
+    if isinstance(expected, str) and isinstance(actual, str):
+        return " ".join(expected.split()).casefold() == " ".join(actual.split()).casefold()
+    return expected == actual
+
+def score(expected: Dict, response: Optional[BankResponse]) -> Tuple[int, int, int, int, int]:
+    """
+    Matches the extracted products to the expected ones by their merge key.
+
+    Returns:
+        Tuple[int, int, int, int, int]: Expected products, extracted products, matched
+        products, fields compared in the matched products and fields that were correct.
+    """
+    actual = response.model_dump() if response is not None else {}
+    totals = [0, 0, 0, 0, 0]
+    for field, model in product_fields().items():
+        names = key_fields(model)
+        wanted = [{name: product.get(name) for name in model.model_fields} for product in expected.get(field, [])]
+        got = {product_key(product, names): product for product in actual.get(field) or []}
+        totals[0] += len(wanted)
+        totals[1] += len(actual.get(field) or [])
+        for product in wanted:
+            match = got.get(product_key(product, names))
+            if match is None:
+                continue
+            totals[2] += 1
+            totals[3] += len(product)
+            totals[4] += sum(1 for name, value in product.items() if same_value(value, match.get(name)))
+    return tuple(totals)
+
+def summarize(name: str, handled: int, tables: int, scores: List[Tuple], latencies: List[float], accuracy: bool) -> None:
+    expected, extracted, matched, fields, correct = (sum(column) for column in zip(*scores)) if scores else (0,) * 5
+    if accuracy:
+        precision = f"{matched / extracted:.2f}" if extracted else "-"
+        recall = f"{matched / expected:.2f}" if expected else "-"
+        field_accuracy = f"{correct / fields:.3f}" if fields else "-"
+    else:
+        precision = recall = field_accuracy = "n/a"
+    print(
+        f"{name:<8} {handled:>3}/{tables:<3} {precision:>9} {recall:>7} {field_accuracy:>9} "
+        f"{percentile(latencies, 0.5) * 1000:>9.2f} {percentile(latencies, 0.95) * 1000:>9.2f} {sum(latencies) * 1000:>10.1f}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threshold", type=float, default=RULE_CONFIDENCE_THRESHOLD, help="Minimum rule confidence.")
+    parser.add_argument("--live", action="store_true", help="Call the real OpenAI API instead of the fake server.")
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="Fake LLM response delay in seconds.")
+    parser.add_argument("--verbose", action="store_true", help="Print each table's confidence and score.")
+    args = parser.parse_args()
+
+    if not args.live:
+        server, _ = start_fake_openai_server(config=FakeOpenAIConfig(args.llm_latency))
+        os.environ.update(
+            ENVIRONMENT="local",
+            OPENAI_API_KEY="benchmark",
+            OPENAI_BASE_URL=f"http://127.0.0.1:{server.server_port}/v1",
+        )
+    # Imported after the environment is set up
+    from app.extract import build_chunks, extract_with_llm
+    from app.utils import get_openai_client
+
+    # Client setup is not part of the per-table latency
+    get_openai_client()
+
+    labeled = load_labeled_tables()
+    rows = []
+    for source, csv_table, expected in labeled:
+        start = time.perf_counter()
+        rules = extract_table_with_rules(csv_table)
+        rule_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            llm = extract_with_llm(build_chunks([csv_table])[0])
+        except Exception as e:
+            print(f"{source}: LLM extraction failed: {e}")
+            llm = None
+        llm_seconds = time.perf_counter() - start
+        rows.append((source, expected, rules, rule_seconds, llm, llm_seconds))
+
+        if args.verbose:
+            print(f"{source:<32} confidence {rules.confidence:.2f} rules {score(expected, rules.response)} "
+                  f"llm {score(expected, llm)} {rules.reason or ''}")
+
+    confident = [row for row in rows if row[2].response is not None and row[2].confidence >= args.threshold]
+    fallback = [row for row in rows if row not in confident]
+
+    print(f"{len(rows)} labeled tables, confidence threshold {args.threshold}"
+          f"{'' if args.live else f', fake LLM with {args.llm_latency}s latency'}")
+    print(f"{'path':<8} {'tables':>7} {'precision':>9} {'recall':>7} {'fields':>9} {'p50 ms':>9} {'p95 ms':>9} {'total ms':>10}")
+    summarize("rules", len(confident), len(rows), [score(row[1], row[2].response) for row in confident],
+              [row[3] for row in rows], accuracy=True)
+    summarize("llm", len(rows), len(rows), [score(row[1], row[4]) for row in rows],
+              [row[5] for row in rows], accuracy=args.live)
+    summarize("hybrid", len(rows), len(rows),
+              [score(row[1], row[2].response) for row in confident] + [score(row[1], row[4]) for row in fallback],
+              [row[3] for row in confident] + [row[3] + row[5] for row in fallback], accuracy=args.live)
+    print(f"LLM calls: {len(rows)} without rules, {len(fallback)} with rules")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/cold_start.py
+"""
+Cold start profile of the Lambda handler. Imports app.main in fresh interpreters
+with -X importtime, reports the median import time and the slowest modules, and
+fails if the median is over budget or if a heavy dependency is imported at startup
+instead of on the code path that uses it. tests/test_cold_start.py enforces the same
+budget under pytest.
+
+    python -m benchmarks.cold_start [--runs 5] [--budget-ms 1200]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Maximum median import time of app.main, in milliseconds
+COLD_START_BUDGET_MS = 1200
+
+# Dependencies that must only be imported when a request needs them
+LAZY_MODULES = ("selenium", "bs4", "boto3", "botocore", "openai", "dotenv", "tiktoken", "lxml")
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)')
+
+PROBE = (
+    "import sys, app.main; "
+    "print(','.join(sorted({name.split('.')[0] for name in sys.modules})))"
+)
+
+def profile_once() -> Tuple[int, Dict[str, int], List[str]]:
+    """
+    Imports app.main in a new interpreter.
+
+    Returns:
+        Tuple[int, Dict[str, int], List[str]]: The cumulative import time of app.main in
+        microseconds, the cumulative time of every top-level module, and the names of the
+        top-level packages loaded.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=root, capture_output=True, text=True, check=True
+    )
+    total = 0
+    modules: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, name = int(match.group(2)), match.group(3)
+        if name == "app.main":
+            total = cumulative
+        # Third-party packages; standard library modules are loaded either way
+        if "." not in name and name != "app" and name not in sys.stdlib_module_names:
+            modules[name] = max(modules.get(name, 0), cumulative)
+    return total, modules, result.stdout.strip().split(",")
+
+def profile(runs: int) -> Tuple[float, Dict[str, List[int]], List[str]]:
+    """
+    Imports app.main in `runs` new interpreters.
+
+    Returns:
+        Tuple[float, Dict[str, List[int]], List[str]]: The median import time of app.main in
+        milliseconds, the cumulative times of each top-level module, and the names of the
+        top-level packages loaded.
+    """
+    totals = []
+    modules: Dict[str, List[int]] = {}
+    loaded: List[str] = []
+    for _ in range(runs):
+        total, run_modules, loaded = profile_once()
+        totals.append(total)
+        for name, cumulative in run_modules.items():
+            modules.setdefault(name, []).append(cumulative)
+    return statistics.median(totals) / 1000, modules, loaded
+
+def eager_modules(loaded: List[str]) -> List[str]:
+    """
+    Returns the LAZY_MODULES among the loaded packages.
+    """
+    return [name for name in LAZY_MODULES if name in loaded]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to profile.")
+    parser.add_argument("--budget-ms", type=float, default=COLD_START_BUDGET_MS, help="Maximum median import time of app.main.")
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to show.")
+    args = parser.parse_args()
+
+    median_ms, modules, loaded = profile(args.runs)
+    print(f"import app.main: median {median_ms:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print("Slowest third-party packages imported at startup:")
+    slowest = sorted(((statistics.median(times) / 1000, name) for name, times in modules.items()), reverse=True)
+    for ms, name in slowest[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failures = []
+    eager = eager_modules(loaded)
+    if eager:
+        failures.append(f"Imported at startup instead of lazily: {', '.join(eager)}")
+    if median_ms > args.budget_ms:
+        failures.append(f"Cold start import time {median_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# benchmarks/corpus.py
+"""
+Recorded bank rate pages used by the benchmarks. manifest.json lists each page's
+original URL, whether it is rendered statically or with JavaScript, and for
+JavaScript pages a snapshot of the rendered DOM.
+"""
+import json
+import os
+from typing import Dict, List
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+def load_manifest() -> List[Dict]:
+    with open(os.path.join(CORPUS_DIR, "manifest.json")) as f:
+        return json.load(f)
+
+def read_page(file_name: str) -> bytes:
+    with open(os.path.join(CORPUS_DIR, file_name), "rb") as f:
+        return f.read()
+
+def load_rendered_pages() -> List[Dict]:
+    """
+    Returns each corpus page as a dict with 'url' and 'html', using the rendered
+    snapshot for JavaScript pages so the tables are present.
+    """
+    pages = []
+    for entry in load_manifest():
+        html = read_page(entry.get("rendered", entry["file"]))
+        pages.append({"url": entry["url"], "html": html, "rendering": entry["rendering"]})
+    return pages
@@ -0,0 +1,77 @@
+# benchmarks/eval_relevance.py
+"""
+Evaluates the pre-LLM table relevance filter against labeled fixtures and sweeps
+the threshold, reporting precision, recall and tokens skipped.
+
+    python -m benchmarks.eval_relevance [--threshold 0.3]
+"""
+import argparse
+import json
+import os
+
+from app.relevance import TABLE_RELEVANCE_THRESHOLD, score_table
+from app.scrape import html_to_csv_tables
+from app.tokens import count_tokens
+from benchmarks.corpus import load_manifest, read_page
+
+LABELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "relevance_labels.json")
+
+def load_labeled_tables():
+    with open(LABELS_PATH) as f:
+        labels = json.load(f)
+
+    urls = {}
+    for entry in load_manifest():
+        urls[entry["file"]] = entry["url"]
+        if "rendered" in entry:
+            urls[entry["rendered"]] = entry["url"]
+
+    labeled = []
+    for page in labels["pages"]:
+        csv_tables = html_to_csv_tables(urls[page["file"]], read_page(page["file"]))
+        if len(csv_tables) != len(page["relevant"]):
+            raise ValueError(f"{page['file']} has {len(csv_tables)} tables but {len(page['relevant'])} labels")
+        labeled.extend(zip(csv_tables, page["relevant"], [page["file"]] * len(csv_tables)))
+    labeled.extend((table["csv"], table["relevant"], "inline") for table in labels["tables"])
+    return labeled
+
+def evaluate(scored, threshold):
+    tp = sum(1 for score, relevant, _ in scored if relevant and score >= threshold)
+    fp = sum(1 for score, relevant, _ in scored if not relevant and score >= threshold)
+    fn = sum(1 for score, relevant, _ in scored if relevant and score < threshold)
+    skipped_tokens = sum(tokens for score, _, tokens in scored if score < threshold)
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return precision, recall, skipped_tokens
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threshold", type=float, default=TABLE_RELEVANCE_THRESHOLD)
+    parser.add_argument("--verbose", action="store_true", help="Print the score of every table.")
+    args = parser.parse_args()
+
+    labeled = load_labeled_tables()
+    scored = [(score_table(csv_table), relevant, count_tokens(csv_table)) for csv_table, relevant, _ in labeled]
+    total_tokens = sum(tokens for _, _, tokens in scored)
+
+    if args.verbose:
+        for (csv_table, relevant, source), (score, _, _) in zip(labeled, scored):
+            first_row = csv_table.splitlines()[0][:70]
+            print(f"{score:.2f} {'relevant' if relevant else 'skip    '} {source:<30} {first_row}")
+        print()
+
+    print(f"{len(scored)} labeled tables, {total_tokens} tokens")
+    print(f"{'threshold':>9} {'precision':>9} {'recall':>7} {'tokens skipped':>15}")
+    for step in range(0, 11):
+        threshold = step / 10
+        precision, recall, skipped_tokens = evaluate(scored, threshold)
+        marker = " <- configured" if abs(threshold - args.threshold) < 1e-9 else ""
+        print(f"{threshold:>9.1f} {precision:>9.2f} {recall:>7.2f} {skipped_tokens:>15}{marker}")
+
+    precision, recall, _ = evaluate(scored, args.threshold)
+    if recall < 1.0:
+        print(f"Threshold {args.threshold} drops labeled rate tables (recall {recall:.2f})")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
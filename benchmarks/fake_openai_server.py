@@ -0,0 +1,183 @@
+# benchmarks/fake_openai_server.py
+"""
+A fake OpenAI-compatible chat completions server for exercising the extraction
+pipeline without calling (or paying for) the real API.
+
+Run it and point the app at it with OPENAI_BASE_URL:
+
+    python -m benchmarks.fake_openai_server --port 8001 --latency 0.5 --error-rate 0.1
+    ENVIRONMENT=local OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8001/v1 uvicorn app.main:app
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+DEFAULT_BANK_RESPONSE: Dict = {
+    "bankRootDomain": "example.com",
+    "checkingAccounts": [],
+    "savingsAccounts": [
+        {
+            "name": "Statement Savings",
+            "interestRate": 0.25,
+            "annualPercentageYield": 0.25,
+            "minimumBalanceToObtainAPY": 100.0,
+            "minimumBalanceToOpen": 25.0,
+            "minimumDailyBalance": None,
+            "dividendRate": None,
+            "dividendFrequency": None
+        }
+    ],
+    "moneyMarketAccounts": [],
+    "certificatesOfDeposit": [
+        {
+            "term": "12 months",
+            "interestRate": 4.4,
+            "annualPercentageYield": 4.5,
+            "minimumBalanceToObtainAPY": 1000.0,
+            "minimumBalanceToOpen": 1000.0,
+            "minimumDailyBalance": None
+        }
+    ],
+    "individualRetirementAccounts": [],
+    "loans": [],
+    "creditCards": [],
+    "fees": []
+}
+
+class FakeOpenAIConfig:
+    """
+    Mutable settings shared by all request handlers of a fake server.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        bank_response: Optional[Dict] = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bank_response = bank_response or DEFAULT_BANK_RESPONSE
+        self.calls = 0
+        self.errors = 0
+        # Prompt prefixes seen so far, to report cached tokens like the real API
+        self.prefixes = set()
+        self.lock = threading.Lock()
+
+def make_handler(config: FakeOpenAIConfig):
+    class FakeOpenAIHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body: Dict) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+
+            if not self.path.endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "not_found"}})
+                return
+
+            with config.lock:
+                config.calls += 1
+
+            time.sleep(max(0.0, config.latency + random.uniform(-config.jitter, config.jitter)))
+
+            if random.random() < config.error_rate:
+                with config.lock:
+                    config.errors += 1
+                status = random.choice([429, 500, 503])
+                self._send_json(status, {"error": {"message": "Injected failure", "type": "server_error", "code": status}})
+                return
+
+            # The schema and every message but the last form the prefix the real API caches,
+            # once it is at least 1024 tokens, in blocks of 128 tokens
+            messages = request.get("messages", [])
+            prefix = json.dumps(request.get("response_format")) + "".join(
+                str(message.get("content", "")) for message in messages[:-1]
+            )
+            prompt_tokens = (len(prefix) + sum(len(str(message.get("content", ""))) for message in messages[-1:])) // 4
+            with config.lock:
+                seen = prefix in config.prefixes
+                config.prefixes.add(prefix)
+            cached_tokens = (len(prefix) // 4) // 128 * 128 if seen and len(prefix) // 4 >= 1024 else 0
+            content = json.dumps(config.bank_response)
+            completion_tokens = len(content) // 4
+            self._send_json(200, {
+                "id": f"chatcmpl-fake-{config.calls}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content, "refusal": None},
+                        "logprobs": None,
+                        "finish_reason": "stop"
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens}
+                }
+            })
+
+    return FakeOpenAIHandler
+
+def start_fake_openai_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    config: Optional[FakeOpenAIConfig] = None
+) -> Tuple[ThreadingHTTPServer, FakeOpenAIConfig]:
+    """
+    Starts a fake OpenAI server on a background thread.
+
+    Args:
+        host (str): The host to bind to.
+        port (int): The port to bind to, or 0 for any free port.
+        config (Optional[FakeOpenAIConfig]): The server settings.
+
+    Returns:
+        Tuple[ThreadingHTTPServer, FakeOpenAIConfig]: The running server and its settings.
+        The base URL is http://{host}:{server.server_port}/v1.
+    """
+    config = config or FakeOpenAIConfig()
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, config
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before responding.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to the latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 429/5xx.")
+    parser.add_argument("--response-file", help="JSON file with the BankResponse to return.")
+    args = parser.parse_args()
+
+    bank_response = None
+    if args.response_file:
+        with open(args.response_file) as f:
+            bank_response = json.load(f)
+
+    config = FakeOpenAIConfig(args.latency, args.jitter, args.error_rate, bank_response)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"Fake OpenAI server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
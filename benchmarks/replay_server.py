@@ -0,0 +1,114 @@
+# benchmarks/replay_server.py
+"""
+A local HTTP server that replays the recorded corpus pages, so the scraper can be
+exercised without hitting live bank sites.
+
+Each page is served at /<original host><original path>. JavaScript-rendered pages
+are served from their rendered snapshot, standing in for the headless browser.
+
+    python -m benchmarks.replay_server --port 8002 --latency 0.05
+"""
+import argparse
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from benchmarks.corpus import load_manifest, read_page
+
+def replay_path(url: str) -> str:
+    """
+    Returns the path a corpus page with the given original URL is served at.
+    """
+    parsed = urlparse(url)
+    return f"/{parsed.netloc}{parsed.path or '/'}"
+
+class ReplayConfig:
+    """
+    Mutable settings shared by all request handlers of a replay server.
+    """
+
+    def __init__(self, latency: float = 0.0, etags: bool = True):
+        self.latency = latency
+        self.etags = etags
+        # path -> page bytes
+        self.pages: Dict[str, bytes] = {}
+        for entry in load_manifest():
+            self.pages[replay_path(entry["url"])] = read_page(entry.get("rendered", entry["file"]))
+        self.requests = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+def make_handler(config: ReplayConfig):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            with config.lock:
+                config.requests += 1
+            time.sleep(config.latency)
+
+            page = config.pages.get(urlparse(self.path).path)
+            if page is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            etag = '"%s"' % hashlib.sha256(page).hexdigest()[:32]
+            if config.etags and self.headers.get("If-None-Match") == etag:
+                with config.lock:
+                    config.not_modified += 1
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            if config.etags:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(page)
+
+    return ReplayHandler
+
+def start_replay_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    config: Optional[ReplayConfig] = None
+) -> Tuple[ThreadingHTTPServer, ReplayConfig]:
+    """
+    Starts a replay server on a background thread.
+
+    Args:
+        host (str): The host to bind to.
+        port (int): The port to bind to, or 0 for any free port.
+        config (Optional[ReplayConfig]): The server settings.
+
+    Returns:
+        Tuple[ThreadingHTTPServer, ReplayConfig]: The running server and its settings.
+        A corpus page is at http://{host}:{server.server_port}{replay_path(url)}.
+    """
+    config = config or ReplayConfig()
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, config
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay the recorded corpus pages over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before responding.")
+    parser.add_argument("--no-etags", action="store_true", help="Do not send ETags or answer 304.")
+    args = parser.parse_args()
+
+    config = ReplayConfig(args.latency, etags=not args.no_etags)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    for path in config.pages:
+        print(f"http://{args.host}:{args.port}{path}")
+    server.serve_forever()
@@ -0,0 +1,13 @@
+# tests/test_cold_start.py
+"""
+The Lambda cold start budget: importing app.main in a fresh interpreter must stay
+under COLD_START_BUDGET_MS and must not load the heavy dependencies.
+"""
+from benchmarks.cold_start import COLD_START_BUDGET_MS, eager_modules, profile
+
+def test_cold_start_is_within_budget():
+    median_ms, _, loaded = profile(runs=3)
+    assert median_ms <= COLD_START_BUDGET_MS, (
+        f"import app.main took {median_ms:.0f} ms, over the {COLD_START_BUDGET_MS} ms budget"
+    )
+    assert not eager_modules(loaded), f"imported at startup instead of lazily: {eager_modules(loaded)}"
@@ -0,0 +1,119 @@
+# tests/test_merge.py
+"""
+BankResponse merge: hand-written chunk results compared with their expected merges,
+and seeded random chunk results checked for the merge properties:
+- merging incrementally gives the same result as merging all at once
+- merging the results twice gives the same result as merging them once
+- how the products are split across chunks does not change the result
+"""
+import random
+from typing import Any, Dict, List, Tuple, Type
+
+import pytest
+from pydantic import BaseModel
+
+from app.merge import BankResponseMerger, merge_bank_responses
+from app.models import BankResponse, CertificateOfDepositResponse, FeeResponse, LoanResponse, SavingsAccountResponse
+from benchmarks.bench_merge import random_response, split
+
+def product(model: Type[BaseModel], **values: Any) -> BaseModel:
+    """
+    Builds a product with the fields not given set to null.
+    """
+    return model(**{name: values.get(name) for name in model.model_fields})
+
+def cd(term: str, apy: float, **values: Any) -> CertificateOfDepositResponse:
+    return product(CertificateOfDepositResponse, term=term, annualPercentageYield=apy, **values)
+
+# (description, chunks as {product list: products}, expected merge as {product list: products})
+MergeCase = Tuple[str, List[Dict[str, List[BaseModel]]], Dict[str, List[BaseModel]]]
+
+CASES: List[MergeCase] = [
+    (
+        "CD tiers with the same term and APY but different minimum balances are kept apart",
+        [{"certificatesOfDeposit": [cd("12 Months", 4.5, minimumBalanceToOpen=500.0), cd("12 Months", 4.5, minimumBalanceToOpen=10000.0)]}],
+        {"certificatesOfDeposit": [cd("12 Months", 4.5, minimumBalanceToOpen=500.0), cd("12 Months", 4.5, minimumBalanceToOpen=10000.0)]},
+    ),
+    (
+        "tiers split across chunks are kept apart, and a copy without a balance fills in the first tier",
+        [
+            {"certificatesOfDeposit": [cd("12 Months", 4.5, minimumBalanceToObtainAPY=1000.0)]},
+            {"certificatesOfDeposit": [cd("12 months", 4.5, minimumBalanceToObtainAPY=25000.0),
+                                       cd(" 12  MONTHS ", 4.5, interestRate=4.4)]},
+        ],
+        {"certificatesOfDeposit": [cd("12 Months", 4.5, minimumBalanceToObtainAPY=1000.0, interestRate=4.4),
+                                   cd("12 months", 4.5, minimumBalanceToObtainAPY=25000.0)]},
+    ),
+    (
+        "a copy with a tier the kept CD leaves null is another tier, not a fill-in",
+        [{"certificatesOfDeposit": [cd("24 Months", 3.75), cd("24 Months", 3.75, minimumBalanceToOpen=1000.0, interestRate=3.7)]}],
+        {"certificatesOfDeposit": [cd("24 Months", 3.75), cd("24 Months", 3.75, minimumBalanceToOpen=1000.0, interestRate=3.7)]},
+    ),
+    (
+        "the same CD from two chunks is kept once, its first copy filled in by the second",
+        [
+            {"certificatesOfDeposit": [cd("6 Months", 4.0, minimumBalanceToOpen=500.0), cd("18 Months", 4.25)]},
+            {"certificatesOfDeposit": [cd("6 months", 4.0, interestRate=3.9, minimumBalanceToOpen=500.0), cd("18 Months", 4.3)]},
+        ],
+        {"certificatesOfDeposit": [cd("6 Months", 4.0, interestRate=3.9, minimumBalanceToOpen=500.0),
+                                   cd("18 Months", 4.25), cd("18 Months", 4.3)]},
+    ),
+    (
+        "a loan term of 60 matches one of \"60\", and a different APR is another product",
+        [
+            {"loans": [product(LoanResponse, name="New Auto", term=60, annualPercentageRate=5.49)]},
+            {"loans": [product(LoanResponse, name="new auto", term="60", annualPercentageRate=5.49, maximumLoanAmount=75000.0),
+                       product(LoanResponse, name="New Auto", term=72, annualPercentageRate=5.99)]},
+        ],
+        {"loans": [product(LoanResponse, name="New Auto", term=60, annualPercentageRate=5.49, maximumLoanAmount=75000.0),
+                   product(LoanResponse, name="New Auto", term=72, annualPercentageRate=5.99)]},
+    ),
+    (
+        "fees with the same name but different amounts are kept apart, in first-seen order",
+        [
+            {"fees": [product(FeeResponse, name="Wire Transfer", feeAmount=25.0, feeUnit="USD"),
+                      product(FeeResponse, name="Overdraft", feeAmount=30.0, feeUnit="USD")]},
+            {"fees": [product(FeeResponse, name="Wire Transfer", feeAmount=45.0, feeUnit="USD"),
+                      product(FeeResponse, name="WIRE TRANSFER", feeAmount=25.0, feeUnit="usd", oneTime=True)]},
+        ],
+        {"fees": [product(FeeResponse, name="Wire Transfer", feeAmount=25.0, feeUnit="USD", oneTime=True),
+                  product(FeeResponse, name="Overdraft", feeAmount=30.0, feeUnit="USD"),
+                  product(FeeResponse, name="Wire Transfer", feeAmount=45.0, feeUnit="USD")]},
+    ),
+    (
+        "savings tiers by minimum daily balance are kept apart",
+        [{"savingsAccounts": [product(SavingsAccountResponse, name="Money Builder", annualPercentageYield=0.5, minimumDailyBalance=0.0),
+                              product(SavingsAccountResponse, name="Money Builder", annualPercentageYield=0.5, minimumDailyBalance=2500.0),
+                              product(SavingsAccountResponse, name="Money Builder", annualPercentageYield=0.5, minimumDailyBalance=2500.0)]}],
+        {"savingsAccounts": [product(SavingsAccountResponse, name="Money Builder", annualPercentageYield=0.5, minimumDailyBalance=0.0),
+                             product(SavingsAccountResponse, name="Money Builder", annualPercentageYield=0.5, minimumDailyBalance=2500.0)]},
+    ),
+]
+
+@pytest.mark.parametrize("description, chunks, expected", CASES, ids=[case[0] for case in CASES])
+def test_merge_matches_the_expected_merge(description, chunks, expected):
+    merged = merge_bank_responses([BankResponse(bankRootDomain="example.com", **chunk) for chunk in chunks])
+    assert merged == BankResponse(bankRootDomain="example.com", **expected)
+
+def test_merge_keeps_the_first_bank_root_domain():
+    merged = merge_bank_responses([BankResponse(bankRootDomain=""), BankResponse(bankRootDomain="www.example.com")])
+    assert merged.bankRootDomain == "example.com"
+
+@pytest.fixture(params=range(200), ids=lambda seed: f"seed{seed}")
+def rng(request) -> random.Random:
+    return random.Random(request.param)
+
+def test_merge_properties(rng: random.Random):
+    whole = random_response(rng, rng.randint(0, 60))
+    chunks = split(rng, whole, rng.randint(1, 6))
+    dumped = merge_bank_responses(chunks).model_dump()
+
+    incremental = BankResponseMerger()
+    for chunk in chunks:
+        incremental.add(chunk)
+        incremental.result()
+    assert incremental.result().model_dump() == dumped, "incremental merge differs from batch merge"
+    assert merge_bank_responses(chunks + chunks).model_dump() == dumped, "merge is not idempotent"
+    assert merge_bank_responses(split(rng, whole, rng.randint(1, 6))).model_dump() == dumped, \
+        "result depends on how products are split across chunks"
+    assert merge_bank_responses([whole]).model_dump() == dumped, "merging one response differs from merging its chunks"